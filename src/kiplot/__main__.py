@@ -1,62 +1,476 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import json
 import logging
 import os
 import sys
 
-from . import kiplot
+# plotting modules (which import pcbnew) are only imported when needed,
+# so --help and config checks are fast and don't need KiCad
+from . import cache
 from . import config_reader
+from . import error
+from . import pcb_reader
+from . import timing
 
 
-def main():
+EXIT_BAD_ARGS = 1
+EXIT_BAD_CONFIG = 2
+EXIT_FAILED = 3
+# kiplot diff: the outputs differ
+EXIT_DIFFERENT = 4
+
+
+def _add_cache_args(parser):
+
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Plot all outputs, even if they are up to date '
+                        'in the output directory')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always plot, don\'t use or fill the caches of '
+                        'plotted outputs and parsed configs')
+    parser.add_argument('--cache-dir', default=cache.default_cache_dir(),
+                        help='The cache directory (default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='The size limit of the cache of plotted '
+                        'outputs, in MB (default: %(default)s). The caches '
+                        'of configs, zone fills and previews are limited by '
+                        'their number of entries instead')
+
+
+def _get_output_cache(args):
+
+    if args.no_cache:
+        return None
+
+    return cache.OutputCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def _get_config_cache(args):
+
+    if args.no_cache:
+        return None
+
+    return cache.ConfigCache(args.cache_dir)
+
+
+def _set_up_logging(args):
+
+    log_level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(level=log_level)
+
+
+def _report_profile(args):
+
+    sys.stdout.write(timing.profiler.format_summary() + '\n')
+
+    if args.profile_out:
+        with open(args.profile_out, 'w') as f:
+            if args.profile_format == 'chrome':
+                timing.profiler.write_chrome_trace(f)
+            else:
+                timing.profiler.write_json(f)
+
+
+def serve_main(argv):
+    """
+    Run a plot server
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='kiplot serve',
+        description='Serve plot jobs from a Unix domain socket')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show debugging information')
+    parser.add_argument('-s', '--socket', required=True,
+                        help='The socket to listen on')
+    parser.add_argument('--max-boards', type=int, default=8,
+                        help='The number of boards to keep loaded '
+                        '(default: %(default)s)')
+    _add_cache_args(parser)
+
+    args = parser.parse_args(argv)
+
+    _set_up_logging(args)
+
+    from . import server
+
+    try:
+        server.remove_stale_socket(args.socket)
+    except server.ServerError as e:
+        logging.error(e)
+        sys.exit(EXIT_BAD_ARGS)
+
+    srv = server.PlotServer(args.socket, args.max_boards)
+    srv.plotter_options = {
+        'cache': _get_output_cache(args),
+        'incremental': not args.force,
+    }
+
+    logging.info("Serving plot jobs on {}".format(args.socket))
+    srv.serve()
 
-    EXIT_BAD_ARGS = 1
-    EXIT_BAD_CONFIG = 2
+
+def client_main(argv):
+    """
+    Send a plot job to a plot server
+    """
 
     parser = argparse.ArgumentParser(
-        description='Command-line Plotting for KiCad')
+        prog='kiplot client',
+        description='Send a plot job to a KiPlot server')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='show debugging information')
-    parser.add_argument('-b', '--board-file', required=True,
+    parser.add_argument('-s', '--socket', required=True,
+                        help='The socket the server listens on')
+    parser.add_argument('-b', '--board-file',
                         help='The PCB .kicad-pcb board file')
+    parser.add_argument('-c', '--plot-config',
+                        help='The plotting config file to use')
+    parser.add_argument('-d', '--out-dir', default='.',
+                        help='The output directory (cwd if not given)')
+    parser.add_argument('--stop', action='store_true',
+                        help='Stop the server')
+
+    args = parser.parse_args(argv)
+
+    _set_up_logging(args)
+
+    if args.stop:
+        request = {'command': 'shutdown'}
+    elif args.board_file and args.plot_config:
+        # the server has its own working dir
+        request = {
+            'command': 'plot',
+            'board': os.path.abspath(args.board_file),
+            'config': os.path.abspath(args.plot_config),
+            'outdir': os.path.abspath(args.out_dir),
+        }
+    else:
+        logging.error("Need a board and a config to plot")
+        sys.exit(EXIT_BAD_ARGS)
+
+    from . import client
+
+    try:
+        response = client.send_request(args.socket, request)
+    except client.ClientError as e:
+        logging.error(e)
+        sys.exit(EXIT_FAILED)
+
+    if not response.get('ok'):
+        logging.error(response.get('error'))
+        sys.exit(EXIT_FAILED)
+
+
+def check_config_main(argv):
+    """
+    Check plot configs are valid, without plotting
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='kiplot check-config',
+        description='Check KiPlot config files are valid')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show debugging information')
+    parser.add_argument('-b', '--board-file',
+                        help='Also check the configs against this PCB '
+                        '.kicad_pcb board file (without loading it into '
+                        'pcbnew)')
+    parser.add_argument('plot_configs', nargs='+', metavar='PLOT_CONFIG',
+                        help='The plotting config file(s) to check')
+
+    args = parser.parse_args(argv)
+
+    _set_up_logging(args)
+
+    board_info = None
+
+    if args.board_file:
+        try:
+            board_info = pcb_reader.read_board_info(args.board_file)
+        except pcb_reader.PcbReadError as e:
+            logging.error(e)
+            sys.exit(EXIT_FAILED)
+
+        logging.debug("{}: {} copper layers".format(
+            args.board_file, board_info.copper_layers))
+
+    bad = False
+
+    for cfg_file in args.plot_configs:
+
+        errs = _check_config(cfg_file, board_info)
+
+        if errs:
+            logging.error("{}: invalid config:\n{}".format(
+                cfg_file, "\n".join(errs)))
+            bad = True
+        else:
+            logging.debug("{}: OK".format(cfg_file))
+
+    if bad:
+        sys.exit(EXIT_BAD_CONFIG)
+
+
+def _check_config(cfg_file, board_info=None):
+    """
+    :param board_info: the pcb_reader.BoardInfo of a board to check the
+        config against, if any
+    :return: list of errors in a config file
+    """
+
+    try:
+        cfg = config_reader.read_file(cfg_file)
+    except config_reader.YamlError as e:
+        return e.errors
+    except (IOError, error.KiPlotError) as e:
+        return [str(e)]
+
+    if board_info:
+        return cfg.check_inner_layers(board_info.copper_layers)
+
+    return []
+
+
+def _plan(args, cfg, brd_files):
+    """
+    Plan the plot of the boards, without plotting (or pcbnew)
+    """
+
+    from . import batch
+    from . import plan
+
+    board_plans = []
+
+    for brd_file in brd_files:
+
+        if len(brd_files) == 1:
+            brd_cfg = cfg
+        else:
+            brd_cfg = batch.BatchPlotter(cfg).board_config(brd_file)
+
+        try:
+            plans = plan.plan_board(brd_cfg, brd_file)
+        except plan.PlanError as e:
+            logging.error(e)
+            sys.exit(EXIT_BAD_CONFIG)
+
+        sys.stdout.write(plan.format_plan(brd_file, brd_cfg.outdir, plans) +
+                         '\n')
+
+        board_plans.append({
+            'board': brd_file,
+            'outdir': brd_cfg.outdir,
+            'outputs': [p.to_dict() for p in plans],
+        })
+
+    if args.plan_out:
+        with open(args.plan_out, 'w') as f:
+            json.dump({'boards': board_plans}, f, indent=1)
+
+
+def diff_main(argv):
+    """
+    Compare the fab outputs of two plot runs
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='kiplot diff',
+        description='Compare the Gerber and Excellon files of two output '
+        'dirs by what they draw, ignoring headers and timestamps')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show debugging information')
+    parser.add_argument('--tolerance', type=float, default=0.001,
+                        help='Coordinates closer than this (in mm) are the '
+                        'same (default: %(default)s)')
+    parser.add_argument('--max-move', type=float, default=1.0,
+                        help='Report primitives which moved up to this far '
+                        '(in mm) as moved, not removed and added (default: '
+                        '%(default)s)')
+    parser.add_argument('--max-changes', type=int, default=20,
+                        help='The changes to list per file (default: '
+                        '%(default)s)')
+    parser.add_argument('old_dir', metavar='OLD_DIR',
+                        help='The output dir of the old run')
+    parser.add_argument('new_dir', metavar='NEW_DIR',
+                        help='The output dir of the new run')
+
+    args = parser.parse_args(argv)
+
+    _set_up_logging(args)
+
+    from . import diff
+
+    if args.tolerance <= 0:
+        logging.error("The tolerance must be positive: {}"
+                      .format(args.tolerance))
+        sys.exit(EXIT_BAD_ARGS)
+
+    try:
+        diffs = diff.diff_dirs(args.old_dir, args.new_dir, args.tolerance,
+                               args.max_move)
+    except diff.DiffError as e:
+        logging.error(e)
+        sys.exit(EXIT_BAD_ARGS)
+
+    sys.stdout.write(diff.format_diff(diffs, args.max_changes) + '\n')
+
+    if any(fd.status == 'error' for fd in diffs):
+        sys.exit(EXIT_FAILED)
+
+    if any(fd.status != 'same' for fd in diffs):
+        sys.exit(EXIT_DIFFERENT)
+
+
+# sub-commands, given as the first argument
+COMMANDS = {
+    'serve': serve_main,
+    'client': client_main,
+    'check-config': check_config_main,
+    'diff': diff_main,
+}
+
+
+def main():
+
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+    else:
+        plot_main(sys.argv[1:])
+
+
+def plot_main(argv):
+    """
+    Plot boards
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Command-line Plotting for KiCad',
+        epilog='Other commands: {} (see kiplot COMMAND -h)'
+        .format(', '.join(sorted(COMMANDS))))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show debugging information')
+    parser.add_argument('-b', '--board-file', nargs='+', default=[],
+                        help='The PCB .kicad-pcb board file(s), or glob '
+                        'patterns matching them')
+    parser.add_argument('-B', '--board-list',
+                        help='A file listing boards to plot, one per line')
     parser.add_argument('-c', '--plot-config', required=True,
                         help='The plotting config file to use')
     parser.add_argument('-d', '--out-dir', default='.',
                         help='The output directory (cwd if not given)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes to plot outputs '
+                        '(or boards, if more than one) with (default 1: '
+                        'plot in-process)')
+    parser.add_argument('--layer-jobs', type=int, default=1,
+                        help='Split the layers of each layer output over '
+                        'this many worker processes (one board only)')
+    _add_cache_args(parser)
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each phase of the run and print a '
+                        'summary')
+    parser.add_argument('--profile-out',
+                        help='Write the timings to this file (implies '
+                        '--profile)')
+    parser.add_argument('--profile-format', choices=['json', 'chrome'],
+                        default='json',
+                        help='The format of the timings file: a list of '
+                        'spans, or Chrome trace events (default: '
+                        '%(default)s)')
+    parser.add_argument('--scratch-dir',
+                        help='Plot into this (fast, local) dir, and move the '
+                        'files to the output dir in the background')
+    parser.add_argument('--plan', action='store_true',
+                        help='Don\'t plot, list the files each output would '
+                        'write and how long it is expected to take')
+    parser.add_argument('--plan-out',
+                        help='Write the plan to this file, as JSON (implies '
+                        '--plan)')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    log_level = logging.DEBUG if args.verbose else logging.INFO
-    logging.basicConfig(level=log_level)
+    _set_up_logging(args)
+
+    from . import batch
+
+    timing.profiler.enabled = args.profile or bool(args.profile_out)
+
+    try:
+        brd_files = batch.expand_board_args(args.board_file)
+
+        if args.board_list:
+            with open(args.board_list) as bl_file:
+                brd_files += batch.read_board_list(bl_file)
+    except (IOError, batch.BatchError) as e:
+        logging.error(e)
+        sys.exit(EXIT_BAD_ARGS)
 
-    if not os.path.isfile(args.board_file):
-        logging.error("Board file not found: {}".format(args.board_file))
+    if not brd_files:
+        logging.error("Need at least one board file")
+        sys.exit(EXIT_BAD_ARGS)
+
+    for brd_file in brd_files:
+        if not os.path.isfile(brd_file):
+            logging.error("Board file not found: {}".format(brd_file))
+            sys.exit(EXIT_BAD_ARGS)
 
     if not os.path.isfile(args.plot_config):
         logging.error("Plot config file not found: {}"
                       .format(args.plot_config))
         sys.exit(EXIT_BAD_ARGS)
 
-    cr = config_reader.CfgYamlReader()
+    if args.jobs < 1 or args.layer_jobs < 1:
+        logging.error("Need at least one job: {}".format(
+            min(args.jobs, args.layer_jobs)))
+        sys.exit(EXIT_BAD_ARGS)
 
-    with open(args.plot_config) as cf_file:
-        cfg = cr.read(cf_file)
+    if args.layer_jobs > 1 and len(brd_files) > 1:
+        logging.warning("--layer-jobs is ignored when plotting many boards")
+
+    try:
+        with timing.span('read config'):
+            cfg = config_reader.read_file(args.plot_config,
+                                          _get_config_cache(args))
+    except config_reader.YamlError as e:
+        logging.error('Invalid config:\n\n' + "\n".join(e.errors))
+        sys.exit(EXIT_BAD_CONFIG)
 
     # relative to CWD (absolute path overrides)
     outdir = os.path.join(os.getcwd(), args.out_dir)
     cfg.outdir = outdir
 
-    # Finally, once all value are in, check they make sense
-    errs = cfg.validate()
+    if args.plan or args.plan_out:
+        _plan(args, cfg, brd_files)
+        return
 
-    if errs:
-        logging.error('Invalid config:\n\n' + "\n".join(errs))
-        sys.exit(EXIT_BAD_CONFIG)
+    from . import kiplot
+
+    output_cache = _get_output_cache(args)
 
     # Set up the plotter and do it
-    plotter = kiplot.Plotter(cfg)
-    plotter.plot(args.board_file)
+    try:
+        if len(brd_files) == 1:
+            plotter = kiplot.Plotter(cfg)
+            plotter.jobs = args.jobs
+            plotter.layer_jobs = args.layer_jobs
+            plotter.cache = output_cache
+            plotter.incremental = not args.force
+            plotter.scratch_dir = args.scratch_dir
+            plotter.plot(brd_files[0])
+        else:
+            # many boards: one output dir per board
+            plotter = batch.BatchPlotter(cfg)
+            plotter.jobs = args.jobs
+            plotter.cache = output_cache
+            plotter.incremental = not args.force
+            plotter.scratch_dir = args.scratch_dir
+            plotter.plot(brd_files)
+    finally:
+        if timing.profiler.enabled:
+            _report_profile(args)
 
 
 if __name__ == "__main__":
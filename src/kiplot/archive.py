@@ -0,0 +1,165 @@
+"""
+Archives (zip or tar.gz) of the files of other outputs, written as the
+files are plotted
+"""
+
+import logging
+import os
+import tarfile
+import threading
+import zipfile
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import error
+from . import plot_config as PCfg
+
+
+class ArchiveError(error.KiPlotError):
+    pass
+
+
+def _open_zip(filename, compression_level):
+
+    try:
+        return zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED,
+                               compresslevel=compression_level)
+    except TypeError:
+        # no compresslevel before Python 3.7
+        return zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+
+
+class OutputArchive(object):
+    """
+    An archive of the files of a number of outputs. Files are queued as each
+    output is done, and written by a background thread, so the archive is
+    built while the other outputs are plotted.
+    """
+
+    def __init__(self, filename, options):
+        """
+        :param filename: the archive to write
+        :param options: the ArchiveOptions of the output
+        """
+
+        self.filename = filename
+        self.options = options
+
+        # the outputs not added yet
+        self._waiting = set(options.outputs)
+
+        # (file path, name in the archive), None to finish
+        self._queue = queue.Queue()
+
+        self._tmp_file = None
+        self._thread = None
+        self._error = None
+
+    def start(self):
+
+        outdir = os.path.dirname(self.filename)
+
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+
+        # write next to the archive, and rename into place when complete
+        self._tmp_file = self.filename + '.tmp'
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_output(self, output_name, files):
+        """
+        Queue the files of an output for the archive
+
+        :param files: (file path, name in the archive) of each file
+        """
+
+        if output_name not in self._waiting:
+            return
+
+        self._waiting.discard(output_name)
+
+        for f in files:
+            self._queue.put(f)
+
+    def finish(self):
+        """
+        Wait for all the files to be written, and move the archive into
+        place
+
+        :raises ArchiveError: if an output is missing or writing failed
+        """
+
+        self._stop()
+
+        if self._waiting:
+            self._remove_tmp()
+            raise ArchiveError("Output(s) missing from archive {}: {}"
+                               .format(self.filename,
+                                       ", ".join(sorted(self._waiting))))
+
+        if self._error:
+            self._remove_tmp()
+            raise ArchiveError("Failed to write archive {}: {}"
+                               .format(self.filename, self._error))
+
+        os.rename(self._tmp_file, self.filename)
+
+    def abort(self):
+
+        self._stop()
+        self._remove_tmp()
+
+    def _stop(self):
+
+        self._queue.put(None)
+        self._thread.join()
+
+    def _remove_tmp(self):
+
+        try:
+            os.remove(self._tmp_file)
+        except OSError:
+            pass
+
+    def _run(self):
+
+        try:
+            if self.options.format == PCfg.ArchiveOptions.ZIP:
+                self._write_zip()
+            else:
+                self._write_tar()
+        except Exception as e:
+            logging.debug("Archive {} failed: {}".format(self.filename, e))
+            self._error = e
+
+    def _files(self):
+        """
+        Files from the queue, until the end of the archive
+        """
+
+        for path, arcname in iter(self._queue.get, None):
+            logging.debug("Archiving {} as {}".format(path, arcname))
+            yield path, arcname
+
+    def _write_zip(self):
+
+        zf = _open_zip(self._tmp_file, self.options.compression_level)
+
+        with zf:
+            for path, arcname in self._files():
+                zf.write(path, arcname)
+
+    def _write_tar(self):
+
+        tf = tarfile.open(self._tmp_file, 'w:gz',
+                          compresslevel=self.options.compression_level)
+
+        with tf:
+            for path, arcname in self._files():
+                tf.add(path, arcname)
@@ -0,0 +1,201 @@
+"""
+Plotting of many boards with one config, in one process or a pool
+"""
+
+import copy
+import glob
+import logging
+import multiprocessing
+import os
+import traceback
+
+from . import error
+from . import timing
+
+
+class BatchError(error.KiPlotError):
+    pass
+
+
+def expand_board_args(board_args):
+    """
+    Expand a list of board files and glob patterns into board files
+
+    :param board_args: board filenames, or glob patterns matching them
+    :return: the board filenames, in the order given
+    """
+
+    boards = []
+
+    for arg in board_args:
+
+        if glob.has_magic(arg):
+            matches = sorted(glob.glob(arg))
+
+            if not matches:
+                raise BatchError("No boards match: {}".format(arg))
+
+            boards += matches
+        else:
+            boards.append(arg)
+
+    return boards
+
+
+def read_board_list(fstream):
+    """
+    Read a board manifest file: one board file or glob per line, blank
+    lines and lines starting with '#' are skipped. Relative paths are
+    relative to the manifest file.
+
+    :param fstream: file stream of the manifest
+    """
+
+    base_dir = os.path.dirname(os.path.abspath(fstream.name))
+
+    board_args = []
+
+    for line in fstream:
+
+        line = line.strip()
+
+        if not line or line.startswith('#'):
+            continue
+
+        board_args.append(os.path.join(base_dir, line))
+
+    return expand_board_args(board_args)
+
+
+def get_board_name(brd_file):
+    """
+    The name of a board, as used for the per-board output dir
+    """
+    return os.path.splitext(os.path.basename(brd_file))[0]
+
+
+class BatchPlotter(object):
+    """
+    Plots many boards with one config, each into its own directory under
+    the config's output dir
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+        # number of worker processes to spread the boards over
+        # (1: plot them all in this process)
+        self.jobs = 1
+
+        # cache of plotted output files (None: always plot)
+        self.cache = None
+
+        # only plot outputs that changed since the last plot
+        self.incremental = False
+
+        # a dir to plot into before the files are moved to the output dirs
+        # (None: plot into the output dirs)
+        self.scratch_dir = None
+
+    def _plotter_options(self):
+        """
+        Get the settings of the Plotter for each board
+        """
+
+        return {
+            'cache': self.cache,
+            'incremental': self.incremental,
+            'scratch_dir': self.scratch_dir,
+        }
+
+    def board_config(self, brd_file):
+        """
+        Get the config to plot a given board with
+        """
+
+        cfg = copy.copy(self.cfg)
+        cfg.outdir = os.path.join(self.cfg.outdir, get_board_name(brd_file))
+        return cfg
+
+    def plot(self, brd_files):
+
+        names = [get_board_name(b) for b in brd_files]
+
+        dupes = sorted(set(n for n in names if names.count(n) > 1))
+
+        if dupes:
+            raise BatchError("Boards would share output directories: {}"
+                             .format(", ".join(dupes)))
+
+        logging.debug("Plotting {} boards".format(len(brd_files)))
+
+        opts = self._plotter_options()
+        jobs = [(self.board_config(b), b, opts) for b in brd_files]
+
+        if self.jobs > 1 and len(jobs) > 1:
+
+            n_workers = min(self.jobs, len(jobs))
+            pool = multiprocessing.Pool(n_workers, _init_worker,
+                                        (timing.profiler.enabled,))
+
+            try:
+                results = list(pool.imap_unordered(_plot_board, jobs))
+                pool.close()
+            except BaseException:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            results = [_plot_board(job) for job in jobs]
+
+        errs = []
+
+        for brd_file, err, spans in results:
+
+            timing.profiler.add_spans(spans)
+
+            if err:
+                logging.error("Board {} failed: {}".format(brd_file, err))
+                errs.append("{}: {}".format(brd_file, err))
+            else:
+                logging.info("Plotted board {}".format(brd_file))
+
+        if errs:
+            raise BatchError("Failed to plot {} board(s):\n{}"
+                             .format(len(errs), "\n".join(errs)))
+
+
+def _init_worker(profile):
+
+    timing.profiler.reset(profile)
+
+
+def _plot_board(job):
+    """
+    Plot a single board of a batch
+
+    :param job: (config, board file, Plotter settings)
+    :return: (board file, error message or None, timing spans)
+    """
+
+    # imports pcbnew, so board lists can be read without it
+    from . import kiplot
+
+    cfg, brd_file, plotter_opts = job
+
+    logging.debug("Plotting board {} to {}".format(brd_file, cfg.outdir))
+
+    try:
+        plotter = kiplot.Plotter(cfg)
+
+        for k, v in plotter_opts.items():
+            setattr(plotter, k, v)
+
+        plotter.plot(brd_file)
+        err = None
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        err = "{}: {}".format(type(e).__name__, e)
+
+    return (brd_file, err, timing.profiler.take_spans())
@@ -0,0 +1,66 @@
+"""
+Loading of boards, with a cache of boards already loaded
+"""
+
+import collections
+import logging
+import os
+
+
+class BoardCache(object):
+    """
+    Keeps the most recently used boards loaded. A board is loaded again if
+    its file was modified since it was loaded, or if its zones were filled
+    and the caller needs it as it is in its file.
+    """
+
+    def __init__(self, max_boards):
+        """
+        :param max_boards: the number of boards to keep loaded
+        """
+
+        self.max_boards = max_boards
+
+        # path: [mtime, board, zones filled], least recently used first
+        self._boards = collections.OrderedDict()
+
+    def load(self, brd_file, filled_ok=False):
+        """
+        Get a loaded board, from the cache if possible
+
+        :param filled_ok: whether a board whose zones were filled (by an
+            earlier plot) will do, as the caller fills them anyway
+        """
+
+        # only imported when a board is loaded
+        import pcbnew
+
+        path = os.path.abspath(brd_file)
+        mtime = os.path.getmtime(path)
+
+        entry = self._boards.pop(path, None)
+
+        if (entry is not None and entry[0] == mtime and
+                (filled_ok or not entry[2])):
+            logging.debug("Board from cache: {}".format(path))
+        else:
+            entry = [mtime, pcbnew.LoadBoard(path), False]
+
+        self._boards[path] = entry
+
+        while len(self._boards) > self.max_boards:
+            old_path, _ = self._boards.popitem(last=False)
+            logging.debug("Dropping board from cache: {}".format(old_path))
+
+        return entry[1]
+
+    def mark_filled(self, brd_file):
+        """
+        Record that the zones of a loaded board were filled, so it isn't
+        given to a plot which doesn't fill them
+        """
+
+        entry = self._boards.get(os.path.abspath(brd_file))
+
+        if entry is not None:
+            entry[2] = True
@@ -0,0 +1,340 @@
+"""
+On-disk caches of plotted output files and of parsed configs, keyed by the
+content of the inputs
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+
+# the file in each cache entry listing the files in it
+ENTRY_INDEX = 'entry.json'
+
+
+def default_cache_dir():
+    """
+    Get the default KiPlot cache dir (under $XDG_CACHE_HOME)
+    """
+
+    base = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'kiplot')
+
+
+def file_digest(filename):
+    """
+    Get the SHA-1 hex digest of a file's contents
+    """
+
+    h = hashlib.sha1()
+
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def make_key(*parts):
+    """
+    Make a cache key from a number of strings
+    """
+
+    h = hashlib.sha1()
+
+    for p in parts:
+        h.update(p.encode('utf-8'))
+        # separator, so ('ab', 'c') != ('a', 'bc')
+        h.update(b'\0')
+
+    return h.hexdigest()
+
+
+class OutputCache(object):
+    """
+    A cache of the files plotted by outputs. Each entry is a directory
+    of files, which is evicted least-recently-used first when the cache
+    grows over its size limit.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        """
+        :param cache_dir: the directory to keep the cache in
+        :param max_size: the size limit of the cache, in bytes
+        """
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _entries_dir(self):
+        return os.path.join(self.cache_dir, 'outputs')
+
+    def _entry_dir(self, key):
+        return os.path.join(self._entries_dir(), key[:2], key)
+
+    def restore(self, key, dest_dir):
+        """
+        Copy the files of a cache entry to a directory. The files are copied
+        in place, so dest_dir should be a staging dir, whose files are moved
+        to the output dir once all are restored.
+
+        :return: the files restored (relative to dest_dir), or None if there
+        is no such entry (or it is incomplete)
+        """
+
+        entry_dir = self._entry_dir(key)
+
+        try:
+            with open(os.path.join(entry_dir, ENTRY_INDEX)) as f:
+                files = json.load(f)['files']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        for fn in files:
+
+            dest = os.path.join(dest_dir, fn)
+            dest_subdir = os.path.dirname(dest)
+
+            if not os.path.isdir(dest_subdir):
+                os.makedirs(dest_subdir)
+
+            try:
+                shutil.copyfile(os.path.join(entry_dir, fn), dest)
+            except (IOError, OSError):
+                # evicted under us?
+                logging.warning("Cache entry {} is incomplete".format(key))
+                return None
+
+        # mark as recently used
+        os.utime(entry_dir, None)
+
+        return files
+
+    def store(self, key, src_dir, files):
+        """
+        Copy files into a new cache entry
+
+        :param src_dir: the dir the files are in
+        :param files: the files to store (relative to src_dir)
+        """
+
+        entry_dir = self._entry_dir(key)
+
+        if os.path.isdir(entry_dir):
+            return
+
+        if not os.path.isdir(self._entries_dir()):
+            os.makedirs(self._entries_dir())
+
+        # fill a temp dir, and move it into place when complete
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self._entries_dir())
+
+        try:
+            size = 0
+
+            for fn in files:
+
+                dest = os.path.join(tmp_dir, fn)
+                dest_subdir = os.path.dirname(dest)
+
+                if not os.path.isdir(dest_subdir):
+                    os.makedirs(dest_subdir)
+
+                shutil.copyfile(os.path.join(src_dir, fn), dest)
+                size += os.path.getsize(dest)
+
+            with open(os.path.join(tmp_dir, ENTRY_INDEX), 'w') as f:
+                json.dump({'files': files, 'size': size}, f)
+
+            if not os.path.isdir(os.path.dirname(entry_dir)):
+                os.makedirs(os.path.dirname(entry_dir))
+
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            # probably another process stored the same entry first
+            logging.debug("Failed to store cache entry {}: {}"
+                          .format(key, e))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is within
+        its size limit
+        """
+
+        entries = []
+        total = 0
+
+        entries_dir = self._entries_dir()
+
+        if not os.path.isdir(entries_dir):
+            return
+
+        for prefix in os.listdir(entries_dir):
+
+            prefix_dir = os.path.join(entries_dir, prefix)
+
+            if prefix.startswith('.') or not os.path.isdir(prefix_dir):
+                continue
+
+            for key in os.listdir(prefix_dir):
+
+                entry_dir = os.path.join(prefix_dir, key)
+
+                try:
+                    with open(os.path.join(entry_dir, ENTRY_INDEX)) as f:
+                        size = json.load(f)['size']
+                    mtime = os.path.getmtime(entry_dir)
+                except (IOError, OSError, ValueError, KeyError):
+                    continue
+
+                entries.append((mtime, size, entry_dir))
+                total += size
+
+        entries.sort()
+
+        while entries and total > self.max_size:
+            mtime, size, entry_dir = entries.pop(0)
+
+            logging.debug("Evicting cache entry {}".format(entry_dir))
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+
+class PickleCache(object):
+    """
+    A cache of (small) Python objects, as pickles, keeping a number of the
+    most recently used. Its size doesn't count towards the size limit of
+    the OutputCache.
+    """
+
+    # the subdir of the cache dir the entries are in
+    SUBDIR = None
+
+    # entries to keep
+    MAX_ENTRIES = None
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: the directory to keep the cache in
+        """
+
+        self.cache_dir = cache_dir
+
+    def _entries_dir(self):
+        return os.path.join(self.cache_dir, self.SUBDIR)
+
+    def _entry_file(self, key):
+        return os.path.join(self._entries_dir(), key + '.pickle')
+
+    def load(self, key):
+        """
+        :return: the entry stored under a key, or None
+        """
+
+        entry_file = self._entry_file(key)
+
+        try:
+            with open(entry_file, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError) as e:
+            if not isinstance(e, (IOError, OSError)):
+                logging.debug("Bad {} cache entry {}: {}"
+                              .format(self.SUBDIR, key, e))
+            return None
+
+        # mark as recently used
+        os.utime(entry_file, None)
+
+        return entry
+
+    def store(self, key, entry):
+        """
+        :param entry: the object to store, which must be picklable
+        """
+
+        entries_dir = self._entries_dir()
+
+        if not os.path.isdir(entries_dir):
+            os.makedirs(entries_dir)
+
+        fd, tmp_file = tempfile.mkstemp(prefix='.tmp-', dir=entries_dir)
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+
+            os.rename(tmp_file, self._entry_file(key))
+        except (IOError, OSError, TypeError, pickle.PicklingError) as e:
+            logging.debug("Failed to store {} cache entry {}: {}"
+                          .format(self.SUBDIR, key, e))
+            os.remove(tmp_file)
+
+    def prune(self):
+        """
+        Remove the least recently used entries, over MAX_ENTRIES
+        """
+
+        entries_dir = self._entries_dir()
+        entries = []
+
+        if not os.path.isdir(entries_dir):
+            return
+
+        for fn in os.listdir(entries_dir):
+
+            if fn.startswith('.'):
+                continue
+
+            try:
+                entries.append((os.path.getmtime(
+                    os.path.join(entries_dir, fn)), fn))
+            except OSError:
+                continue
+
+        entries.sort()
+
+        for mtime, fn in entries[:-self.MAX_ENTRIES]:
+            try:
+                os.remove(os.path.join(entries_dir, fn))
+            except OSError:
+                pass
+
+
+class ConfigCache(PickleCache):
+    """
+    A cache of parsed and validated configs, so a config which has not
+    changed does not need to be parsed again. Each entry is the config and
+    whatever else is needed to tell if it is still valid.
+    """
+
+    SUBDIR = 'configs'
+
+    # configs are small, but each edit makes a new one
+    MAX_ENTRIES = 200
+
+
+class ZoneFillCache(PickleCache):
+    """
+    A cache of the filled areas of zones
+    """
+
+    SUBDIR = 'zones'
+
+    MAX_ENTRIES = 5000
+
+
+class PreviewCache(PickleCache):
+    """
+    A cache of the images of previewed layers, by what each layer draws
+    """
+
+    SUBDIR = 'previews'
+
+    MAX_ENTRIES = 2000
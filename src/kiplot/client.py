@@ -0,0 +1,37 @@
+"""
+Client for the plot server (see server.py)
+"""
+
+import json
+import socket
+
+from . import error
+
+
+class ClientError(error.KiPlotError):
+    pass
+
+
+def send_request(socket_path, request):
+    """
+    Send a request to a plot server and wait for the response
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    except socket.error as e:
+        raise ClientError("Failed to talk to the server on {}: {}"
+                          .format(socket_path, e))
+    finally:
+        sock.close()
+
+    try:
+        return json.loads(line.decode('utf-8'))
+    except ValueError:
+        raise ClientError("Bad response from the server: {!r}".format(line))
@@ -2,15 +2,28 @@
 Class to read KiPlot config files
 """
 
+import collections
+import hashlib
+import io
+import json
 import logging
+import sys
 import yaml
 import os
 import re
-
-import pcbnew
+import string
 
 from . import plot_config as PC
+from . import cache
 from . import error
+from . import kicad_defs
+from .__version__ import __version__
+
+# libyaml's parser, if PyYAML was built with it, is much faster
+try:
+    _SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    _SafeLoader = yaml.SafeLoader
 
 
 class CfgReader(object):
@@ -20,7 +33,525 @@ class CfgReader(object):
 
 
 class YamlError(error.KiPlotError):
-    pass
+
+    def __init__(self, msg, errors=None):
+
+        super(YamlError, self).__init__(msg)
+
+        # all the errors found, each with its position in the file
+        self.errors = errors if errors is not None else [msg]
+
+
+class _MarkedDict(dict):
+    """
+    A YAML mapping, which knows where it and its keys are in the file
+    """
+
+    def __init__(self, mark=None):
+
+        super(_MarkedDict, self).__init__()
+
+        self.mark = mark
+        self.key_marks = {}
+
+
+class _Loader(_SafeLoader):
+    """
+    Loads YAML safely, recording where the mappings are, to report errors at
+    """
+
+
+def _construct_marked_mapping(loader, node):
+
+    data = _MarkedDict(node.start_mark)
+    yield data
+
+    data.update(loader.construct_mapping(node))
+
+    for key_node, value_node in node.value:
+        data.key_marks[loader.construct_object(key_node)] = \
+            key_node.start_mark
+
+
+_Loader.add_constructor(u'tag:yaml.org,2002:map', _construct_marked_mapping)
+
+
+# value types of options: each checks (and converts) a value from the YAML,
+# raising ValueError if it can't
+
+def _bool(val):
+
+    if not isinstance(val, bool):
+        raise ValueError("expected true or false, got {}".format(val))
+
+    return val
+
+
+def _number(val):
+
+    if isinstance(val, bool) or not isinstance(val, (int, float)):
+        raise ValueError("expected a number, got {}".format(val))
+
+    return val
+
+
+def _int(val):
+
+    if isinstance(val, bool) or not isinstance(val, int):
+        raise ValueError("expected an integer, got {}".format(val))
+
+    return val
+
+
+def _string(val):
+
+    if not isinstance(val, (str, type(u''))):
+        raise ValueError("expected a string, got {}".format(val))
+
+    return val
+
+
+def _mapping(val):
+
+    if not isinstance(val, dict):
+        raise ValueError("expected a mapping, got {}".format(val))
+
+    return val
+
+
+def _string_list(val):
+
+    if not isinstance(val, list):
+        raise ValueError("expected a list, got {}".format(val))
+
+    return [_string(v) for v in val]
+
+
+# note - type IDs are strings form the _config_, not the internal
+# strings used as enums (in plot_config)
+ANY_LAYER = ['gerber', 'ps', 'svg', 'hpgl', 'pdf', 'dxf', 'preview']
+ANY_DRILL = ['excellon', 'gerb_drill']
+
+OUTPUT_TYPES = ANY_LAYER + ANY_DRILL + ['archive']
+
+# options of the layer outputs which previews have defaults for (in
+# PreviewOptions), as they only set up the Gerber plots previews are drawn
+# from
+PREVIEW_DEFAULTED = [
+    'exclude_edge_layer',
+    'exclude_pads_from_silkscreen',
+    'plot_sheet_reference',
+    'plot_footprint_refs',
+    'plot_footprint_values',
+    'force_plot_invisible_refs_vals',
+    'tent_vias',
+    'check_zone_fills',
+    'line_width',
+]
+
+# mappings from YAML keys to type_option keys. A transform is the name of a
+# CfgYamlReader method to parse the value with.
+MAPPINGS = [
+    {
+        'key': 'use_aux_axis_as_origin',
+        'types': ['gerber', 'dxf'],
+        'to': 'use_aux_axis_as_origin',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'exclude_edge_layer',
+        'types': ANY_LAYER,
+        'to': 'exclude_edge_layer',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'exclude_pads_from_silkscreen',
+        'types': ANY_LAYER,
+        'to': 'exclude_pads_from_silkscreen',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'plot_sheet_reference',
+        'types': ANY_LAYER,
+        'to': 'plot_sheet_reference',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'plot_footprint_refs',
+        'types': ANY_LAYER,
+        'to': 'plot_footprint_refs',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'plot_footprint_values',
+        'types': ANY_LAYER,
+        'to': 'plot_footprint_values',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'force_plot_invisible_refs_vals',
+        'types': ANY_LAYER,
+        'to': 'force_plot_invisible_refs_vals',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'tent_vias',
+        'types': ANY_LAYER,
+        'to': 'tent_vias',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'check_zone_fills',
+        'types': ANY_LAYER,
+        'to': 'check_zone_fills',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'line_width',
+        'types': ['gerber', 'ps', 'svg', 'pdf', 'preview'],
+        'to': 'line_width',
+        'value': _number,
+        'required': True,
+    },
+    {
+        'key': 'subtract_mask_from_silk',
+        'types': ['gerber'],
+        'to': 'subtract_mask_from_silk',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'mirror_plot',
+        'types': ['ps', 'svg', 'hpgl', 'pdf'],
+        'to': 'mirror_plot',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'negative_plot',
+        'types': ['ps', 'svg', 'pdf'],
+        'to': 'negative_plot',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'sketch_plot',
+        'types': ['ps', 'hpgl'],
+        'to': 'sketch_plot',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'scaling',
+        'types': ['ps', 'hpgl'],
+        'to': 'scaling',
+        'value': _number,
+        'required': True,
+    },
+    {
+        'key': 'drill_marks',
+        'types': ['ps', 'svg', 'dxf', 'hpgl', 'pdf'],
+        'to': 'drill_marks',
+        'value': _string,
+        'required': True,
+    },
+    {
+        'key': 'use_protel_extensions',
+        'types': ['gerber'],
+        'to': 'use_protel_extensions',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'gerber_precision',
+        'types': ['gerber'],
+        'to': 'gerber_precision',
+        'value': _number,
+        'required': True,
+    },
+    {
+        'key': 'create_gerber_job_file',
+        'types': ['gerber'],
+        'to': 'create_gerber_job_file',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'use_gerber_x2_attributes',
+        'types': ['gerber'],
+        'to': 'use_gerber_x2_attributes',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'use_gerber_net_attributes',
+        'types': ['gerber'],
+        'to': 'use_gerber_net_attributes',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'scale_adjust_x',
+        'types': ['ps'],
+        'to': 'scale_adjust_x',
+        'value': _number,
+        'required': True,
+    },
+    {
+        'key': 'scale_adjust_y',
+        'types': ['ps'],
+        'to': 'scale_adjust_y',
+        'value': _number,
+        'required': True,
+    },
+    {
+        'key': 'width_adjust',
+        'types': ['ps'],
+        'to': 'width_adjust',
+        'value': _number,
+        'required': True,
+    },
+    {
+        'key': 'a4_output',
+        'types': ['ps'],
+        'to': 'a4_output',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'pen_width',
+        'types': ['hpgl'],
+        'to': 'pen_width',
+        'value': _number,
+        'required': True,
+    },
+    {
+        'key': 'polygon_mode',
+        'types': ['dxf'],
+        'to': 'polygon_mode',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'single_file',
+        'types': ['svg', 'pdf'],
+        'to': 'single_file',
+        'value': _bool,
+        'required': False,
+    },
+    {
+        'key': 'dpi',
+        'types': ['preview'],
+        'to': 'dpi',
+        'value': _number,
+        'required': False,
+    },
+    {
+        'key': 'tile_size',
+        'types': ['preview'],
+        'to': 'tile_size',
+        'value': _int,
+        'required': False,
+    },
+    {
+        'key': 'use_aux_axis_as_origin',
+        'types': ANY_DRILL,
+        'to': 'use_aux_axis_as_origin',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'map',
+        'types': ANY_DRILL,
+        'to': 'map_options',
+        'value': _mapping,
+        'required': False,
+        'transform': '_parse_drill_map',
+    },
+    {
+        'key': 'report',
+        'types': ANY_DRILL,
+        'to': 'report_options',
+        'value': _mapping,
+        'required': False,
+        'transform': '_parse_drill_report',
+    },
+    {
+        'key': 'metric_units',
+        'types': ['excellon'],
+        'to': 'metric_units',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'pth_and_npth_single_file',
+        'types': ['excellon'],
+        'to': 'pth_and_npth_single_file',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'minimal_header',
+        'types': ['excellon'],
+        'to': 'minimal_header',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'mirror_y_axis',
+        'types': ['excellon'],
+        'to': 'mirror_y_axis',
+        'value': _bool,
+        'required': True,
+    },
+    {
+        'key': 'verify',
+        'types': ['excellon'],
+        'to': 'verify_options',
+        'value': _mapping,
+        'required': False,
+        'transform': '_parse_drill_verify',
+    },
+    {
+        'key': 'format',
+        'types': ['archive'],
+        'to': 'format',
+        'value': _string,
+        'required': True,
+    },
+    {
+        'key': 'filename',
+        'types': ['archive'],
+        'to': 'filename',
+        'value': _string,
+        'required': True,
+    },
+    {
+        'key': 'compression_level',
+        'types': ['archive'],
+        'to': 'compression_level',
+        'value': _int,
+        'required': False,
+    },
+    {
+        'key': 'outputs',
+        'types': ['archive'],
+        'to': 'outputs',
+        'value': _string_list,
+        'required': True,
+    },
+]
+
+
+def _compile_mappings(mappings):
+    """
+    Index the mappings by output type and then YAML key, so the options of
+    an output are mapped in one pass over just its own mappings
+
+    :return: {output type: {key: mapping}}
+    """
+
+    by_type = dict((otype, collections.OrderedDict())
+                   for otype in OUTPUT_TYPES)
+
+    for mapping in mappings:
+        for otype in mapping['types']:
+
+            if otype == 'preview' and mapping['key'] in PREVIEW_DEFAULTED:
+                mapping = dict(mapping, required=False)
+
+            by_type[otype][mapping['key']] = mapping
+
+    return by_type
+
+
+_OPTION_MAPPINGS = _compile_mappings(MAPPINGS)
+
+# a template string which is a single param, e.g. '${layer}'
+_WHOLE_PARAM_RE = re.compile(r'^\$(?:(\w+)|\{(\w+)\})$')
+
+
+def _merge(base, over):
+    """
+    Merge two mappings (over overriding base), keeping the marks of the keys
+    """
+
+    merged = _MarkedDict(getattr(over, 'mark', None))
+
+    for d in [base, over]:
+        merged.update(d)
+        merged.key_marks.update(getattr(d, 'key_marks', {}))
+
+    return merged
+
+
+def _substitute(obj, params):
+    """
+    Substitute template params into the strings of a YAML object. A string
+    which is just a param is replaced by the param's value, of any type.
+
+    :raises KeyError: for a param with no value
+    """
+
+    if isinstance(obj, dict):
+
+        subst = _MarkedDict(getattr(obj, 'mark', None))
+        subst.key_marks.update(getattr(obj, 'key_marks', {}))
+
+        for k, v in obj.items():
+            subst[k] = _substitute(v, params)
+
+        return subst
+
+    if isinstance(obj, list):
+        return [_substitute(v, params) for v in obj]
+
+    if isinstance(obj, (str, type(u''))):
+
+        m = _WHOLE_PARAM_RE.match(obj)
+
+        if m:
+            return params[m.group(1) or m.group(2)]
+
+        return string.Template(obj).substitute(params)
+
+    return obj
+
+
+# included config fragments: {path: ((mtime, size), YAML data)}
+_fragments = {}
+
+
+def _load_fragment(path):
+    """
+    Load an included config fragment, if it changed since last loaded
+
+    :return: ((mtime, size) of the file, YAML data)
+    """
+
+    st = os.stat(path)
+    stamp = (st.st_mtime, st.st_size)
+
+    cached = _fragments.get(path)
+
+    if cached is not None and cached[0] == stamp:
+        return cached
+
+    with open(path) as f:
+        data = yaml.load(f, Loader=_Loader)
+
+    _fragments[path] = (stamp, data)
+
+    return _fragments[path]
 
 
 class CfgYamlReader(CfgReader):
@@ -28,49 +559,106 @@ class CfgYamlReader(CfgReader):
     def __init__(self):
         super(CfgYamlReader, self).__init__()
 
+        # errors found so far in the config being read
+        self._errors = []
+
+        # output templates, by name
+        self._templates = {}
+
+        # expanded templates: {(name, params): output YAML}
+        self._expanded = {}
+
+        # (path, (mtime, size)) of the files included by the config read
+        self.includes = []
+
+    def _where(self, data, key=None):
+        """
+        Get the position of a mapping (or one of its keys) in the file,
+        to prefix an error with
+        """
+
+        mark = None
+
+        if isinstance(data, _MarkedDict):
+            mark = data.key_marks.get(key, data.mark)
+
+        if mark is None:
+            return ""
+
+        return "{}:{}:{}: ".format(mark.name, mark.line + 1,
+                                   mark.column + 1)
+
+    def _error(self, msg, data, key=None):
+        """
+        Make an error at a mapping (or one of its keys)
+        """
+
+        return YamlError(self._where(data, key) + msg)
+
+    def _add_error(self, msg, data, key=None):
+        """
+        Record an error, to carry on reading the config and report all
+        the errors at the end
+        """
+
+        self._errors.append(self._where(data, key) + msg)
+
     def _check_version(self, data):
 
+        if not isinstance(data, dict):
+            raise YamlError("YAML config needs to be a mapping")
+
         try:
             version = data['kiplot']['version']
-        except KeyError:
-            raise YamlError("YAML config needs kiplot.version.")
-            return None
+        except (KeyError, TypeError):
+            raise self._error("YAML config needs kiplot.version.", data)
 
         if version != 1:
-            raise YamlError("Unknown KiPlot config version: {}"
-                            .format(version))
-            return None
+            raise self._error("Unknown KiPlot config version: {}"
+                              .format(version), data['kiplot'], 'version')
 
         return version
 
-    def _get_required(self, data, key):
+    def _get_required(self, data, key, value=None):
+        """
+        :param value: a function to check (and convert) the value with,
+            which raises ValueError for a bad value
+        """
 
         try:
             val = data[key]
         except KeyError:
-            raise YamlError("Value is needed for {}".format(key))
+            raise self._error("Value is needed for {}".format(key), data)
+
+        if value is None:
+            return val
 
-        return val
+        try:
+            return value(val)
+        except ValueError as e:
+            raise self._error("Bad value for {}: {}".format(key, e), data,
+                              key)
 
     def _parse_drill_map(self, map_opts):
 
         mo = PC.DrillMapOptions()
 
         TYPES = {
-            'hpgl': pcbnew.PLOT_FORMAT_HPGL,
-            'ps': pcbnew.PLOT_FORMAT_POST,
-            'gerber': pcbnew.PLOT_FORMAT_GERBER,
-            'dxf': pcbnew.PLOT_FORMAT_DXF,
-            'svg': pcbnew.PLOT_FORMAT_SVG,
-            'pdf': pcbnew.PLOT_FORMAT_PDF
+            'hpgl': kicad_defs.PLOT_FORMAT_HPGL,
+            'ps': kicad_defs.PLOT_FORMAT_POST,
+            'gerber': kicad_defs.PLOT_FORMAT_GERBER,
+            'dxf': kicad_defs.PLOT_FORMAT_DXF,
+            'svg': kicad_defs.PLOT_FORMAT_SVG,
+            'pdf': kicad_defs.PLOT_FORMAT_PDF
         }
 
         type_s = self._get_required(map_opts, 'type')
 
         try:
             mo.type = TYPES[type_s]
-        except KeyError:
-            raise YamlError("Unknown drill map type: {}".format(type_s))
+        except (KeyError, TypeError):
+            raise self._error("Unknown drill map type: {}".format(type_s),
+                              map_opts, 'type')
 
         return mo
 
@@ -82,258 +670,71 @@ class CfgYamlReader(CfgReader):
 
         return opts
 
-    def _perform_config_mapping(self, otype, cfg_options, mapping_list, 
-                                target):
+    def _parse_drill_verify(self, verify_opts):
+
+        opts = PC.DrillVerifyOptions()
+
+        if 'min_hole_spacing' in verify_opts:
+            try:
+                spacing = _number(verify_opts['min_hole_spacing'])
+            except ValueError as e:
+                raise self._error("Bad value for min_hole_spacing: {}"
+                                  .format(e), verify_opts,
+                                  'min_hole_spacing')
+
+            if spacing < 0:
+                raise self._error("min_hole_spacing can't be negative",
+                                  verify_opts, 'min_hole_spacing')
+
+            opts.min_hole_spacing = spacing
+
+        return opts
+
+    def _perform_config_mapping(self, otype, cfg_options, target):
         """
-        Map a config dict onto a target object given a mapping list
+        Map a config dict onto a target object, recording any errors
         """
 
-        for mapping in mapping_list:
+        mappings = _OPTION_MAPPINGS[otype]
+
+        for key, mapping in mappings.items():
+            if mapping['required'] and key not in cfg_options:
+                self._add_error("Value is needed for {}".format(key),
+                                cfg_options)
 
-            # if this output type matches the mapping specification:
-            if otype in mapping['types']:
+        for key, cfg_val in cfg_options.items():
 
-                key = mapping['key']
+            mapping = mappings.get(key)
 
-                # set the internal option as needed
-                if mapping['required'](cfg_options):
+            if mapping is None:
+                self._add_error("Unknown option for a {} output: {}".format(
+                    otype, key), cfg_options, key)
+                continue
 
-                    cfg_val = self._get_required(cfg_options, key)
-                elif key in cfg_options:
-                    # not required but given anyway
-                    cfg_val = cfg_options[key]
-                else:
-                    continue
+            try:
+                cfg_val = mapping['value'](cfg_val)
 
                 # transform the value if needed
                 if 'transform' in mapping:
-                    cfg_val = mapping['transform'](cfg_val)
+                    cfg_val = getattr(self, mapping['transform'])(cfg_val)
 
                 setattr(target, mapping['to'], cfg_val)
+            except ValueError as e:
+                self._add_error("Bad value for {}: {}".format(key, e),
+                                cfg_options, key)
+            except PC.KiPlotConfigurationError as e:
+                self._add_error(str(e), cfg_options, key)
+            except YamlError as e:
+                self._errors += e.errors
 
     def _parse_out_opts(self, otype, options):
 
-        # note - type IDs are strings form the _config_, not the internal
-        # strings used as enums (in plot_config)
-        ANY_LAYER = ['gerber', 'ps', 'svg', 'hpgl', 'pdf', 'dxf']
-        ANY_DRILL = ['excellon', 'gerb_drill']
-
-        # mappings from YAML keys to type_option keys
-        MAPPINGS = [
-            {
-                'key': 'use_aux_axis_as_origin',
-                'types': ['gerber', 'dxf'],
-                'to': 'use_aux_axis_as_origin',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'exclude_edge_layer',
-                'types': ANY_LAYER,
-                'to': 'exclude_edge_layer',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'exclude_pads_from_silkscreen',
-                'types': ANY_LAYER,
-                'to': 'exclude_pads_from_silkscreen',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'plot_sheet_reference',
-                'types': ANY_LAYER,
-                'to': 'plot_sheet_reference',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'plot_footprint_refs',
-                'types': ANY_LAYER,
-                'to': 'plot_footprint_refs',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'plot_footprint_values',
-                'types': ANY_LAYER,
-                'to': 'plot_footprint_values',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'force_plot_invisible_refs_vals',
-                'types': ANY_LAYER,
-                'to': 'force_plot_invisible_refs_vals',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'tent_vias',
-                'types': ANY_LAYER,
-                'to': 'tent_vias',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'check_zone_fills',
-                'types': ANY_LAYER,
-                'to': 'check_zone_fills',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'line_width',
-                'types': ['gerber', 'ps', 'svg', 'pdf'],
-                'to': 'line_width',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'subtract_mask_from_silk',
-                'types': ['gerber'],
-                'to': 'subtract_mask_from_silk',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'mirror_plot',
-                'types': ['ps', 'svg', 'hpgl', 'pdf'],
-                'to': 'mirror_plot',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'negative_plot',
-                'types': ['ps', 'svg', 'pdf'],
-                'to': 'negative_plot',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'sketch_plot',
-                'types': ['ps', 'hpgl'],
-                'to': 'sketch_plot',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'scaling',
-                'types': ['ps', 'hpgl'],
-                'to': 'scaling',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'drill_marks',
-                'types': ['ps', 'svg', 'dxf', 'hpgl', 'pdf'],
-                'to': 'drill_marks',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'use_protel_extensions',
-                'types': ['gerber'],
-                'to': 'use_protel_extensions',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'gerber_precision',
-                'types': ['gerber'],
-                'to': 'gerber_precision',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'create_gerber_job_file',
-                'types': ['gerber'],
-                'to': 'create_gerber_job_file',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'use_gerber_x2_attributes',
-                'types': ['gerber'],
-                'to': 'use_gerber_x2_attributes',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'use_gerber_net_attributes',
-                'types': ['gerber'],
-                'to': 'use_gerber_net_attributes',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'scale_adjust_x',
-                'types': ['ps'],
-                'to': 'scale_adjust_x',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'scale_adjust_y',
-                'types': ['ps'],
-                'to': 'scale_adjust_y',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'width_adjust',
-                'types': ['ps'],
-                'to': 'width_adjust',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'a4_output',
-                'types': ['ps'],
-                'to': 'a4_output',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'pen_width',
-                'types': ['hpgl'],
-                'to': 'pen_width',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'polygon_mode',
-                'types': ['dxf'],
-                'to': 'polygon_mode',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'use_aux_axis_as_origin',
-                'types': ANY_DRILL,
-                'to': 'use_aux_axis_as_origin',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'map',
-                'types': ANY_DRILL,
-                'to': 'map_options',
-                'required': lambda opts: False,
-                'transform': self._parse_drill_map
-            },
-            {
-                'key': 'report',
-                'types': ANY_DRILL,
-                'to': 'report_options',
-                'required': lambda opts: False,
-                'transform': self._parse_drill_report
-            },
-            {
-                'key': 'metric_units',
-                'types': ['excellon'],
-                'to': 'metric_units',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'pth_and_npth_single_file',
-                'types': ['excellon'],
-                'to': 'pth_and_npth_single_file',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'minimal_header',
-                'types': ['excellon'],
-                'to': 'minimal_header',
-                'required': lambda opts: True,
-            },
-            {
-                'key': 'mirror_y_axis',
-                'types': ['excellon'],
-                'to': 'mirror_y_axis',
-                'required': lambda opts: True,
-            },
-        ]
-
         po = PC.OutputOptions(otype)
 
         # options that apply to the specific output type
         to = po.type_options
 
-        self._perform_config_mapping(otype, options, MAPPINGS, to)
+        self._perform_config_mapping(otype, options, to)
 
         return po
 
@@ -342,33 +743,10 @@ class CfgYamlReader(CfgReader):
         Get the pcbnew layer from a string in the config
         """
 
-        D = {
-            'F.Cu': pcbnew.F_Cu,
-            'B.Cu': pcbnew.B_Cu,
-            'F.Adhes': pcbnew.F_Adhes,
-            'B.Adhes': pcbnew.B_Adhes,
-            'F.Paste': pcbnew.F_Paste,
-            'B.Paste': pcbnew.B_Paste,
-            'F.SilkS': pcbnew.F_SilkS,
-            'B.SilkS': pcbnew.B_SilkS,
-            'F.Mask': pcbnew.F_Mask,
-            'B.Mask': pcbnew.B_Mask,
-            'Dwgs.User': pcbnew.Dwgs_User,
-            'Cmts.User': pcbnew.Cmts_User,
-            'Eco1.User': pcbnew.Eco1_User,
-            'Eco2.User': pcbnew.Eco2_User,
-            'Edge.Cuts': pcbnew.Edge_Cuts,
-            'Margin': pcbnew.Margin,
-            'F.CrtYd': pcbnew.F_CrtYd,
-            'B.CrtYd': pcbnew.B_CrtYd,
-            'F.Fab': pcbnew.F_Fab,
-            'B.Fab': pcbnew.B_Fab,
-        }
-
         layer = None
 
-        if s in D:
-            layer = PC.LayerInfo(D[s], False)
+        if s in kicad_defs.LAYER_IDS:
+            layer = PC.LayerInfo(kicad_defs.LAYER_IDS[s], False)
         elif s.startswith("Inner"):
             m = re.match(r"^Inner\.([0-9]+)$", s)
 
@@ -384,21 +762,47 @@ class CfgYamlReader(CfgReader):
 
     def _parse_layer(self, l_obj):
 
+        if not isinstance(l_obj, dict):
+            raise YamlError("Layer needs to be a mapping: {}".format(l_obj))
+
         l_str = self._get_required(l_obj, 'layer')
-        layer_id = self._get_layer_from_str(l_str)
+
+        try:
+            layer_id = self._get_layer_from_str(_string(l_str))
+        except (ValueError, YamlError) as e:
+            raise self._error(str(e), l_obj, 'layer')
+
         layer = PC.LayerConfig(layer_id)
 
-        layer.desc = l_obj['description'] if 'description' in l_obj else None
-        layer.suffix = l_obj['suffix'] if 'suffix' in l_obj else ""
+        layer.desc = None
+        layer.suffix = ""
+
+        for key, to in [('description', 'desc'), ('suffix', 'suffix')]:
+
+            if key not in l_obj:
+                continue
+
+            try:
+                setattr(layer, to, _string(l_obj[key]))
+            except ValueError as e:
+                self._add_error("Bad value for {}: {}".format(key, e),
+                                l_obj, key)
 
         return layer
 
     def _parse_output(self, o_obj):
+        """
+        Parse (and validate) an output. Errors in the options and layers
+        are recorded, others are raised.
+        """
 
-        try:
-            name = o_obj['name']
-        except KeyError:
-            raise self.YamlError("Output needs a name")
+        if not isinstance(o_obj, dict):
+            raise YamlError("Output needs to be a mapping: {}".format(o_obj))
+
+        if 'name' not in o_obj:
+            raise self._error("Output needs a name", o_obj)
+
+        name = self._get_required(o_obj, 'name', _string)
 
         try:
             desc = o_obj['description']
@@ -408,33 +812,49 @@ class CfgYamlReader(CfgReader):
         try:
             otype = o_obj['type']
         except KeyError:
-            raise YamlError("Output needs a type")
+            raise self._error("Output needs a type", o_obj)
 
-        if otype not in ['gerber', 'ps', 'hpgl', 'dxf', 'pdf', 'svg',
-                         'gerb_drill', 'excellon']:
-            raise YamlError("Unknown output type: {}".format(otype))
+        if otype not in OUTPUT_TYPES:
+            raise self._error("Unknown output type: {}".format(otype),
+                              o_obj, 'type')
 
         try:
             options = o_obj['options']
         except KeyError:
-            raise YamlError("Output need to have options specified")
+            raise self._error("Output need to have options specified",
+                              o_obj)
+
+        if not isinstance(options, dict):
+            raise self._error("Output options need to be a mapping",
+                              o_obj, 'options')
 
         logging.debug("Parsing output options for {} ({})".format(name, otype))
 
-        outdir = self._get_required(o_obj, 'dir')
+        outdir = self._get_required(o_obj, 'dir', _string)
 
         output_opts = self._parse_out_opts(otype, options)
 
+        for err in output_opts.validate():
+            self._add_error(err, o_obj, 'options')
+
         o_cfg = PC.PlotOutput(name, desc, otype, output_opts)
         o_cfg.outdir = outdir
 
-        try:
-            layers = o_obj['layers']
-        except KeyError:
-            layers = []
+        layers = o_obj.get('layers') or []
+
+        if not isinstance(layers, list):
+            raise self._error("Layers need to be a list", o_obj, 'layers')
 
         for l in layers:
-            o_cfg.layers.append(self._parse_layer(l))
+            try:
+                o_cfg.layers.append(self._parse_layer(l))
+            except YamlError as e:
+                self._errors += e.errors
+
+        if (getattr(output_opts.type_options, 'single_file', False) and
+                not layers):
+            self._add_error("A single_file output needs layers to merge",
+                            o_obj, 'options')
 
         return o_cfg
 
@@ -442,24 +862,188 @@ class CfgYamlReader(CfgReader):
 
         logging.debug("Parsing preflight options: {}".format(pf))
 
-        if 'check_zone_fills' in pf:
-            cfg.check_zone_fills = pf['check_zone_fills']
+        if not isinstance(pf, dict):
+            raise YamlError("Preflight options need to be a mapping")
+
+        keys = [
+            ('check_zone_fills', _bool),
+            ('run_drc', _bool),
+            ('drc_report', _string),
+            ('ignore_drc_errors', _bool),
+        ]
+
+        for key, value in keys:
+
+            if key not in pf:
+                continue
 
-        if 'run_drc' in pf:
-            cfg.run_drc = pf['run_drc']
+            try:
+                setattr(cfg, key, value(pf[key]))
+            except ValueError as e:
+                self._add_error("Bad value for {}: {}".format(key, e),
+                                pf, key)
+
+    def _read_includes(self, data, base_dir, stack):
+        """
+        Read the templates of a config, or an included fragment, after
+        those of the fragments it includes (recursively)
+
+        :param base_dir: the dir included paths are relative to
+        :param stack: the files being included, to detect loops
+        :return: the outputs, those of the included fragments first
+        """
+
+        includes = data.get('include') or []
+
+        if not isinstance(includes, list):
+            includes = [includes]
+
+        outputs = []
+
+        for inc in includes:
+
+            try:
+                path = os.path.abspath(os.path.join(base_dir, _string(inc)))
+            except ValueError as e:
+                self._add_error("Bad value for include: {}".format(e),
+                                data, 'include')
+                continue
+
+            if path in stack:
+                self._add_error("Include loop: {}".format(
+                    " -> ".join(stack + [path])), data, 'include')
+                continue
+
+            try:
+                stamp, frag = _load_fragment(path)
+            except (IOError, OSError) as e:
+                self._add_error("Can't include {}: {}".format(inc, e),
+                                data, 'include')
+                continue
+            except yaml.YAMLError as e:
+                self._add_error("Error loading YAML: {}".format(e),
+                                data, 'include')
+                continue
+
+            self.includes.append((path, stamp))
+
+            if frag is None:
+                continue
+
+            if not isinstance(frag, dict):
+                self._add_error("Included config needs to be a mapping: {}"
+                                .format(inc), data, 'include')
+                continue
+
+            outputs += self._read_includes(frag, os.path.dirname(path),
+                                           stack + [path])
+
+        templates = data.get('templates') or {}
+
+        if isinstance(templates, dict):
+            self._templates.update(templates)
+        else:
+            self._add_error("Templates need to be a mapping", data,
+                            'templates')
+
+        own_outputs = data.get('outputs') or []
+
+        if isinstance(own_outputs, list):
+            outputs += own_outputs
+        else:
+            self._add_error("Outputs need to be a list", data, 'outputs')
+
+        return outputs
+
+    def _expand_template(self, o_obj):
+        """
+        Get the output an output made from a template stands for. Its
+        own keys override the template's (options are merged).
+        """
+
+        name = o_obj['template']
+
+        try:
+            template = self._templates[name]
+        except (KeyError, TypeError):
+            raise self._error("Unknown template: {}".format(name), o_obj,
+                              'template')
+
+        params = o_obj.get('params') or {}
+
+        if not isinstance(params, dict):
+            raise self._error("Template params need to be a mapping",
+                              o_obj, 'params')
+
+        memo_key = (name, json.dumps(params, sort_keys=True, default=str))
+
+        expanded = self._expanded.get(memo_key)
+
+        if expanded is None:
+            try:
+                expanded = _substitute(template, params)
+            except KeyError as e:
+                raise self._error("Template {} needs a value for {}"
+                                  .format(name, e), o_obj, 'template')
+            except ValueError as e:
+                raise self._error("Bad template {}: {}".format(name, e),
+                                  o_obj, 'template')
+
+            if not isinstance(expanded, dict):
+                raise self._error("Template {} needs to be a mapping"
+                                  .format(name), o_obj, 'template')
+
+            self._expanded[memo_key] = expanded
+
+        own = _MarkedDict(getattr(o_obj, 'mark', None))
+
+        for k, v in o_obj.items():
+
+            if k in ['template', 'params']:
+                continue
+
+            if (k == 'options' and isinstance(v, dict) and
+                    isinstance(expanded.get(k), dict)):
+                v = _merge(expanded[k], v)
+
+            own[k] = v
+
+            if k in getattr(o_obj, 'key_marks', {}):
+                own.key_marks[k] = o_obj.key_marks[k]
+
+        return _merge(expanded, own)
+
+    def _check_archives(self, cfg, o_objs):
+        """
+        Check the outputs archives refer to, which can only be done once all
+        the outputs are read
+        """
+
+        for o_cfg, o_obj in zip(cfg.outputs, o_objs):
+
+            if o_cfg.options.type != PC.OutputOptions.ARCHIVE:
+                continue
+
+            for err in cfg.validate_archive(o_cfg):
+                self._add_error(err, o_obj['options'], 'outputs')
 
     def read(self, fstream):
         """
-        Read a file object into a config object
+        Read a file object into a config object, checking it as it goes
 
         :param fstream: file stream of a config YAML file
+        :raises YamlError: with all the errors found in the config
         """
 
         try:
-            data = yaml.load(fstream)
+            data = yaml.load(fstream, Loader=_Loader)
         except yaml.YAMLError as e:
-            raise YamlError("Error loading YAML")
-            return None
+            raise YamlError("Error loading YAML: {}".format(e))
+
+        self._errors = []
+        self._templates = {}
+        self._expanded = {}
+        self.includes = []
 
         self._check_version(data)
 
@@ -468,9 +1052,109 @@ class CfgYamlReader(CfgReader):
         if 'preflight' in data:
             self._parse_preflight(data['preflight'], cfg)
 
-        for o in data['outputs']:
+        if 'outputs' not in data and 'include' not in data:
+            raise self._error("Value is needed for outputs", data)
+
+        # includes are relative to the config file
+        name = getattr(fstream, 'name', None)
+
+        if name:
+            path = os.path.abspath(name)
+            outputs = self._read_includes(data, os.path.dirname(path), [path])
+        else:
+            outputs = self._read_includes(data, '.', [])
+
+        # the YAML of each output added to the config
+        o_objs = []
+
+        for o in outputs:
+
+            try:
+                if isinstance(o, dict) and 'template' in o:
+                    o = self._expand_template(o)
+
+                op_cfg = self._parse_output(o)
+            except YamlError as e:
+                self._errors += e.errors
+                continue
+
+            # outputs are found by name (by archives, the manifest and
+            # --plan), so names must be unique
+            if cfg.get_output_by_name(op_cfg.name):
+                self._add_error("Duplicate output name: {}".format(
+                    op_cfg.name), o, 'name')
+                continue
 
-            op_cfg = self._parse_output(o)
             cfg.add_output(op_cfg)
+            o_objs.append(o)
+
+        self._check_archives(cfg, o_objs)
+
+        if self._errors:
+            raise YamlError("\n".join(self._errors), self._errors)
 
         return cfg
+
+
+def _includes_unchanged(includes):
+    """
+    Check the files included by a config are as they were when read
+
+    :param includes: (path, (mtime, size)) of each included file
+    """
+
+    for path, stamp in includes:
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+        if (st.st_mtime, st.st_size) != tuple(stamp):
+            return False
+
+    return True
+
+
+def read_file(filename, config_cache=None):
+    """
+    Read a config file
+
+    :param config_cache: a cache.ConfigCache of parsed configs to use, if
+        any. Only valid configs are cached.
+    :raises YamlError: with all the errors found in the config
+    """
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    if config_cache:
+        key = cache.make_key(__version__, str(sys.version_info[0]),
+                             os.path.abspath(filename),
+                             hashlib.sha1(data).hexdigest())
+
+        entry = config_cache.load(key)
+
+        if entry is not None and _includes_unchanged(entry['includes']):
+            logging.debug("Config {} read from cache".format(filename))
+            return entry['config']
+
+    try:
+        fstream = io.StringIO(data.decode('utf-8'))
+    except UnicodeDecodeError as e:
+        raise YamlError("{}: not UTF-8: {}".format(filename, e))
+
+    # for the error positions, and to find included files
+    fstream.name = filename
+
+    reader = CfgYamlReader()
+    cfg = reader.read(fstream)
+
+    if config_cache:
+        config_cache.store(key, {
+            'config': cfg,
+            'includes': reader.includes,
+        })
+        config_cache.prune()
+
+    return cfg
@@ -0,0 +1,403 @@
+"""
+Geometric diffs of the fab outputs (Gerber and Excellon files) of two plot
+runs. Files are compared by what they draw, not by their bytes, so headers,
+attributes, timestamps and aperture numbering don't show up as changes.
+
+Each primitive (flash, draw, arc, region, hit or slot) is reduced to a
+signature (its kind, aperture or tool size, polarity and shape relative to
+its anchor point) and an anchor point, both rounded to the tolerance.
+Primitives found in both runs are matched by hashing, and those left over
+are paired up as moves through a grid index of the new primitives.
+"""
+
+import collections
+import math
+import os
+import re
+
+from . import error
+from . import excellon
+from . import gerber
+from . import kicad_defs
+
+# gerber extensions: plain, Protel copper (gtl, gbl, g2...) and the other
+# Protel layers
+_GERBER_EXT_RE = re.compile(r'^(?:gbr|gtl|gbl|g\d+|{})$'.format(
+    '|'.join(sorted(set(kicad_defs.PROTEL_EXTENSIONS.values())))))
+
+_EXCELLON_EXTS = ['drl']
+
+# a change to a primitive: its kind, a description of its aperture or tool,
+# and where it was and is (None if it wasn't or isn't there)
+Change = collections.namedtuple('Change', ['kind', 'shape', 'old', 'new'])
+
+
+class DiffError(error.KiPlotError):
+    pass
+
+
+class FileDiff(object):
+    """
+    The differences of a file between two runs
+    """
+
+    def __init__(self, name):
+
+        # relative to the output dirs
+        self.name = name
+
+        # 'same', 'changed', 'added' or 'removed' (the file), or 'error'
+        self.status = 'same'
+        self.error = None
+
+        # [Change]
+        self.added = []
+        self.removed = []
+        self.moved = []
+
+    def counts(self):
+        """
+        :return: {kind: [added, removed, moved]} of the primitives changed
+        """
+
+        counts = collections.OrderedDict()
+
+        for i, changes in enumerate([self.added, self.removed, self.moved]):
+            for c in changes:
+                counts.setdefault(c.kind, [0, 0, 0])[i] += 1
+
+        return counts
+
+
+def _file_kind(filename):
+
+    ext = os.path.splitext(filename)[1][1:].lower()
+
+    if _GERBER_EXT_RE.match(ext):
+        return 'gerber'
+
+    if ext in _EXCELLON_EXTS:
+        return 'excellon'
+
+    return None
+
+
+def fab_files(outdir):
+    """
+    :return: the Gerber and Excellon files under a dir, relative to it
+    """
+
+    files = []
+
+    for dirpath, dirnames, filenames in os.walk(outdir):
+
+        # staging dirs, caches and such
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+
+        for fn in filenames:
+            if not fn.startswith('.') and _file_kind(fn):
+                files.append(os.path.relpath(os.path.join(dirpath, fn),
+                                             outdir))
+
+    return sorted(files)
+
+
+def _describe_aperture(ap):
+
+    if ap is None:
+        return '?'
+
+    return "{}({})".format(ap.template, 'x'.join(
+        p if isinstance(p, str) else '{:g}'.format(p) for p in ap.params))
+
+
+def _gerber_primitives(gbr, q):
+    """
+    Get the (signature, anchor) of each primitive of a Gerber file, and a
+    description of each signature's aperture
+
+    :param q: rounds a coordinate to the tolerance
+    """
+
+    prims = []
+    shapes = {}
+
+    def ap_sig(code):
+
+        ap = gbr.apertures.get(code)
+        sig = (ap.template, tuple(
+            p if isinstance(p, str) else q(p) for p in ap.params))
+        shapes[sig] = _describe_aperture(ap)
+        return sig
+
+    f = gbr.flashes
+
+    for i in range(len(f)):
+        prims.append((('flash', ap_sig(f.aperture[i]), f.dark[i]),
+                      (q(f.x[i]), q(f.y[i]))))
+
+    d = gbr.draws
+
+    for i in range(len(d)):
+        # a draw is the same either way round
+        p0, p1 = sorted([(q(d.x0[i]), q(d.y0[i])), (q(d.x1[i]), q(d.y1[i]))])
+        prims.append((('draw', ap_sig(d.aperture[i]), d.dark[i],
+                       p1[0] - p0[0], p1[1] - p0[1]), p0))
+
+    a = gbr.arcs
+
+    for i in range(len(a)):
+        p0 = (q(a.x0[i]), q(a.y0[i]))
+        p1 = (q(a.x1[i]), q(a.y1[i]))
+
+        # an arc is the same drawn clockwise from its end
+        if a.clockwise[i]:
+            p0, p1 = p1, p0
+
+        c = (q(a.cx[i]), q(a.cy[i]))
+        prims.append((('arc', ap_sig(a.aperture[i]), a.dark[i],
+                       p1[0] - p0[0], p1[1] - p0[1],
+                       c[0] - p0[0], c[1] - p0[1]), p0))
+
+    r = gbr.regions
+    pts = gbr.region_points
+
+    for i in range(len(r)):
+        end = r.start[i + 1] if i + 1 < len(r) else len(pts)
+        points = [(q(pts.x[j]), q(pts.y[j])) for j in range(r.start[i], end)]
+        x0, y0 = points[0]
+        prims.append((('region', None, r.dark[i],
+                       tuple((x - x0, y - y0) for x, y in points[1:])),
+                      (x0, y0)))
+
+    return prims, shapes
+
+
+def _excellon_primitives(drill, q):
+    """
+    Like _gerber_primitives, for the holes of a drill file
+    """
+
+    prims = []
+    shapes = {}
+
+    def tool_sig(tool):
+
+        dia = drill.tools.get(tool, 0.0)
+        sig = ('C', (q(dia),))
+        shapes[sig] = 'C({:g})'.format(dia)
+        return sig
+
+    h = drill.hits
+
+    for i in range(len(h)):
+        prims.append((('hit', tool_sig(h.tool[i])), (q(h.x[i]), q(h.y[i]))))
+
+    s = drill.slots
+
+    for i in range(len(s)):
+        p0, p1 = sorted([(q(s.x0[i]), q(s.y0[i])), (q(s.x1[i]), q(s.y1[i]))])
+        prims.append((('slot', tool_sig(s.tool[i]),
+                       p1[0] - p0[0], p1[1] - p0[1]), p0))
+
+    return prims, shapes
+
+
+def _read_primitives(filename, q):
+
+    if _file_kind(filename) == 'gerber':
+        return _gerber_primitives(gerber.read_gerber(filename), q)
+
+    return _excellon_primitives(excellon.read_excellon(filename), q)
+
+
+def _match_moves(removed, added, max_move):
+    """
+    Pair up removed and added primitives with the same signature, whose
+    anchors are at most max_move apart (nearest first)
+
+    :param removed: Counter of the (signature, anchor) removed
+    :param added: Counter of those added
+    :return: [(signature, old anchor, new anchor)] of the moves. The
+        counts of the primitives moved are taken off removed and added.
+    """
+
+    if max_move <= 0:
+        return []
+
+    # {(signature, grid cell): [anchor]} of the primitives added
+    grid = collections.defaultdict(list)
+
+    def cell(p):
+        return (p[0] // max_move, p[1] // max_move)
+
+    for (sig, p), n in added.items():
+        grid[sig, cell(p)] += [p] * n
+
+    moves = []
+
+    for sig, p in sorted(removed.elements()):
+
+        cx, cy = cell(p)
+        best = None
+
+        for gx in range(cx - 1, cx + 2):
+            for gy in range(cy - 1, cy + 2):
+                for new_p in grid.get((sig, (gx, gy)), []):
+                    dist = math.hypot(new_p[0] - p[0], new_p[1] - p[1])
+
+                    if dist <= max_move and (best is None or
+                                             dist < best[0]):
+                        best = (dist, gx, gy, new_p)
+
+        if best is None:
+            continue
+
+        dist, gx, gy, new_p = best
+        grid[sig, (gx, gy)].remove(new_p)
+
+        removed[sig, p] -= 1
+        added[sig, new_p] -= 1
+        moves.append((sig, p, new_p))
+
+    return moves
+
+
+def diff_file(old_file, new_file, name, tol=0.001, max_move=1.0):
+    """
+    Compare a Gerber or Excellon file between runs
+
+    :param tol: coordinates closer than this (in mm) are the same
+    :param max_move: primitives which moved at most this far (in mm) are
+        reported as moved, rather than removed and added
+    :return: FileDiff
+    """
+
+    fd = FileDiff(name)
+
+    def q(v):
+        return int(round(v / tol))
+
+    def p_mm(p):
+        return (p[0] * tol, p[1] * tol)
+
+    try:
+        old, old_shapes = _read_primitives(old_file, q)
+        new, new_shapes = _read_primitives(new_file, q)
+    except error.KiPlotError as e:
+        fd.status = 'error'
+        fd.error = str(e)
+        return fd
+
+    shapes = old_shapes
+    shapes.update(new_shapes)
+
+    old = collections.Counter(old)
+    new = collections.Counter(new)
+
+    same = old & new
+    removed = old - same
+    added = new - same
+
+    # one tolerance step either way is rounding, not a move
+    for sig, p, new_p in _match_moves(removed, added, int(max_move / tol)):
+        if max(abs(new_p[0] - p[0]), abs(new_p[1] - p[1])) > 1:
+            fd.moved.append(Change(sig[0], shapes.get(sig[1], ''),
+                                   p_mm(p), p_mm(new_p)))
+
+    fd.removed = [Change(sig[0], shapes.get(sig[1], ''), p_mm(p), None)
+                  for sig, p in sorted(removed.elements())]
+    fd.added = [Change(sig[0], shapes.get(sig[1], ''), None, p_mm(p))
+                for sig, p in sorted(added.elements())]
+
+    if fd.added or fd.removed or fd.moved:
+        fd.status = 'changed'
+
+    return fd
+
+
+def diff_dirs(old_dir, new_dir, tol=0.001, max_move=1.0):
+    """
+    Compare the Gerber and Excellon files of two output dirs
+
+    :return: [FileDiff] of the files in either dir
+    :raises DiffError: if a dir doesn't exist
+    """
+
+    for d in [old_dir, new_dir]:
+        if not os.path.isdir(d):
+            raise DiffError("Not a dir: {}".format(d))
+
+    old_files = fab_files(old_dir)
+    new_files = fab_files(new_dir)
+
+    diffs = []
+
+    for name in sorted(set(old_files) | set(new_files)):
+
+        if name not in new_files:
+            fd = FileDiff(name)
+            fd.status = 'removed'
+        elif name not in old_files:
+            fd = FileDiff(name)
+            fd.status = 'added'
+        else:
+            fd = diff_file(os.path.join(old_dir, name),
+                           os.path.join(new_dir, name), name, tol, max_move)
+
+        diffs.append(fd)
+
+    return diffs
+
+
+def _format_point(p):
+
+    return "({:.4f}, {:.4f})".format(p[0], p[1])
+
+
+def format_diff(diffs, max_changes=20):
+    """
+    Describe the diffs of a run, for people
+
+    :param max_changes: the changes listed per file (the rest are counted)
+    """
+
+    lines = []
+
+    for fd in diffs:
+
+        if fd.status == 'same':
+            continue
+
+        if fd.status == 'error':
+            lines.append("{}: can't compare: {}".format(fd.name, fd.error))
+            continue
+
+        if fd.status != 'changed':
+            lines.append("{}: {}".format(fd.name, fd.status))
+            continue
+
+        lines.append("{}: {}".format(fd.name, ", ".join(
+            "{} {} added, {} removed, {} moved".format(kind, *n)
+            for kind, n in fd.counts().items())))
+
+        changes = ([('+', c) for c in fd.added] +
+                   [('-', c) for c in fd.removed] +
+                   [('~', c) for c in fd.moved])
+
+        for mark, c in changes[:max_changes]:
+
+            where = " -> ".join(_format_point(p) for p in [c.old, c.new]
+                                if p is not None)
+            lines.append("  {} {} {} {}".format(mark, c.kind, c.shape, where))
+
+        if len(changes) > max_changes:
+            lines.append("  ... and {} more".format(
+                len(changes) - max_changes))
+
+    n_same = len([fd for fd in diffs if fd.status == 'same'])
+
+    lines.append("{} file(s) compared, {} the same".format(len(diffs),
+                                                            n_same))
+
+    return "\n".join(lines)
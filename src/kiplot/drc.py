@@ -0,0 +1,486 @@
+"""
+A design rule check of the copper of a loaded board: clearances between
+items of different nets, and minimum track and via sizes.
+
+The items are reduced to plain shapes (points, a segment or a convex
+polygon, grown by a radius), so the clearance checks don't need pcbnew and
+can be spread over worker processes, each checking a region of the board.
+Items with no net (net 0) are checked against every other item, as they
+are connected to nothing.
+
+Zones are not checked (pcbnew keeps their fills clear of other copper), nor
+the clearance of copper to the board edge.
+"""
+
+import collections
+import logging
+import math
+import multiprocessing
+import os
+
+from . import error
+from . import kicad_defs
+
+
+class DrcError(error.KiPlotError):
+    pass
+
+
+# a copper item, on the given layers:
+# * bbox: (x0, y0, x1, y1), grown by its radius and half the largest
+#   clearance, so items too close to each other have overlapping boxes
+# * points: a point, a segment or a convex polygon
+_Item = collections.namedtuple(
+    '_Item', ['index', 'net', 'layers', 'bbox', 'points', 'radius',
+              'clearance'])
+
+# a clearance violation between the items of the given indices
+Violation = collections.namedtuple(
+    'Violation', ['item_a', 'item_b', 'layer', 'distance', 'required'])
+
+# what the check leaves out, noted in the report
+_NOT_CHECKED = "zones, and the clearance of copper to the board edge"
+
+# the number of regions per worker process, so the workers are kept busy
+# when some regions are much denser than others
+_REGIONS_PER_JOB = 4
+
+
+def _cross(o, a, b):
+
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _point_seg_dist(p, a, b):
+
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    len2 = dx * dx + dy * dy
+
+    if len2:
+        t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / float(len2)
+        t = max(0.0, min(1.0, t))
+    else:
+        t = 0.0
+
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+
+def _segs_cross(a, b, c, d):
+
+    d1 = _cross(c, d, a)
+    d2 = _cross(c, d, b)
+    d3 = _cross(a, b, c)
+    d4 = _cross(a, b, d)
+
+    return d1 * d2 < 0 and d3 * d4 < 0
+
+
+def seg_distance(a, b, c, d):
+    """
+    Get the distance between the segments a-b and c-d
+    """
+
+    if _segs_cross(a, b, c, d):
+        return 0.0
+
+    return min(_point_seg_dist(a, c, d), _point_seg_dist(b, c, d),
+               _point_seg_dist(c, a, b), _point_seg_dist(d, a, b))
+
+
+def _edges(points):
+
+    if len(points) < 3:
+        return [(points[0], points[-1])]
+
+    return list(zip(points, points[1:] + points[:1]))
+
+
+def _contains(poly, p):
+    """
+    Is a point inside a convex polygon (of either winding)?
+    """
+
+    if len(poly) < 3:
+        return False
+
+    sides = set(_cross(a, b, p) > 0 for a, b in _edges(poly)
+                if _cross(a, b, p))
+
+    return len(sides) < 2
+
+
+def item_distance(a, b):
+    """
+    Get the distance between the copper of two items (negative where they
+    overlap)
+    """
+
+    if _contains(a.points, b.points[0]) or _contains(b.points, a.points[0]):
+        d = 0.0
+    else:
+        d = min(seg_distance(p, q, r, s)
+                for p, q in _edges(a.points) for r, s in _edges(b.points))
+
+    return d - a.radius - b.radius
+
+
+def _grid_cell(grid, x, y):
+
+    x0, y0, w, h, n = grid
+
+    return (min(n - 1, max(0, int((x - x0) / w))),
+            min(n - 1, max(0, int((y - y0) / h))))
+
+
+def _make_grid(items, n_regions):
+    """
+    Split the area of the items into (about) n_regions regions
+
+    :return: (x0, y0, region width, region height, regions per side)
+    """
+
+    x0 = min(it.bbox[0] for it in items)
+    y0 = min(it.bbox[1] for it in items)
+    x1 = max(it.bbox[2] for it in items)
+    y1 = max(it.bbox[3] for it in items)
+
+    n = int(math.ceil(math.sqrt(n_regions)))
+
+    return (x0, y0, (x1 - x0) / float(n) or 1.0,
+            (y1 - y0) / float(n) or 1.0, n)
+
+
+def _split_items(grid, items):
+    """
+    Get the items overlapping each region of a grid
+
+    :return: {(column, row): [item]}
+    """
+
+    regions = collections.OrderedDict()
+
+    for it in items:
+
+        c0, r0 = _grid_cell(grid, it.bbox[0], it.bbox[1])
+        c1, r1 = _grid_cell(grid, it.bbox[2], it.bbox[3])
+
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                regions.setdefault((c, r), []).append(it)
+
+    return regions
+
+
+def check_region(grid, cell, items):
+    """
+    Check the clearances between the items in a region of the board. A pair
+    of items in many regions is checked in the one where the overlap of
+    their boxes starts.
+
+    :return: [Violation]
+    """
+
+    by_layer = {}
+
+    for it in items:
+        for layer in it.layers:
+            by_layer.setdefault(layer, []).append(it)
+
+    checked = set()
+    violations = []
+
+    for layer in sorted(by_layer):
+
+        # sweep over the items from left to right, keeping those whose
+        # boxes reach the current one
+        active = []
+
+        for it in sorted(by_layer[layer], key=lambda it: it.bbox[0]):
+
+            active = [a for a in active if a.bbox[2] >= it.bbox[0]]
+
+            for a in active:
+
+                # items with no net aren't connected to each other
+                if ((a.net == it.net and a.net) or a.bbox[1] > it.bbox[3] or
+                        a.bbox[3] < it.bbox[1]):
+                    continue
+
+                pair = (min(a.index, it.index), max(a.index, it.index))
+
+                if pair in checked:
+                    continue
+
+                if _grid_cell(grid, max(a.bbox[0], it.bbox[0]),
+                              max(a.bbox[1], it.bbox[1])) != cell:
+                    continue
+
+                checked.add(pair)
+
+                required = max(a.clearance, it.clearance)
+                d = item_distance(a, it)
+
+                if d < required:
+                    violations.append(
+                        Violation(pair[0], pair[1], layer, d, required))
+
+            active.append(it)
+
+    return violations
+
+
+def _check_region_unit(unit):
+
+    return check_region(*unit)
+
+
+def check_clearances(items, jobs=1):
+    """
+    Check the clearances between items, region by region
+
+    :param jobs: the number of worker processes to use
+    :return: an iterator over the violations of each region, as each is
+        checked
+    """
+
+    if not items:
+        return
+
+    # workers of a pool can't have workers of their own
+    if multiprocessing.current_process().daemon:
+        jobs = 1
+
+    n_regions = jobs * _REGIONS_PER_JOB if jobs > 1 else 1
+
+    grid = _make_grid(items, n_regions)
+    units = [(grid, cell, region_items)
+             for cell, region_items in _split_items(grid, items).items()]
+
+    logging.debug("DRC of {} items in {} regions".format(len(items),
+                                                         len(units)))
+
+    if jobs < 2 or len(units) < 2:
+        for unit in units:
+            yield _check_region_unit(unit)
+        return
+
+    pool = multiprocessing.Pool(min(jobs, len(units)))
+
+    try:
+        for violations in pool.imap_unordered(_check_region_unit, units):
+            yield violations
+
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _rotate(points, pos, angle):
+    """
+    Rotate points (relative to pos) by an angle in tenths of a degree, as
+    pcbnew does, and move them to pos
+    """
+
+    rad = math.radians(angle / 10.0)
+    c = math.cos(rad)
+    s = math.sin(rad)
+
+    return [(pos.x + x * c + y * s, pos.y - x * s + y * c)
+            for x, y in points]
+
+
+def _rect(w, h):
+
+    return [(-w / 2.0, -h / 2.0), (w / 2.0, -h / 2.0),
+            (w / 2.0, h / 2.0), (-w / 2.0, h / 2.0)]
+
+
+def _pad_shape(pad):
+    """
+    :return: (points, radius)
+    """
+
+    pos = pad.GetPosition()
+    size = pad.GetSize()
+    shape = pad.GetShape()
+    angle = pad.GetOrientation()
+
+    if shape == kicad_defs.PAD_SHAPE_CIRCLE:
+        return [(pos.x, pos.y)], size.x / 2.0
+
+    if shape == kicad_defs.PAD_SHAPE_OVAL:
+
+        r = min(size.x, size.y) / 2.0
+
+        if size.x > size.y:
+            points = [(-size.x / 2.0 + r, 0), (size.x / 2.0 - r, 0)]
+        else:
+            points = [(0, -size.y / 2.0 + r), (0, size.y / 2.0 - r)]
+
+        return _rotate(points, pos, angle), r
+
+    if shape == kicad_defs.PAD_SHAPE_ROUNDRECT:
+        r = pad.GetRoundRectCornerRadius()
+        return _rotate(_rect(size.x - 2 * r, size.y - 2 * r), pos, angle), r
+
+    # rectangles, and (the box of) other shapes
+    return _rotate(_rect(size.x, size.y), pos, angle), 0.0
+
+
+def _mm(iu):
+
+    return iu / kicad_defs.IU_PER_MM
+
+
+def _where(points):
+
+    x = sum(p[0] for p in points) / len(points)
+    y = sum(p[1] for p in points) / len(points)
+
+    return "({:.3f}, {:.3f})".format(_mm(x), _mm(y))
+
+
+def _board_items(board):
+    """
+    Get the copper items of a board, and check the sizes of tracks and vias
+
+    :return: ([_Item], [item description], [size violation])
+    """
+
+    copper = [l for l in range(kicad_defs.F_Cu, kicad_defs.B_Cu + 1)
+              if board.IsLayerEnabled(l)]
+
+    settings = board.GetDesignSettings()
+    min_track = getattr(settings, 'm_TrackMinWidth', 0)
+    min_via = getattr(settings, 'm_ViasMinSize', 0)
+    min_drill = getattr(settings, 'm_ViasMinDrill', 0)
+
+    # (net, layers, points, radius, clearance, description)
+    found = []
+    size_errs = []
+
+    for t in board.GetTracks():
+
+        layers = tuple(l for l in copper if t.IsOnLayer(l))
+
+        if t.GetClass() == 'VIA':
+
+            pos = t.GetStart()
+            points = [(pos.x, pos.y)]
+            kind = "via"
+
+            if t.GetWidth() < min_via:
+                size_errs.append("Via at {}: diameter {:.3f} < {:.3f}"
+                                 .format(_where(points), _mm(t.GetWidth()),
+                                         _mm(min_via)))
+
+            if t.GetDrillValue() < min_drill:
+                size_errs.append("Via at {}: drill {:.3f} < {:.3f}"
+                                 .format(_where(points),
+                                         _mm(t.GetDrillValue()),
+                                         _mm(min_drill)))
+        else:
+            start = t.GetStart()
+            end = t.GetEnd()
+            points = [(start.x, start.y), (end.x, end.y)]
+            kind = "track"
+
+            if t.GetWidth() < min_track:
+                size_errs.append("Track at {}: width {:.3f} < {:.3f}"
+                                 .format(_where(points), _mm(t.GetWidth()),
+                                         _mm(min_track)))
+
+        found.append((t.GetNetCode(), layers, points, t.GetWidth() / 2.0,
+                      t.GetClearance(),
+                      "{} ({}) at {}".format(kind, t.GetNetname(),
+                                             _where(points))))
+
+    for pad in board.GetPads():
+
+        if pad.GetAttribute() == kicad_defs.PAD_ATTRIB_HOLE_NOT_PLATED:
+            continue
+
+        layers = tuple(l for l in copper if pad.IsOnLayer(l))
+        points, radius = _pad_shape(pad)
+
+        found.append((pad.GetNetCode(), layers, points, radius,
+                      pad.GetClearance(),
+                      "pad {}-{} ({}) at {}".format(
+                          pad.GetParent().GetReference(), pad.GetName(),
+                          pad.GetNetname(), _where(points))))
+
+    found = [f for f in found if f[1]]
+
+    margin = max(f[4] for f in found) / 2.0 if found else 0
+
+    items = []
+
+    for i, (net, layers, points, radius, clearance, desc) in \
+            enumerate(found):
+
+        grow = radius + margin
+
+        bbox = (min(p[0] for p in points) - grow,
+                min(p[1] for p in points) - grow,
+                max(p[0] for p in points) + grow,
+                max(p[1] for p in points) + grow)
+
+        items.append(_Item(i, net, layers, bbox, points, radius, clearance))
+
+    return items, [f[5] for f in found], size_errs
+
+
+def run_drc(board, report_file, jobs=1):
+    """
+    Check the copper of a board, writing the violations to a report file as
+    they are found. Zones and the clearance to the board edge are not
+    checked.
+
+    :param jobs: the number of worker processes for the clearance checks
+    :return: the number of violations
+    """
+
+    items, descs, size_errs = _board_items(board)
+
+    report_dir = os.path.dirname(report_file)
+
+    if report_dir and not os.path.isdir(report_dir):
+        os.makedirs(report_dir)
+
+    n_violations = 0
+
+    try:
+        f = open(report_file, 'w')
+    except IOError as e:
+        raise DrcError("Can't write DRC report {}: {}".format(report_file, e))
+
+    with f:
+        f.write("DRC report for {}\n".format(board.GetFileName()))
+        f.write("Not checked: {}\n\n".format(_NOT_CHECKED))
+
+        for msg in size_errs:
+            f.write(msg + "\n")
+
+        n_violations += len(size_errs)
+        f.flush()
+
+        for violations in check_clearances(items, jobs):
+
+            for v in violations:
+                f.write("Clearance on {}: {} and {}: {:.3f} < {:.3f}\n"
+                        .format(board.GetLayerName(v.layer),
+                                descs[v.item_a], descs[v.item_b],
+                                _mm(max(0, v.distance)), _mm(v.required)))
+
+            n_violations += len(violations)
+
+            # so the report can be followed while the check runs
+            f.flush()
+
+        f.write("\n{} violation(s)\n".format(n_violations))
+
+    return n_violations
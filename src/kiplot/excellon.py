@@ -0,0 +1,434 @@
+"""
+A reader of Excellon drill files, as the drill writer of pcbnew writes
+them, into tables (arrays) of the holes drilled, in mm. Routed holes (other
+than G85 slots) are not supported.
+
+Drill files can be checked after they are written: the spacing of their
+holes, and their tools against the drill report pcbnew writes.
+"""
+
+import collections
+import logging
+import os
+import re
+
+from . import drc
+from . import error
+from . import gerber
+from . import pcb_reader
+
+# a line: a hit or slot, or any other command
+_HIT_RE = re.compile(r'(?:X([+-]?[\d.]+))?(?:Y([+-]?[\d.]+))?'
+                     r'(?:G85(?:X([+-]?[\d.]+))?(?:Y([+-]?[\d.]+))?)?$')
+
+# a tool definition in the header
+_TOOL_RE = re.compile(r'T(\d+)(?:F[\d.]+|S[\d.]+|B[\d.]+|H[\d.]+)*'
+                      r'C([\d.]+)')
+
+# the format comment pcbnew writes: ; FORMAT={3:3/ absolute / metric /
+# suppress trailing zeros}
+_FORMAT_RE = re.compile(r';\s*FORMAT=\{(\d):(\d)')
+
+# integer and decimal digits of coordinates without a decimal point, when
+# not given (as pcbnew writes them)
+_DEFAULT_DIGITS = {
+    'METRIC': (3, 3),
+    'INCH': (2, 4),
+}
+
+# the drill files of a drill report, and their tools
+_REPORT_FILE_RE = re.compile(r"^Drill file '(.+)' contains", re.MULTILINE)
+_REPORT_TOOL_RE = re.compile(
+    r'^\s*T(\d+)\s+([\d.,]+)mm\s+[\d.,]+"\s+\((\d+) holes?\)'
+    r'(?:\s+\(with (\d+) slots?\))?', re.MULTILINE)
+
+# tool diameters in the report are rounded
+_REPORT_DIAMETER_TOL = 0.01
+
+# the holes used by a tool (hits and slots)
+ToolStats = collections.namedtuple('ToolStats',
+                                   ['tool', 'diameter', 'hits', 'slots'])
+
+# holes closer than the minimum spacing: where they are, and the gap
+# between their edges, in mm
+SpacingViolation = collections.namedtuple('SpacingViolation',
+                                          ['a', 'b', 'gap'])
+
+
+class ExcellonError(error.KiPlotError):
+    pass
+
+
+class Drill(object):
+    """
+    The holes of an Excellon file, in mm
+    """
+
+    def __init__(self):
+
+        # {tool number: diameter}
+        self.tools = {}
+
+        self.hits = gerber.Table([('x', 'd'), ('y', 'd'), ('tool', 'i')])
+        # slots (G85) from (x0, y0) to (x1, y1)
+        self.slots = gerber.Table([('x0', 'd'), ('y0', 'd'), ('x1', 'd'),
+                                   ('y1', 'd'), ('tool', 'i')])
+
+    def tool_stats(self):
+        """
+        :return: [ToolStats] of each tool, in tool order
+        """
+
+        hits = collections.Counter(self.hits.tool)
+        slots = collections.Counter(self.slots.tool)
+
+        return [ToolStats(t, self.tools[t], hits[t], slots[t])
+                for t in sorted(self.tools)]
+
+    def holes(self):
+        """
+        :return: ((x0, y0), (x1, y1), radius) of each hit and slot
+        """
+
+        h = self.hits
+        s = self.slots
+
+        holes = [((h.x[i], h.y[i]), (h.x[i], h.y[i]),
+                  self.tools[h.tool[i]] / 2.0) for i in range(len(h))]
+        holes += [((s.x0[i], s.y0[i]), (s.x1[i], s.y1[i]),
+                   self.tools[s.tool[i]] / 2.0) for i in range(len(s))]
+
+        return holes
+
+
+class _Reader(object):
+    """
+    The state while reading a file
+    """
+
+    def __init__(self, name):
+
+        self.name = name
+        self.drill = Drill()
+
+        self.in_header = False
+        self.units = 'METRIC'
+        # 'LZ': leading zeros are kept (trailing ones left out), 'TZ': the
+        # other way around
+        self.zeros = 'LZ'
+        self.digits = None
+
+        self.tool = None
+        self.x = 0.0
+        self.y = 0.0
+
+    def error(self, msg):
+
+        raise ExcellonError("{}: {}".format(self.name, msg))
+
+    @property
+    def scale(self):
+
+        return gerber.MM_PER_INCH if self.units == 'INCH' else 1.0
+
+    def coord(self, s):
+
+        if '.' in s:
+            return float(s) * self.scale
+
+        n_int, n_dec = self.digits or _DEFAULT_DIGITS[self.units]
+
+        if self.zeros == 'LZ':
+            sign = s[:1] if s[:1] in ['+', '-'] else ''
+            s = sign + s[len(sign):].ljust(n_int + n_dec, '0')
+
+        return int(s) * self.scale / 10 ** n_dec
+
+    def header_line(self, line):
+
+        m = _FORMAT_RE.match(line)
+
+        if m:
+            self.digits = (int(m.group(1)), int(m.group(2)))
+            return
+
+        if line.startswith(';'):
+            return
+
+        if line in ['%', 'M95']:
+            self.in_header = False
+            return
+
+        fields = line.split(',')
+
+        if fields[0] in ['METRIC', 'INCH']:
+            self.units = fields[0]
+
+            if len(fields) > 1 and fields[1] in ['LZ', 'TZ']:
+                self.zeros = fields[1]
+
+            return
+
+        m = _TOOL_RE.match(line)
+
+        if m:
+            # tool diameters are in the file's units
+            self.drill.tools[int(m.group(1))] = (float(m.group(2)) *
+                                                 self.scale)
+
+        # the rest (FMAT, versions, comments) don't change what is read
+
+    def body_line(self, line):
+
+        if line.startswith(';'):
+            return
+
+        if line.startswith('T'):
+            tool = int(line[1:])
+
+            if tool and tool not in self.drill.tools:
+                self.error("tool T{} is not defined".format(tool))
+
+            self.tool = tool
+            return
+
+        if line[0] in 'XY':
+            self.hit(line)
+        elif line in ['M15', 'M16'] or line.startswith('G00'):
+            self.error("routed holes are not supported")
+
+        # the rest (G90, G05, M30) don't change what is read
+
+    def hit(self, line):
+
+        m = _HIT_RE.match(line)
+
+        if not m:
+            self.error("can't read {}".format(line))
+
+        if not self.tool:
+            self.error("hole with no tool selected")
+
+        if m.group(1):
+            self.x = self.coord(m.group(1))
+        if m.group(2):
+            self.y = self.coord(m.group(2))
+
+        if m.group(3) or m.group(4):
+            x0 = self.x
+            y0 = self.y
+
+            if m.group(3):
+                self.x = self.coord(m.group(3))
+            if m.group(4):
+                self.y = self.coord(m.group(4))
+
+            self.drill.slots.append(x0, y0, self.x, self.y, self.tool)
+        else:
+            self.drill.hits.append(self.x, self.y, self.tool)
+
+
+def parse_excellon(data, name='<excellon>'):
+    """
+    Read Excellon data
+
+    :param data: the file's contents, as bytes (or a buffer of them)
+    :param name: the name of the data, for errors
+    :return: Drill
+    :raises ExcellonError: if the data isn't understood
+    """
+
+    reader = _Reader(name)
+
+    for line in data[:].decode('ascii', 'replace').splitlines():
+
+        line = line.strip()
+
+        if not line:
+            continue
+
+        if line == 'M48':
+            reader.in_header = True
+        elif reader.in_header:
+            reader.header_line(line)
+        else:
+            reader.body_line(line)
+
+    return reader.drill
+
+
+def read_excellon(filename):
+    """
+    Read an Excellon file
+
+    :return: Drill
+    :raises ExcellonError: if the file can't be read
+    """
+
+    try:
+        with pcb_reader.mapped_file(filename) as buf:
+            return parse_excellon(buf, filename)
+    except (IOError, OSError, ValueError) as e:
+        raise ExcellonError("Can't read Excellon file {}: {}"
+                            .format(filename, e))
+
+
+def check_spacing(holes, min_gap):
+    """
+    Find holes closer than a minimum gap (edge to edge), through a grid
+    index, so only the holes near each other are compared
+
+    :param holes: ((x0, y0), (x1, y1), radius) of each hole
+    :param min_gap: in mm
+    :return: [SpacingViolation]
+    """
+
+    if not holes:
+        return []
+
+    size = max(r for p0, p1, r in holes) * 2 + min_gap
+
+    # {cell: [index of each hole whose box (grown by the gap) is in it]}
+    grid = collections.defaultdict(list)
+
+    for i, (p0, p1, r) in enumerate(holes):
+
+        grow = r + min_gap
+
+        for cx in range(int((min(p0[0], p1[0]) - grow) // size),
+                        int((max(p0[0], p1[0]) + grow) // size) + 1):
+            for cy in range(int((min(p0[1], p1[1]) - grow) // size),
+                            int((max(p0[1], p1[1]) + grow) // size) + 1):
+                grid[cx, cy].append(i)
+
+    checked = set()
+    violations = []
+
+    for cell_holes in grid.values():
+        for n, i in enumerate(cell_holes):
+            for j in cell_holes[n + 1:]:
+
+                if (i, j) in checked:
+                    continue
+
+                checked.add((i, j))
+
+                a0, a1, ra = holes[i]
+                b0, b1, rb = holes[j]
+
+                gap = drc.seg_distance(a0, a1, b0, b1) - ra - rb
+
+                if gap < min_gap:
+                    violations.append(SpacingViolation(a0, b0, gap))
+
+    return sorted(violations)
+
+
+def read_drill_report(filename):
+    """
+    Read the tools of each drill file from a drill report
+    (GenDrillReportFile)
+
+    :return: {drill file name: [ToolStats]}, the hits of each tool
+        counting its slots, as the report does
+    :raises ExcellonError: if the report can't be read
+    """
+
+    try:
+        with open(filename) as f:
+            text = f.read()
+    except (IOError, OSError) as e:
+        raise ExcellonError("Can't read drill report {}: {}"
+                            .format(filename, e))
+
+    files = {}
+    starts = list(_REPORT_FILE_RE.finditer(text))
+
+    for n, m in enumerate(starts):
+
+        end = starts[n + 1].start() if n + 1 < len(starts) else len(text)
+
+        files[m.group(1)] = [
+            ToolStats(int(t.group(1)), float(t.group(2).replace(',', '.')),
+                      int(t.group(3)), int(t.group(4) or 0))
+            for t in _REPORT_TOOL_RE.finditer(text, m.end(), end)]
+
+    return files
+
+
+def compare_with_report(name, drill, report_tools):
+    """
+    Compare the tools of a drill file with those of its drill report
+
+    :param report_tools: [ToolStats] from the report
+    :return: a message for each difference
+    """
+
+    problems = []
+
+    # the report doesn't list unused tools
+    stats = dict((s.tool, s) for s in drill.tool_stats()
+                 if s.hits or s.slots)
+    reported = dict((s.tool, s) for s in report_tools)
+
+    for tool in sorted(set(stats) | set(reported)):
+
+        s = stats.get(tool)
+        r = reported.get(tool)
+
+        if s is None or r is None:
+            problems.append("{}: T{} is {}".format(
+                name, tool, "only in the report" if s is None
+                else "not in the report"))
+        elif abs(s.diameter - r.diameter) > _REPORT_DIAMETER_TOL:
+            problems.append("{}: T{} is {:.3f}mm, the report has {:.3f}mm"
+                            .format(name, tool, s.diameter, r.diameter))
+        elif (s.hits + s.slots, s.slots) != (r.hits, r.slots):
+            problems.append(
+                "{}: T{} has {} holes ({} slots), the report has {} ({})"
+                .format(name, tool, s.hits + s.slots, s.slots, r.hits,
+                        r.slots))
+
+    return problems
+
+
+def verify_drill_files(filenames, report_file=None, min_hole_spacing=0.0):
+    """
+    Check drill files: the spacing of their holes, and their tools against
+    the drill report (if given)
+
+    :param min_hole_spacing: the least gap between holes in mm (0: not
+        checked)
+    :return: a message for each problem found
+    :raises ExcellonError: if a file can't be read
+    """
+
+    report = read_drill_report(report_file) if report_file else None
+    problems = []
+
+    for filename in filenames:
+
+        name = os.path.basename(filename)
+        drill = read_excellon(filename)
+
+        for s in drill.tool_stats():
+            logging.debug("{}: T{} {:.3f}mm, {} hits, {} slots".format(
+                name, s.tool, s.diameter, s.hits, s.slots))
+
+        if min_hole_spacing > 0:
+            for v in check_spacing(drill.holes(), min_hole_spacing):
+                problems.append(
+                    "{}: holes at ({:.4f}, {:.4f}) and ({:.4f}, {:.4f}) "
+                    "are {:.4f}mm apart".format(name, v.a[0], v.a[1],
+                                                v.b[0], v.b[1], v.gap))
+
+        if report is not None:
+            problems += compare_with_report(name, drill,
+                                            report.get(name, []))
+
+    if report is not None:
+        names = set(os.path.basename(f) for f in filenames)
+        problems += ["{}: in the report, but not written".format(name)
+                     for name in sorted(set(report) - names)]
+
+    return problems
@@ -0,0 +1,431 @@
+"""
+A reader of Gerber (RS-274X) files, for checking plotted files without an
+external viewer. The file is memory mapped and read block by block into
+compact tables (arrays) of its flashes, draws, arcs and regions, in mm.
+
+Step and repeat (%SR) and the deprecated single quadrant mode (G74) are not
+supported: pcbnew doesn't write them.
+"""
+
+import array
+import bisect
+import collections
+import re
+
+from . import error
+from . import pcb_reader
+
+# a block: an extended command (%...%), an operation with its coordinates,
+# or any other word command
+_BLOCK_RE = re.compile(
+    br'\s*(?:%(?P<ext>[^%]*)%'
+    br'|(?:G0?(?P<g>[123]))?(?:X(?P<x>[+-]?\d+))?(?:Y(?P<y>[+-]?\d+))?'
+    br'(?:I(?P<i>[+-]?\d+))?(?:J(?P<j>[+-]?\d+))?D0?(?P<d>[123])\*'
+    br'|(?P<word>[^%*]*)\*)')
+
+# an aperture definition: code, template name and its parameters
+_AD_RE = re.compile(r'ADD(\d+)([^,]+)(?:,(.*))?$')
+
+# a word command: a D code (aperture selection) or a G code
+_WORD_RE = re.compile(r'(?:G0*(\d+))?(?:D0*(\d+))?$')
+
+# the standard aperture templates (the others are macros)
+TEMPLATES = ['C', 'R', 'O', 'P']
+
+MM_PER_INCH = 25.4
+
+Aperture = collections.namedtuple('Aperture', ['template', 'params'])
+
+
+class GerberError(error.KiPlotError):
+    pass
+
+
+class Table(object):
+    """
+    Columns of numbers, each kept in an array
+
+    :param columns: (name, array type code) of each column
+    """
+
+    def __init__(self, columns):
+
+        self.columns = [name for name, typecode in columns]
+
+        for name, typecode in columns:
+            setattr(self, name, array.array(typecode))
+
+        self._arrays = [getattr(self, name) for name in self.columns]
+
+    def append(self, *values):
+
+        for a, v in zip(self._arrays, values):
+            a.append(v)
+
+    def __len__(self):
+
+        return len(self._arrays[0])
+
+    def row(self, index):
+
+        return tuple(a[index] for a in self._arrays)
+
+
+class Gerber(object):
+    """
+    What is drawn by a Gerber file. Coordinates and aperture sizes are in
+    mm, whatever the file's units. The dark columns are 1 for dark
+    polarity, 0 for clear.
+    """
+
+    def __init__(self):
+
+        # {D code: Aperture}, macro parameters are kept as they are
+        self.apertures = {}
+        # {name: [values]} of the file attributes (%TF)
+        self.file_attributes = {}
+
+        self.flashes = Table([('x', 'd'), ('y', 'd'), ('aperture', 'i'),
+                              ('dark', 'b')])
+        self.draws = Table([('x0', 'd'), ('y0', 'd'), ('x1', 'd'),
+                            ('y1', 'd'), ('aperture', 'i'), ('dark', 'b')])
+        # arcs from (x0, y0) to (x1, y1) around (cx, cy)
+        self.arcs = Table([('x0', 'd'), ('y0', 'd'), ('x1', 'd'),
+                           ('y1', 'd'), ('cx', 'd'), ('cy', 'd'),
+                           ('clockwise', 'b'), ('aperture', 'i'),
+                           ('dark', 'b')])
+        # the points of the regions' contours (arcs are not interpolated):
+        # each region has one contour, starting at the given point
+        self.region_points = Table([('x', 'd'), ('y', 'd')])
+        self.regions = Table([('start', 'i'), ('dark', 'b')])
+
+        # flash indices, sorted by x, and their x (built when needed)
+        self._flash_order = None
+        self._flash_xs = None
+
+    def find_aperture(self, template, params=(), tol=1e-6):
+        """
+        Find an aperture by its template and parameters
+
+        :return: the lowest D code of such an aperture, None if none
+        """
+
+        for code in sorted(self.apertures):
+
+            ap = self.apertures[code]
+
+            if (ap.template == template and
+                    len(ap.params) == len(params) and
+                    all(abs(a - b) <= tol
+                        for a, b in zip(ap.params, params))):
+                return code
+
+        return None
+
+    def _index_flashes(self):
+
+        if self._flash_order is None or (len(self._flash_order) !=
+                                         len(self.flashes)):
+            xs = self.flashes.x
+            self._flash_order = sorted(range(len(xs)), key=xs.__getitem__)
+            self._flash_xs = [xs[i] for i in self._flash_order]
+
+    def flashes_at(self, x, y, aperture=None, tol=1e-3):
+        """
+        Find the flashes at a point
+
+        :param aperture: the D code of the flashes (None: any)
+        :param tol: the distance in x and y from the point, in mm
+        :return: the indices of the flashes
+        """
+
+        self._index_flashes()
+
+        lo = bisect.bisect_left(self._flash_xs, x - tol)
+        hi = bisect.bisect_right(self._flash_xs, x + tol)
+
+        found = [i for i in self._flash_order[lo:hi]
+                 if abs(self.flashes.y[i] - y) <= tol and
+                 (aperture is None or self.flashes.aperture[i] == aperture)]
+
+        return sorted(found)
+
+    def counts(self):
+        """
+        :return: {aperture D code: number of flashes, draws and arcs with
+            it}
+        """
+
+        counts = collections.Counter(self.flashes.aperture)
+        counts.update(self.draws.aperture)
+        counts.update(self.arcs.aperture)
+
+        return dict(counts)
+
+    def bbox(self):
+        """
+        :return: (x0, y0, x1, y1) of the coordinates used (not counting
+            the aperture sizes), None if nothing is drawn
+        """
+
+        xs = []
+        ys = []
+
+        for t, cols in [(self.flashes, [('x', 'y')]),
+                        (self.draws, [('x0', 'y0'), ('x1', 'y1')]),
+                        (self.arcs, [('x0', 'y0'), ('x1', 'y1')]),
+                        (self.region_points, [('x', 'y')])]:
+            for cx, cy in cols:
+                if len(t):
+                    xs += [min(getattr(t, cx)), max(getattr(t, cx))]
+                    ys += [min(getattr(t, cy)), max(getattr(t, cy))]
+
+        if not xs:
+            return None
+
+        return (min(xs), min(ys), max(xs), max(ys))
+
+
+class _Reader(object):
+    """
+    The graphics state while reading a file
+    """
+
+    def __init__(self, name):
+
+        self.name = name
+        self.gbr = Gerber()
+
+        # integer and decimal digits of the coordinates, None until the
+        # format is given
+        self.digits = None
+        self.omit_trailing = False
+        self.scale = 1.0
+
+        self.x = 0.0
+        self.y = 0.0
+        self.interpolation = 1
+        self.aperture = None
+        self.dark = 1
+        self.in_region = False
+        self.contour_open = False
+
+    def error(self, msg):
+
+        raise GerberError("{}: {}".format(self.name, msg))
+
+    def coord(self, s):
+
+        if self.digits is None:
+            self.error("coordinates before the format (%FS)")
+
+        n_int, n_dec = self.digits
+
+        if self.omit_trailing:
+            sign = s[:1] if s[:1] in '+-' else ''
+            s = sign + s[len(sign):].ljust(n_int + n_dec, '0')
+
+        return int(s) * self.scale / 10 ** n_dec
+
+    def extended(self, cmd):
+
+        # an extended command might hold many blocks, each ending with *
+        cmd = cmd.strip()
+        code = cmd[:2]
+
+        if code == 'FS':
+            m = re.match(r'FS([LT])A(?:N\d+)?(?:G\d+)?X(\d)(\d)Y(\d)(\d)\*',
+                         cmd)
+
+            if not m:
+                self.error("unsupported format {}".format(cmd))
+
+            self.omit_trailing = m.group(1) == 'T'
+            self.digits = (int(m.group(2)), int(m.group(3)))
+        elif code == 'MO':
+            self.scale = MM_PER_INCH if cmd.startswith('MOIN') else 1.0
+        elif code == 'AD':
+            self.define_aperture(cmd.rstrip('*'))
+        elif code == 'LP':
+            self.dark = 0 if cmd.startswith('LPC') else 1
+        elif code == 'TF':
+            fields = cmd[2:].rstrip('*').split(',')
+            self.gbr.file_attributes[fields[0]] = fields[1:]
+        elif code == 'SR' and cmd.strip('*') != 'SR':
+            self.error("step and repeat is not supported")
+
+        # the rest (macros, other attributes, image settings) don't change
+        # what is read
+
+    def define_aperture(self, cmd):
+
+        m = _AD_RE.match(cmd)
+
+        if not m:
+            self.error("bad aperture definition {}".format(cmd))
+
+        template = m.group(2)
+        params = m.group(3).split('X') if m.group(3) else []
+
+        if template in TEMPLATES:
+            params = [float(p) for p in params]
+
+            # sizes scale with the units, vertex counts and rotations don't
+            for i in range(len(params)):
+                if not (template == 'P' and i in [1, 2]):
+                    params[i] *= self.scale
+
+        self.gbr.apertures[int(m.group(1))] = Aperture(template,
+                                                       tuple(params))
+
+    def word(self, cmd):
+
+        cmd = cmd.strip()
+
+        if not cmd or cmd.startswith('G04') or cmd.startswith('M0'):
+            return
+
+        m = _WORD_RE.match(cmd)
+
+        if not m or not (m.group(1) or m.group(2)):
+            self.error("unsupported command {}".format(cmd))
+
+        if m.group(1):
+            self.g_code(int(m.group(1)))
+
+        if m.group(2):
+            self.select_aperture(int(m.group(2)))
+
+    def g_code(self, g):
+
+        if g in [1, 2, 3]:
+            self.interpolation = g
+        elif g == 36:
+            self.in_region = True
+            self.contour_open = False
+        elif g == 37:
+            self.in_region = False
+        elif g == 74:
+            self.error("single quadrant mode (G74) is not supported")
+
+        # the rest (G75, G54 and the deprecated units and modes) don't
+        # change what is read
+
+    def select_aperture(self, code):
+
+        if code not in self.gbr.apertures:
+            self.error("D{} is not defined".format(code))
+
+        self.aperture = code
+
+    def operation(self, m):
+
+        if m.group('g'):
+            self.interpolation = int(m.group('g'))
+
+        x0 = self.x
+        y0 = self.y
+
+        if m.group('x'):
+            self.x = self.coord(m.group('x').decode('ascii'))
+        if m.group('y'):
+            self.y = self.coord(m.group('y').decode('ascii'))
+
+        d = int(m.group('d'))
+
+        if self.in_region:
+            self.region_operation(d, x0, y0)
+            return
+
+        if d == 2:
+            return
+
+        if self.aperture is None:
+            self.error("drawing with no aperture selected")
+
+        gbr = self.gbr
+
+        if d == 3:
+            gbr.flashes.append(self.x, self.y, self.aperture, self.dark)
+        elif self.interpolation == 1:
+            gbr.draws.append(x0, y0, self.x, self.y, self.aperture,
+                             self.dark)
+        else:
+            cx, cy = self.arc_center(m, x0, y0)
+            gbr.arcs.append(x0, y0, self.x, self.y, cx, cy,
+                            1 if self.interpolation == 2 else 0,
+                            self.aperture, self.dark)
+
+    def arc_center(self, m, x0, y0):
+
+        i = m.group('i')
+        j = m.group('j')
+
+        return (x0 + (self.coord(i.decode('ascii')) if i else 0.0),
+                y0 + (self.coord(j.decode('ascii')) if j else 0.0))
+
+    def region_operation(self, d, x0, y0):
+
+        gbr = self.gbr
+
+        if d == 3:
+            self.error("flash in a region")
+
+        if d == 2:
+            self.contour_open = False
+            return
+
+        if not self.contour_open:
+            gbr.regions.append(len(gbr.region_points), self.dark)
+            gbr.region_points.append(x0, y0)
+            self.contour_open = True
+
+        gbr.region_points.append(self.x, self.y)
+
+
+def parse_gerber(data, name='<gerber>'):
+    """
+    Read Gerber data
+
+    :param data: the file's contents, as bytes (or a buffer of them)
+    :param name: the name of the data, for errors
+    :return: Gerber
+    :raises GerberError: if the data isn't understood
+    """
+
+    reader = _Reader(name)
+    pos = 0
+
+    for m in _BLOCK_RE.finditer(data):
+
+        if m.start() != pos:
+            break
+
+        pos = m.end()
+
+        if m.group('d'):
+            reader.operation(m)
+        elif m.group('ext') is not None:
+            reader.extended(m.group('ext').decode('ascii', 'replace'))
+        else:
+            reader.word(m.group('word').decode('ascii', 'replace'))
+
+    if data[pos:].strip():
+        reader.error("can't read from byte {}".format(pos))
+
+    return reader.gbr
+
+
+def read_gerber(filename):
+    """
+    Read a Gerber file
+
+    :return: Gerber
+    :raises GerberError: if the file can't be read
+    """
+
+    try:
+        with pcb_reader.mapped_file(filename) as buf:
+            return parse_gerber(buf, filename)
+    except (IOError, OSError, ValueError) as e:
+        raise GerberError("Can't read Gerber file {}: {}".format(filename, e))
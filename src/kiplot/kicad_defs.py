@@ -0,0 +1,133 @@
+"""
+The pcbnew constants KiPlot needs to read a config, as a plain table, so
+configs can be parsed and checked without importing pcbnew (which is slow,
+and might not be installed). These are the values of KiCad 5.
+"""
+
+# pcbnew internal units (nm) per mm
+IU_PER_MM = 1e6
+
+# layer IDs (PCB_LAYER_ID)
+F_Cu = 0
+B_Cu = 31
+B_Adhes = 32
+F_Adhes = 33
+B_Paste = 34
+F_Paste = 35
+B_SilkS = 36
+F_SilkS = 37
+B_Mask = 38
+F_Mask = 39
+Dwgs_User = 40
+Cmts_User = 41
+Eco1_User = 42
+Eco2_User = 43
+Edge_Cuts = 44
+Margin = 45
+B_CrtYd = 46
+F_CrtYd = 47
+B_Fab = 48
+F_Fab = 49
+
+# the layer IDs of the named (not inner) layers, by config name
+LAYER_IDS = {
+    'F.Cu': F_Cu,
+    'B.Cu': B_Cu,
+    'F.Adhes': F_Adhes,
+    'B.Adhes': B_Adhes,
+    'F.Paste': F_Paste,
+    'B.Paste': B_Paste,
+    'F.SilkS': F_SilkS,
+    'B.SilkS': B_SilkS,
+    'F.Mask': F_Mask,
+    'B.Mask': B_Mask,
+    'Dwgs.User': Dwgs_User,
+    'Cmts.User': Cmts_User,
+    'Eco1.User': Eco1_User,
+    'Eco2.User': Eco2_User,
+    'Edge.Cuts': Edge_Cuts,
+    'Margin': Margin,
+    'F.CrtYd': F_CrtYd,
+    'B.CrtYd': B_CrtYd,
+    'F.Fab': F_Fab,
+    'B.Fab': B_Fab,
+}
+
+# plot formats (PlotFormat)
+PLOT_FORMAT_HPGL = 0
+PLOT_FORMAT_GERBER = 1
+PLOT_FORMAT_POST = 2
+PLOT_FORMAT_DXF = 3
+PLOT_FORMAT_PDF = 4
+PLOT_FORMAT_SVG = 5
+
+# plot file extensions (GetDefaultPlotExtension)
+PLOT_EXTENSIONS = {
+    PLOT_FORMAT_HPGL: 'plt',
+    PLOT_FORMAT_GERBER: 'gbr',
+    PLOT_FORMAT_POST: 'ps',
+    PLOT_FORMAT_DXF: 'dxf',
+    PLOT_FORMAT_PDF: 'pdf',
+    PLOT_FORMAT_SVG: 'svg',
+}
+
+# Protel gerber extensions of the non-copper layers
+# (GetGerberProtelExtension), 'gbr' for the others
+PROTEL_EXTENSIONS = {
+    B_Adhes: 'gba',
+    F_Adhes: 'gta',
+    B_Paste: 'gbp',
+    F_Paste: 'gtp',
+    B_SilkS: 'gbo',
+    F_SilkS: 'gto',
+    B_Mask: 'gbs',
+    F_Mask: 'gts',
+    Edge_Cuts: 'gm1',
+}
+
+# drill marks (PCB_PLOT_PARAMS::DrillMarksType)
+NO_DRILL_SHAPE = 0
+SMALL_DRILL_SHAPE = 1
+FULL_DRILL_SHAPE = 2
+
+# pad shapes (PAD_SHAPE_T)
+PAD_SHAPE_CIRCLE = 0
+PAD_SHAPE_RECT = 1
+PAD_SHAPE_OVAL = 2
+PAD_SHAPE_TRAPEZOID = 3
+PAD_SHAPE_ROUNDRECT = 4
+
+# pad attributes (PAD_ATTR_T)
+PAD_ATTRIB_STANDARD = 0
+PAD_ATTRIB_SMD = 1
+PAD_ATTRIB_CONN = 2
+PAD_ATTRIB_HOLE_NOT_PLATED = 3
+
+
+def FromMM(mm):
+    """
+    Convert mm to pcbnew internal units, as pcbnew.FromMM does
+    """
+
+    return int(float(mm) * IU_PER_MM)
+
+
+def IsCopperLayer(layer):
+    return F_Cu <= layer <= B_Cu
+
+
+def GetGerberProtelExtension(layer):
+    """
+    Get the Protel extension of a layer's gerber, as pcbnew does
+    """
+
+    if layer == F_Cu:
+        return 'gtl'
+
+    if layer == B_Cu:
+        return 'gbl'
+
+    if IsCopperLayer(layer):
+        return 'g{}'.format(layer + 1)
+
+    return PROTEL_EXTENSIONS.get(layer, 'gbr')
@@ -2,11 +2,31 @@
 Main Kiplot code
 """
 
+import collections
 import logging
+import multiprocessing
 import os
+import shutil
+import tempfile
+import time
+import traceback
 
 from . import plot_config as PCfg
+from . import archive
+from . import cache
+from . import drc
 from . import error
+from . import excellon
+from . import kicad_defs
+from . import manifest
+from . import merge
+from . import pcb_reader
+from . import plan
+from . import preview
+from . import timing
+from . import writer
+from . import zone_fill
+from .__version__ import __version__
 
 try:
     import pcbnew
@@ -20,6 +40,111 @@ class PlotError(error.KiPlotError):
     pass
 
 
+# for the time outputs take to plot
+_clock = getattr(time, 'perf_counter', time.time)
+
+# the drill verification problems to report
+_MAX_VERIFY_PROBLEMS = 10
+
+
+class _PlotParams(object):
+    """
+    Records the PCB_PLOT_PARAMS setter calls made to configure an output, so
+    the settings of outputs can be compared without touching pcbnew
+    """
+
+    def __init__(self):
+
+        # setter name: args, in the order first set
+        self.values = collections.OrderedDict()
+
+    def __getattr__(self, name):
+
+        if not name.startswith('Set'):
+            raise AttributeError(name)
+
+        def setter(*args):
+            self.values[name] = args
+
+        return setter
+
+
+class _PlotSession(object):
+    """
+    A plot controller shared by the outputs plotted from a board. Only the
+    plot params which differ from those already set are applied.
+    """
+
+    def __init__(self, board):
+
+        self._board = board
+        self._plot_ctrl = None
+
+        # setter name: args last applied
+        self._applied = {}
+
+        # the setters of the output last configured
+        self._configured = set()
+
+    @property
+    def plot_ctrl(self):
+
+        if self._plot_ctrl is None:
+            self._plot_ctrl = pcbnew.PLOT_CONTROLLER(self._board)
+
+        return self._plot_ctrl
+
+    def set_params(self, params):
+        """
+        :param params: {setter name: args}, as recorded by _PlotParams
+        """
+
+        po = self.plot_ctrl.GetPlotOptions()
+
+        for setter, args in params.items():
+
+            if self._applied.get(setter) == args:
+                continue
+
+            getattr(po, setter)(*args)
+            self._applied[setter] = args
+
+    def configure(self, params):
+        """
+        Set the plot params of an output. A param set by an earlier output
+        but not by this one can't be put back to its default, so that
+        needs a fresh plot controller.
+        """
+
+        if self._configured - set(params):
+            logging.debug("New plot controller for output")
+            self._plot_ctrl = None
+            self._applied = {}
+
+        self._configured = set(params)
+        self.set_params(params)
+
+
+def _check_kicad_defs():
+    """
+    Configs are read with our own table of pcbnew constants: check this
+    pcbnew agrees with it
+    """
+
+    names = ['F_Cu', 'B_Cu', 'F_SilkS', 'Edge_Cuts', 'F_Fab',
+             'PLOT_FORMAT_HPGL', 'PLOT_FORMAT_GERBER', 'PLOT_FORMAT_SVG']
+
+    for name in names:
+        if getattr(pcbnew, name) != getattr(kicad_defs, name):
+            logging.warning("pcbnew.{} is {}, expected {}: this version of "
+                            "pcbnew is not supported".format(
+                                name, getattr(pcbnew, name),
+                                getattr(kicad_defs, name)))
+
+
+_check_kicad_defs()
+
+
 class Plotter(object):
     """
     Main Plotter class - this is what will perform the plotting
@@ -28,44 +153,742 @@ class Plotter(object):
     def __init__(self, cfg):
         self.cfg = cfg
 
+        # number of worker processes to plot outputs with (1: in-process)
+        self.jobs = 1
+
+        # number of parts to split the layers of each layer output into,
+        # to plot in parallel (1: don't split)
+        self.layer_jobs = 1
+
+        # cache of plotted output files (None: always plot)
+        self.cache = None
+
+        # only plot outputs that changed since the last plot into the
+        # output dir (as recorded in its manifest)
+        self.incremental = False
+
+        # loaded boards to reuse (None: load the board for each plot)
+        self.board_cache = None
+
+        # a (local) dir to plot into, the files are then moved to the
+        # output dir in the background (None: plot into the output dir)
+        self.scratch_dir = None
+
+        self._brd_digest = None
+        self._brd_name = None
+        self._manifest = None
+
+        # (output index, OutputArchive) of the archives being written
+        self._archives = []
+
+        # the OutputWriter moving files from the scratch dir, if any
+        self._writer = None
+
+        # units of work not done yet (plotted and written), and the files
+        # plotted (None if a unit failed) and time taken so far, of each
+        # output
+        self._units_left = collections.Counter()
+        self._op_files = {}
+        self._op_seconds = collections.Counter()
+
     def plot(self, brd_file):
 
         logging.debug("Starting plot of board {}".format(brd_file))
 
-        board = pcbnew.LoadBoard(brd_file)
+        if self.cache or self.incremental:
+            self._brd_digest = cache.file_digest(brd_file)
+            self._brd_name = os.path.basename(brd_file)
+
+        if self.incremental:
+            self._manifest = manifest.Manifest(self.cfg.outdir)
+            self._manifest.load()
+
+        # archives are started first, to take the files of the other
+        # outputs as they are done
+        self._archives = []
+
+        for i, op in enumerate(self.cfg.outputs):
+
+            if not self._output_is_archive(op):
+                continue
+
+            if self._is_up_to_date(op):
+                logging.debug("Output {} is up to date".format(op.name))
+            elif not self._restore_cached(i, op):
+                self._start_archive(i, op)
+
+        to_plot = []
+
+        try:
+            for i, op in enumerate(self.cfg.outputs):
+
+                if self._output_is_archive(op):
+                    continue
+
+                if self._is_up_to_date(op):
+                    logging.debug("Output {} is up to date".format(op.name))
+                    self._add_to_archives(
+                        op, self._manifest.get_files(op.name))
+                elif not self._restore_cached(i, op):
+                    to_plot.append(i)
+
+            if to_plot:
+                # before loading the board, or starting any workers
+                self._check_inner_layers(brd_file, to_plot)
+
+            if self.scratch_dir and to_plot:
+                self._writer = writer.OutputWriter()
+                self._writer.start()
+
+            if not to_plot:
+                if self.cfg.run_drc:
+                    # the board is checked even if nothing is plotted
+                    # (filling its zones would be of no use)
+                    with timing.span('preflight'):
+                        self._run_drc(self._load_board(brd_file))
+
+                if not self._archives:
+                    logging.info("All outputs are up to date")
+            elif (max(self.jobs, self.layer_jobs) > 1 and
+                  len(self._get_work_units(to_plot)) > 1):
+                self._plot_parallel(brd_file, to_plot)
+            else:
+                self._plot_serial(brd_file, to_plot)
+
+            self._finish_archives()
+        finally:
+            for i, arc in self._archives:
+                arc.abort()
+
+            self._archives = []
+
+            if self._writer:
+                self._writer.abort()
+                self._writer = None
+
+            # even on failure, keep track of what was done
+            if self._manifest:
+                self._manifest.save()
+
+        if self.cache:
+            self.cache.evict()
+
+    def _check_inner_layers(self, brd_file, op_indices):
+        """
+        Check the inner layers of the outputs exist on the board, from the
+        board's file (without loading it)
+        """
+
+        outputs = [self.cfg.outputs[i] for i in op_indices]
+
+        if not any(l.layer.is_inner for o in outputs for l in o.layers):
+            return
+
+        try:
+            info = pcb_reader.read_board_info(brd_file)
+        except pcb_reader.PcbReadError as e:
+            raise PlotError(str(e))
+
+        errs = self.cfg.check_inner_layers(info.copper_layers, outputs)
+
+        if errs:
+            raise PlotError("\n".join(errs))
+
+    def _get_fingerprint(self, op):
+        """
+        Get a digest of everything but the board that affects the files
+        plotted for an output
+        """
+
+        parts = [__version__, pcbnew.GetBuildVersion(), self._brd_name,
+                 op.fingerprint(),
+                 # outputs differ if the zones are filled first
+                 str(self.cfg.check_zone_fills)]
+
+        if self._output_is_archive(op):
+            # an archive changes with the outputs in it
+            for name in op.options.type_options.outputs:
+                o = self.cfg.get_output_by_name(name)
+                parts += [o.outdir, self._get_fingerprint(o)]
+
+        return cache.make_key(*parts)
+
+    def _get_manifest_fingerprint(self, op):
+        """
+        Get what the manifest records of an output: the fingerprint of its
+        files, and the dir they are put in (the cache only needs the first,
+        as its files are relative to the output's dir)
+        """
+
+        return cache.make_key(self._get_fingerprint(op), op.outdir)
+
+    def _is_up_to_date(self, op):
+
+        if not self._manifest:
+            return False
+
+        return self._manifest.is_up_to_date(
+            op.name, self._brd_digest, self._get_manifest_fingerprint(op))
+
+    def _restore_cached(self, op_index, op):
+        """
+        Restore the files of an output from the cache, if it is there
+
+        :return: True if restored
+        """
+
+        if not self.cache:
+            return False
+
+        # restored like plotted files, so the output dir never has partly
+        # copied files
+        stage_dir = self._make_stage_dir(local=False)
+
+        try:
+            with timing.span('restore from cache', output=op.name):
+                files = self.cache.restore(
+                    cache.make_key(self._brd_digest,
+                                   self._get_fingerprint(op)),
+                    stage_dir)
+
+                if files is not None:
+                    self._commit_staged(stage_dir, self._get_output_dir(op),
+                                        files)
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+        if files is None:
+            return False
+
+        logging.debug("Output {} restored from cache".format(op.name))
+
+        self._record_output(op, files)
+        return True
+
+    def _record_output(self, op, files, seconds=None):
+        """
+        Record the files of a plotted or restored output in the manifest,
+        and pass them on to the archives they go in
+
+        :param seconds: the time it took to plot (None if restored)
+        """
+
+        # relative to the config's output dir
+        files = [os.path.normpath(os.path.join(op.outdir, fn))
+                 for fn in files]
+
+        if self._manifest:
+            self._manifest.record(
+                op.name, self._brd_digest,
+                self._get_manifest_fingerprint(op), files,
+                seconds)
+
+        self._add_to_archives(op, files)
+
+    def _start_archive(self, op_index, op):
+
+        filename = os.path.join(self._get_output_dir(op),
+                                op.options.type_options.filename)
+
+        logging.debug("Starting archive {}".format(filename))
+
+        arc = archive.OutputArchive(filename, op.options.type_options)
+        arc.start()
+
+        self._archives.append((op_index, arc))
+
+    def _add_to_archives(self, op, files):
+        """
+        :param files: the files of an output, relative to the config's
+            output dir
+        """
+
+        for i, arc in self._archives:
+            arc.add_output(op.name, [(os.path.join(self.cfg.outdir, fn), fn)
+                                     for fn in files])
+
+    def _finish_archives(self):
+
+        while self._archives:
+
+            i, arc = self._archives[0]
+            op = self.cfg.outputs[i]
+
+            t0 = _clock()
+
+            with timing.span('archive', output=op.name):
+                arc.finish()
+
+            self._archives.pop(0)
+            self._output_done(
+                i, [os.path.normpath(op.options.type_options.filename)],
+                _clock() - t0)
+
+    def _output_done(self, op_index, files, seconds):
+        """
+        Called when an output is plotted, with the files it produced and
+        the time it took
+        """
+
+        op = self.cfg.outputs[op_index]
+
+        if self.cache:
+            self.cache.store(
+                cache.make_key(self._brd_digest, self._get_fingerprint(op)),
+                self._get_output_dir(op), files)
+
+        self._record_output(op, files, seconds)
+
+    def _load_board(self, brd_file):
+
+        with timing.span('load board', board=os.path.basename(brd_file)):
+
+            if self.board_cache:
+                # a board filled by an earlier plot only does if we fill
+                # it too
+                return self.board_cache.load(
+                    brd_file, filled_ok=self.cfg.check_zone_fills)
+
+            return pcbnew.LoadBoard(brd_file)
+
+    def _plot_serial(self, brd_file, op_indices):
+
+        board = self._load_board(brd_file)
 
         logging.debug("Board loaded")
 
         self._preflight_checks(board)
 
-        for op in self.cfg.outputs:
+        session = _PlotSession(board)
+
+        self._start_units([(i, None) for i in op_indices])
+
+        for i in self._group_outputs(op_indices):
+            t0 = _clock()
+            stage_dir, files = self._plot_output(board, session,
+                                                 self.cfg.outputs[i])
+            self._unit_plotted(i, stage_dir, files, _clock() - t0)
+
+        self._finish_writes()
+
+    def _start_units(self, units):
+
+        self._units_left = collections.Counter(i for i, layers in units)
+        self._op_files = dict((i, []) for i in self._units_left)
+        self._op_seconds = collections.Counter()
+
+    def _unit_plotted(self, op_index, stage_dir, files, seconds):
+        """
+        Called when (some of the layers of) an output are plotted into a
+        staging dir, to move them to the output dir: now, or in the
+        background if there is a writer
+        """
+
+        self._op_files[op_index] += files
+        self._op_seconds[op_index] += seconds
+
+        outdir = self._get_output_dir(self.cfg.outputs[op_index])
+
+        if self._writer:
+            self._writer.commit(op_index, stage_dir, outdir, files)
 
-            logging.debug("Processing output: {}".format(op.name))
+            for i in self._writer.take_done():
+                self._unit_done(i)
+        else:
+            try:
+                self._commit_staged(stage_dir, outdir, files)
+            finally:
+                shutil.rmtree(stage_dir, ignore_errors=True)
+
+            self._unit_done(op_index)
+
+    def _unit_failed(self, op_index):
+
+        # don't record an output with missing parts
+        self._op_files[op_index] = None
+        self._unit_done(op_index)
+
+    def _unit_done(self, op_index):
+
+        self._units_left[op_index] -= 1
+
+        files = self._op_files[op_index]
+
+        if not self._units_left[op_index] and files is not None:
+            logging.debug("Output {} done".format(
+                self.cfg.outputs[op_index].name))
+            self._output_done(op_index, sorted(files),
+                              self._op_seconds[op_index])
+
+    def _finish_writes(self):
+        """
+        Wait for the writer to move all the plotted files
+        """
 
-            # fresh plot controller
-            pc = pcbnew.PLOT_CONTROLLER(board)
+        if not self._writer:
+            return
 
-            self._configure_output_dir(pc, op)
+        with timing.span('finish writes'):
+            done = self._writer.finish()
+
+        self._writer = None
+
+        for i in done:
+            self._unit_done(i)
+
+    def _group_outputs(self, op_indices):
+        """
+        Order outputs so those with the same plot params are plotted one
+        after the other, and the plot controller needs the fewest changes
+        """
+
+        groups = collections.OrderedDict()
+
+        for i in op_indices:
+
+            op = self.cfg.outputs[i]
 
             if self._output_is_layer(op):
-                self._do_layer_plot(board, pc, op)
-            elif self._output_is_drill(op):
-                self._do_drill_plot(board, pc, op)
+                key = tuple(self._get_plot_params(op).items())
             else:
-                raise PlotError("Don't know how to plot type {}"
-                                .format(op.options.type))
+                key = None
 
-            pc.ClosePlot()
+            groups.setdefault(key, []).append(i)
+
+        return [i for group in groups.values() for i in group]
+
+    def _get_work_units(self, op_indices):
+        """
+        Split the outputs to plot into units of work for the worker
+        processes. Layer outputs are split into up to layer_jobs parts,
+        each with some of the layers.
+
+        :return: [(output index, indices of the layers to plot, or None for
+            all of them)]
+        """
+
+        units = []
+
+        for i in self._group_outputs(op_indices):
+
+            op = self.cfg.outputs[i]
+            n_parts = min(self.layer_jobs, len(op.layers))
+
+            # merged layers are plotted together
+            if (self._output_is_layer(op) and n_parts > 1 and
+                    not self._output_is_merged(op)):
+                # every n-th layer, as copper layers (first) are slowest
+                units += [(i, list(range(part, len(op.layers), n_parts)))
+                          for part in range(n_parts)]
+            else:
+                units.append((i, None))
+
+        return units
+
+    def _plot_parallel(self, brd_file, op_indices):
+        """
+        Plot the outputs in a pool of worker processes. pcbnew is not
+        thread-safe, so each worker loads its own copy of the board.
+        """
+
+        # workers take units in order, so similar outputs tend to go to
+        # the same worker
+        units = self._get_work_units(op_indices)
+
+        n_workers = min(max(self.jobs, self.layer_jobs), len(units))
+
+        logging.debug("Plotting with {} worker processes".format(n_workers))
+
+        board = None
+        filled_dir = None
+
+        if self.cfg.check_zone_fills:
+            # the workers need the board with its zones filled: fill them
+            # first, and have the workers load a copy of the filled board
+            board = self._load_board(brd_file)
+            self._preflight_checks(board)
+
+            filled_dir = tempfile.mkdtemp(prefix='kiplot-board-')
+            # same name, as plotted files are named after the board
+            worker_brd_file = os.path.join(filled_dir,
+                                           os.path.basename(brd_file))
+            pcbnew.SaveBoard(worker_brd_file, board)
+        else:
+            worker_brd_file = brd_file
+
+        # start the workers first, so they load the board while we
+        # do the preflight checks
+        pool = multiprocessing.Pool(n_workers, _init_worker,
+                                    (self.cfg, worker_brd_file,
+                                     timing.profiler.enabled,
+                                     self.scratch_dir, self.cache))
+
+        try:
+            if board is None:
+                board = self._load_board(brd_file)
+
+                logging.debug("Board loaded")
+
+                self._preflight_checks(board)
+
+            errs = []
+
+            self._start_units(units)
+
+            for i, stage_dir, files, err, spans, seconds in \
+                    pool.imap_unordered(_run_worker, units):
+
+                name = self.cfg.outputs[i].name
+
+                timing.profiler.add_spans(spans)
+
+                if err:
+                    logging.error("Output {} failed: {}".format(name, err))
+                    errs.append("{}: {}".format(name, err))
+                    self._unit_failed(i)
+                else:
+                    self._unit_plotted(i, stage_dir, files, seconds)
+
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+            if filled_dir:
+                shutil.rmtree(filled_dir, ignore_errors=True)
+
+        # the outputs that were plotted are kept, even if others failed
+        self._finish_writes()
+
+        if errs:
+            raise PlotError("Failed to plot {} output(s):\n{}"
+                            .format(len(errs), "\n".join(errs)))
+
+    def _plot_output(self, board, session, op, layers=None):
+        """
+        Plot an output
+
+        :param session: the _PlotSession to plot layers with
+        :param layers: indices of the layers to plot (None: all)
+
+        :return: (the staging dir plotted into, the files plotted,
+            relative to it). The files are moved to the output dir with
+            _unit_plotted.
+        """
+
+        logging.debug("Processing output: {}".format(op.name))
+
+        # plot into a staging dir, so we know what files are made
+        stage_dir = self._make_stage_dir()
+
+        try:
+            with timing.span('output', output=op.name):
+
+                if self._output_is_layer(op):
+                    session.configure(self._get_plot_params(op))
+                    self._configure_output_dir(session, stage_dir)
+                    plotted = self._do_layer_plot(board, session, op, layers)
+                    session.plot_ctrl.ClosePlot()
+
+                    if op.options.type == PCfg.OutputOptions.PREVIEW:
+                        self._render_previews(board, stage_dir, op)
+                    elif self._output_is_merged(op):
+                        self._merge_layers(board, op, plotted)
+                elif self._output_is_drill(op):
+                    self._do_drill_plot(board, stage_dir, op)
+                else:
+                    raise PlotError("Don't know how to plot type {}"
+                                    .format(op.options.type))
+        except BaseException:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            raise
+
+        files = _staged_files(stage_dir)
+
+        logging.debug("Plotted files: {}".format(files))
+
+        return stage_dir, files
+
+    def _get_output_dir(self, output):
+
+        # outdir is a combination of the config and output
+        return os.path.join(self.cfg.outdir, output.outdir)
+
+    def _make_stage_dir(self, local=True):
+        """
+        :param local: if False, the dir is made in the output dir even when
+            plotting to a scratch dir (for files which are committed
+            straight away, not by the writer)
+        """
+
+        # in the output dir (unless plotting to a scratch dir), so the
+        # files can be renamed into place
+        stage_root = (local and self.scratch_dir) or self.cfg.outdir
+
+        if not os.path.isdir(stage_root):
+            try:
+                os.makedirs(stage_root)
+            except OSError:
+                # made by another worker since we looked
+                if not os.path.isdir(stage_root):
+                    raise
+
+        return tempfile.mkdtemp(prefix='.kiplot-stage-', dir=stage_root)
+
+    def _commit_staged(self, stage_dir, outdir, files):
+        """
+        Move plotted files from a staging dir to their output dir
+
+        :param files: the files, relative to the staging dir
+        """
+
+        for fn in files:
+
+            dest_dir = os.path.dirname(os.path.join(outdir, fn))
+
+            if not os.path.isdir(dest_dir):
+                try:
+                    os.makedirs(dest_dir)
+                except OSError:
+                    # made by another worker since we looked
+                    if not os.path.isdir(dest_dir):
+                        raise
+
+            os.rename(os.path.join(stage_dir, fn), os.path.join(outdir, fn))
 
     def _preflight_checks(self, board):
 
+        with timing.span('preflight'):
+            self._do_preflight_checks(board)
+
+    def _do_preflight_checks(self, board):
+
         logging.debug("Preflight checks")
 
         if self.cfg.check_zone_fills:
-            raise PlotError("Not sure if Python scripts can do zone check!")
+            if self.board_cache:
+                # before filling, in case it fails part way
+                self.board_cache.mark_filled(board.GetFileName())
+
+            # each zone is only timed when profiling, as filling the zones
+            # one at a time is slower
+            zone_fill.fill_zones(board, self._get_zone_cache(),
+                                 per_zone=timing.profiler.enabled)
 
         if self.cfg.run_drc:
-            raise PlotError("Not sure if Python scripts can run DRC!")
+            self._run_drc(board)
+
+    def _run_drc(self, board):
+
+        report = os.path.join(self.cfg.outdir, self.cfg.drc_report)
+
+        with timing.span('drc'):
+            n_violations = drc.run_drc(board, report,
+                                       max(self.jobs, self.layer_jobs))
+
+        if not n_violations:
+            logging.info("DRC passed")
+            return
+
+        msg = "DRC found {} violation(s), see {}".format(n_violations,
+                                                          report)
+
+        if self.cfg.ignore_drc_errors:
+            logging.warning(msg)
+        else:
+            # before anything is plotted
+            raise PlotError(msg)
+
+    def _render_previews(self, board, outdir, output):
+        """
+        Draw the gerbers plotted for a preview output to PNGs, in place of
+        the gerbers
+        """
+
+        to = output.options.type_options
+
+        # the same frame for every layer, so the images line up
+        frame = _board_frame(board)
+        preview_cache = self._get_preview_cache()
+
+        for fn in sorted(os.listdir(outdir)):
+
+            if not fn.endswith('.gbr'):
+                continue
+
+            gbr_file = os.path.join(outdir, fn)
+
+            with timing.span('render preview', output=output.name,
+                             layer=fn):
+                try:
+                    images = preview.render_file(gbr_file, frame, to.dpi,
+                                                 to.tile_size, preview_cache)
+                except preview.PreviewError as e:
+                    raise PlotError("Can't draw preview: {}".format(e))
+
+            for suffix, png in images:
+                with open(os.path.join(outdir, fn[:-len('.gbr')] + suffix +
+                                       '.png'), 'wb') as f:
+                    f.write(png)
+
+            os.remove(gbr_file)
+
+        if preview_cache:
+            preview_cache.prune()
+
+    def _merge_layers(self, board, output, plotted):
+        """
+        Merge the files plotted for the layers of an output into one, in
+        place of them
+
+        :param plotted: the files plotted, in layer order
+        """
+
+        # an output with no layers plots nothing, so there's nothing to merge
+        if not plotted:
+            return
+
+        board_name = os.path.splitext(os.path.basename(
+            board.GetFileName()))[0]
+        merged = os.path.join(os.path.dirname(plotted[0]),
+                              plan.merged_file_name(board_name, output))
+
+        # a layer's file might have the merged file's name
+        tmp = merged + '.merging'
+
+        with timing.span('merge layers', output=output.name):
+            try:
+                if output.options.type == PCfg.OutputOptions.PDF:
+                    shared = merge.merge_pdfs(plotted, tmp)
+                    logging.debug("{} objects shared between pages"
+                                  .format(shared))
+                else:
+                    merge.merge_svgs(plotted, tmp, [
+                        l.desc or l.suffix for l in output.layers])
+            except merge.MergeError as e:
+                raise PlotError("Can't merge layers: {}".format(e))
+
+        for fn in plotted:
+            os.remove(fn)
+
+        os.rename(tmp, merged)
+
+    def _get_preview_cache(self):
+
+        if not self.cache:
+            return None
+
+        return cache.PreviewCache(self.cache.cache_dir)
+
+    def _get_zone_cache(self):
+
+        if not self.cache:
+            return None
+
+        # next to the output cache
+        return cache.ZoneFillCache(self.cache.cache_dir)
 
     def _output_is_layer(self, output):
 
@@ -76,8 +899,17 @@ class Plotter(object):
             PCfg.OutputOptions.SVG,
             PCfg.OutputOptions.PDF,
             PCfg.OutputOptions.HPGL,
+            PCfg.OutputOptions.PREVIEW,
         ]
 
+    def _output_is_merged(self, output):
+
+        return getattr(output.options.type_options, 'single_file', False)
+
+    def _output_is_archive(self, output):
+
+        return output.options.type == PCfg.OutputOptions.ARCHIVE
+
     def _output_is_drill(self, output):
 
         return output.options.type in [
@@ -97,6 +929,8 @@ class Plotter(object):
             PCfg.OutputOptions.PDF: pcbnew.PLOT_FORMAT_PDF,
             PCfg.OutputOptions.DXF: pcbnew.PLOT_FORMAT_DXF,
             PCfg.OutputOptions.SVG: pcbnew.PLOT_FORMAT_SVG,
+            # drawn from gerbers
+            PCfg.OutputOptions.PREVIEW: pcbnew.PLOT_FORMAT_GERBER,
         }
 
         try:
@@ -107,47 +941,52 @@ class Plotter(object):
         raise ValueError("Don't know how to translate plot type: {}"
                          .format(output.options.type))
 
-    def _do_layer_plot(self, board, plot_ctrl, output):
+    def _do_layer_plot(self, board, session, output, layers=None):
+        """
+        :return: the files plotted, in layer order
+        """
 
-        # set up plot options for the whole output
-        self._configure_plot_ctrl(plot_ctrl, output)
+        if layers is None:
+            layers = output.layers
+        else:
+            layers = [output.layers[k] for k in layers]
 
-        po = plot_ctrl.GetPlotOptions()
-        layer_cnt = board.GetCopperLayerCount()
+        plot_ctrl = session.plot_ctrl
+        plotted = []
 
         # plot every layer in the output
-        for l in output.layers:
+        for l in layers:
 
             layer = l.layer
             suffix = l.suffix
             desc = l.desc
 
-            # for inner layers, we can now check if the layer exists
-            if layer.is_inner:
-
-                if layer.layer < 1 or layer.layer >= layer_cnt - 1:
-                    raise PlotError(
-                        "Inner layer {} is not valid for this board"
-                        .format(layer.layer))
-
             # Set current layer
             plot_ctrl.SetLayer(layer.layer)
 
             # Skipping NPTH is controlled by whether or not this is
             # a copper layer
             is_cu = pcbnew.IsCopperLayer(layer.layer)
-            po.SetSkipPlotNPTH_Pads(is_cu)
+            session.set_params({'SetSkipPlotNPTH_Pads': (is_cu,)})
 
             plot_format = self._get_layer_plot_format(output)
 
             # Plot single layer to file
             logging.debug("Opening plot file for layer {} ({})"
                           .format(layer.layer, suffix))
-            plot_ctrl.OpenPlotfile(suffix, plot_format, desc)
+            with timing.span('OpenPlotfile', output=output.name,
+                             layer=suffix):
+                plot_ctrl.OpenPlotfile(suffix, plot_format, desc)
 
             logging.debug("Plotting layer {} to {}".format(
                 layer.layer, plot_ctrl.GetPlotFileName()))
-            plot_ctrl.PlotLayer()
+
+            with timing.span('PlotLayer', output=output.name, layer=suffix):
+                plot_ctrl.PlotLayer()
+
+            plotted.append(plot_ctrl.GetPlotFileName())
+
+        return plotted
 
     def _configure_excellon_drill_writer(self, board, offset, options):
 
@@ -176,12 +1015,10 @@ class Plotter(object):
 
         return drill_writer
 
-    def _do_drill_plot(self, board, plot_ctrl, output):
+    def _do_drill_plot(self, board, outdir, output):
 
         to = output.options.type_options
 
-        outdir = plot_ctrl.GetPlotOptions().GetOutputDirectory()
-
         # dialog_gendrill.cpp:357
         if to.use_aux_axis_as_origin:
             offset = board.GetAuxOrigin()
@@ -195,8 +1032,8 @@ class Plotter(object):
             drill_writer = self._configure_gerber_drill_writer(
                 board, offset, output.options)
         else:
-            raise error.PlotError("Can't make a writer for type {}"
-                                  .format(output.options.type))
+            raise PlotError("Can't make a writer for type {}"
+                            .format(output.options.type))
 
         gen_drill = True
         gen_map = to.generate_map
@@ -211,7 +1048,8 @@ class Plotter(object):
             logging.debug("Generating drill map type {} in {}"
                           .format(to.map_options.type, outdir))
 
-        drill_writer.CreateDrillandMapFilesSet(outdir, gen_drill, gen_map)
+        with timing.span('CreateDrillandMapFilesSet', output=output.name):
+            drill_writer.CreateDrillandMapFilesSet(outdir, gen_drill, gen_map)
 
         if gen_report:
             drill_report_file = os.path.join(outdir,
@@ -219,7 +1057,49 @@ class Plotter(object):
             logging.debug("Generating drill report: {}"
                           .format(drill_report_file))
 
-            drill_writer.GenDrillReportFile(drill_report_file)
+            with timing.span('GenDrillReportFile', output=output.name):
+                drill_writer.GenDrillReportFile(drill_report_file)
+
+        if output.options.type == PCfg.OutputOptions.EXCELLON and to.verify:
+            with timing.span('verify drills', output=output.name):
+                self._verify_drills(outdir, output)
+
+    def _verify_drills(self, outdir, output):
+        """
+        Check the drill files just written, failing the output if they have
+        problems
+
+        :param outdir: the dir the files were written to
+        """
+
+        to = output.options.type_options
+
+        drill_files = sorted(os.path.join(outdir, fn)
+                             for fn in os.listdir(outdir)
+                             if fn.endswith('.drl'))
+
+        report_file = None
+
+        if to.generate_report:
+            report_file = os.path.join(outdir, to.report_options.filename)
+
+        try:
+            problems = excellon.verify_drill_files(
+                drill_files, report_file,
+                to.verify_options.min_hole_spacing)
+        except excellon.ExcellonError as e:
+            raise PlotError("Can't verify the drill files: {}".format(e))
+
+        if problems:
+            # the first few, there might be a lot of them
+            raise PlotError("Drill files failed verification:\n{}{}".format(
+                "\n".join(problems[:_MAX_VERIFY_PROBLEMS]),
+                "\n... and {} more".format(
+                    len(problems) - _MAX_VERIFY_PROBLEMS)
+                if len(problems) > _MAX_VERIFY_PROBLEMS else ""))
+
+        logging.debug("Verified drill files: {}".format(
+            [os.path.basename(f) for f in drill_files]))
 
     def _configure_gerber_opts(self, po, output):
 
@@ -251,7 +1131,7 @@ class Plotter(object):
 
         po.SetWidthAdjust(ps_opts.width_adjust)
         po.SetFineScaleAdjustX(ps_opts.scale_adjust_x)
-        po.SetFineScaleAdjustX(ps_opts.scale_adjust_y)
+        po.SetFineScaleAdjustY(ps_opts.scale_adjust_y)
         po.SetA4Output(ps_opts.a4_output)
 
     def _configure_dxf_opts(self, po, output):
@@ -271,22 +1151,30 @@ class Plotter(object):
         assert(output.options.type == PCfg.OutputOptions.SVG)
         # pdf_opts = output.options.type_options
 
-    def _configure_output_dir(self, plot_ctrl, output):
+    def _configure_preview_opts(self, po, output):
 
-        po = plot_ctrl.GetPlotOptions()
+        assert(output.options.type == PCfg.OutputOptions.PREVIEW)
 
-        # outdir is a combination of the config and output
-        outdir = os.path.join(self.cfg.outdir, output.outdir)
+        # plain gerbers, to draw
+        po.SetSubtractMaskFromSilk(False)
+        po.SetUseGerberProtelExtensions(False)
+        po.SetGerberPrecision(6)
+        po.SetCreateGerberJobFile(False)
+
+    def _configure_output_dir(self, session, outdir):
 
         logging.debug("Output destination: {}".format(outdir))
 
-        po.SetOutputDirectory(outdir)
+        session.set_params({'SetOutputDirectory': (outdir,)})
 
-    def _configure_plot_ctrl(self, plot_ctrl, output):
+    def _get_plot_params(self, output):
+        """
+        Get the plot params of an output
 
-        logging.debug("Configuring plot controller for output")
+        :return: {PCB_PLOT_PARAMS setter name: args}
+        """
 
-        po = plot_ctrl.GetPlotOptions()
+        po = _PlotParams()
 
         opts = output.options.type_options
 
@@ -324,8 +1212,91 @@ class Plotter(object):
             self._configure_pdf_opts(po, output)
         elif output.options.type == PCfg.OutputOptions.HPGL:
             self._configure_hpgl_opts(po, output)
+        elif output.options.type == PCfg.OutputOptions.PREVIEW:
+            self._configure_preview_opts(po, output)
 
         po.SetDrillMarksType(opts.drill_marks)
 
-        # We'll come back to this on a per-layer basis
-        po.SetSkipPlotNPTH_Pads(False)
+        # SetSkipPlotNPTH_Pads is set on a per-layer basis
+
+        return po.values
+
+
+def _board_frame(board):
+    """
+    Get the area of a board to draw previews of, in Gerber coordinates (mm,
+    going up)
+    """
+
+    bbox = board.GetBoardEdgesBoundingBox()
+
+    x0 = bbox.GetX() / kicad_defs.IU_PER_MM
+    y0 = bbox.GetY() / kicad_defs.IU_PER_MM
+    x1 = x0 + bbox.GetWidth() / kicad_defs.IU_PER_MM
+    y1 = y0 + bbox.GetHeight() / kicad_defs.IU_PER_MM
+
+    m = preview.FRAME_MARGIN
+
+    return (x0 - m, -y1 - m, x1 + m, -y0 + m)
+
+
+def _staged_files(stage_dir):
+    """
+    :return: the files in a staging dir, relative to it
+    """
+
+    files = []
+
+    for dirpath, dirnames, filenames in os.walk(stage_dir):
+
+        rel_dir = os.path.relpath(dirpath, stage_dir)
+
+        files += [os.path.normpath(os.path.join(rel_dir, fn))
+                  for fn in filenames]
+
+    return sorted(files)
+
+
+# state of a plot worker process: the plotter and its own loaded board
+_worker = {}
+
+
+def _init_worker(cfg, brd_file, profile, scratch_dir, output_cache):
+
+    timing.profiler.reset(profile)
+
+    _worker['plotter'] = Plotter(cfg)
+    _worker['plotter'].scratch_dir = scratch_dir
+    # for the caches beside it (outputs are cached by the parent)
+    _worker['plotter'].cache = output_cache
+    _worker['board'] = _worker['plotter']._load_board(brd_file)
+    _worker['session'] = _PlotSession(_worker['board'])
+
+
+def _run_worker(unit):
+    """
+    Plot a single output (or some of its layers) in a worker process
+
+    :param unit: (output index, indices of the layers to plot or None)
+    :return: (output index, staging dir, files plotted into it, error
+        message or None, timing spans, seconds taken)
+    """
+
+    op_index, layers = unit
+
+    plotter = _worker['plotter']
+    op = plotter.cfg.outputs[op_index]
+
+    t0 = _clock()
+
+    try:
+        stage_dir, files = plotter._plot_output(
+            _worker['board'], _worker['session'], op, layers)
+        err = None
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        stage_dir = files = None
+        err = "{}: {}".format(type(e).__name__, e)
+
+    return (op_index, stage_dir, files, err, timing.profiler.take_spans(),
+            _clock() - t0)
@@ -0,0 +1,139 @@
+"""
+Manifest of the outputs plotted into an output directory, so that outputs
+whose inputs have not changed don't need to be plotted again
+"""
+
+import json
+import logging
+import os
+
+
+# the manifest file, in the config's output dir
+MANIFEST_FILE = '.kiplot-manifest.json'
+
+MANIFEST_VERSION = 1
+
+
+def _file_stat(filename):
+    """
+    Get what we record about a file to tell if it was modified
+    """
+
+    st = os.stat(filename)
+    return [st.st_size, st.st_mtime]
+
+
+class Manifest(object):
+    """
+    Records, for each output, the board and config it was plotted from and
+    the files it produced
+    """
+
+    def __init__(self, outdir):
+        """
+        :param outdir: the output dir the manifest describes
+        """
+
+        self.outdir = outdir
+        self.filename = os.path.join(outdir, MANIFEST_FILE)
+
+        self._outputs = {}
+
+    def load(self):
+        """
+        Load the manifest, if there is one. A missing or unreadable manifest
+        is treated as empty.
+        """
+
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        if data.get('version') != MANIFEST_VERSION:
+            logging.debug("Ignoring manifest of another version: {}"
+                          .format(self.filename))
+            return
+
+        self._outputs = data.get('outputs', {})
+
+    def save(self):
+
+        if not os.path.isdir(self.outdir):
+            os.makedirs(self.outdir)
+
+        data = {
+            'version': MANIFEST_VERSION,
+            'outputs': self._outputs,
+        }
+
+        tmp_file = self.filename + '.tmp'
+
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+        os.rename(tmp_file, self.filename)
+
+    def is_up_to_date(self, name, brd_digest, fingerprint):
+        """
+        Check if an output was plotted from this board and config, and its
+        files are all still there, unmodified
+        """
+
+        entry = self._outputs.get(name)
+
+        if (entry is None or entry['board'] != brd_digest or
+                entry['fingerprint'] != fingerprint):
+            return False
+
+        for fn, stat in entry['files'].items():
+
+            try:
+                if _file_stat(os.path.join(self.outdir, fn)) != stat:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    def get_files(self, name):
+        """
+        Get the files recorded for an output, relative to the output dir
+        """
+
+        return sorted(self._outputs[name]['files'])
+
+    def get_timing(self, name):
+        """
+        Get how long an output took to plot, when it was last plotted
+
+        :return: (seconds or None, the number of files it had)
+        """
+
+        entry = self._outputs.get(name)
+
+        if entry is None:
+            return None, 0
+
+        return entry.get('seconds'), len(entry['files'])
+
+    def record(self, name, brd_digest, fingerprint, files, seconds=None):
+        """
+        Record that an output was plotted
+
+        :param files: the files produced, relative to the output dir
+        :param seconds: the time it took to plot (None if it was not
+            plotted, but restored: the last time plotted is kept)
+        """
+
+        if seconds is None:
+            seconds, _ = self.get_timing(name)
+
+        self._outputs[name] = {
+            'board': brd_digest,
+            'fingerprint': fingerprint,
+            'files': dict((fn, _file_stat(os.path.join(self.outdir, fn)))
+                          for fn in files),
+            'seconds': seconds,
+        }
@@ -0,0 +1,674 @@
+"""
+Merging of the single layer files pcbnew plots into one document: PDFs as
+the pages of one PDF, SVGs as the groups of one SVG.
+
+pcbnew only plots a layer per file, so the layers are still plotted one by
+one, but merged in a single pass: each file is read once and its objects
+are written out as they are copied. Objects which are the same in every
+page (fonts, resource dictionaries and such) are only written once.
+
+Only PDFs with classic cross-reference tables (as pcbnew writes them) are
+read, not those with cross-reference or object streams.
+"""
+
+import collections
+import hashlib
+import io
+import re
+
+from xml.sax import saxutils
+
+from . import error
+from . import pcb_reader
+
+_WHITESPACE = b'\x00\t\n\x0c\r '
+_DELIMITERS = b'()<>[]{}/%'
+
+# the keys of a page which it can inherit from its page tree
+_INHERITED_KEYS = [b'Resources', b'MediaBox', b'CropBox', b'Rotate']
+
+_OBJ_RE = re.compile(br'\s*(\d+)\s+(\d+)\s+obj')
+_REF_RE = re.compile(br'(\d+)\s+(\d+)\s+R(?=[\s/<>\[\]()%]|$)')
+_NUMBER_RE = re.compile(br'[+-]?(?:\d+\.?\d*|\.\d+)')
+_STARTXREF_RE = re.compile(br'startxref\s+(\d+)')
+_XREF_SECTION_RE = re.compile(br'\s*(\d+)\s+(\d+)\s*[\r\n]+')
+_XREF_ENTRY_RE = re.compile(br'(\d{10}) (\d{5}) ([nf])')
+
+# the opening tag of an SVG file, and its closing tag
+_SVG_START_RE = re.compile(r'<svg\b[^>]*>')
+_SVG_END = u'</svg>'
+
+_INKSCAPE_NS = u'http://www.inkscape.org/namespaces/inkscape'
+
+Ref = collections.namedtuple('Ref', ['num', 'gen'])
+
+
+class MergeError(error.KiPlotError):
+    pass
+
+
+class Name(bytes):
+    """
+    A PDF name (without its /)
+    """
+
+
+class Token(bytes):
+    """
+    A PDF value written as it was read: a number, string, boolean or null
+    """
+
+
+class Stream(object):
+    """
+    A PDF stream: its dictionary and its (still encoded) data
+    """
+
+    def __init__(self, info, data):
+
+        self.info = info
+        self.data = data
+
+
+class _Parser(object):
+    """
+    Reads PDF values from the bytes of a file
+    """
+
+    def __init__(self, data, name):
+
+        self.data = data
+        self.name = name
+        self.pos = 0
+
+    def error(self, msg):
+
+        raise MergeError("{}: {} at byte {}".format(self.name, msg,
+                                                     self.pos))
+
+    def skip_space(self):
+
+        data = self.data
+
+        while self.pos < len(data):
+            c = data[self.pos:self.pos + 1]
+
+            if c == b'%':
+                while (self.pos < len(data) and
+                       data[self.pos:self.pos + 1] not in b'\r\n'):
+                    self.pos += 1
+            elif c in _WHITESPACE:
+                self.pos += 1
+            else:
+                break
+
+    def regular(self):
+        """
+        Read the characters up to the next whitespace or delimiter
+        """
+
+        data = self.data
+        start = self.pos
+
+        while (self.pos < len(data) and
+               data[self.pos:self.pos + 1] not in _WHITESPACE + _DELIMITERS):
+            self.pos += 1
+
+        return data[start:self.pos]
+
+    def value(self):
+
+        self.skip_space()
+
+        data = self.data
+        c = data[self.pos:self.pos + 1]
+
+        if c == b'/':
+            self.pos += 1
+            return Name(self.regular())
+
+        if data.startswith(b'<<', self.pos):
+            return self.dictionary()
+
+        if c == b'<':
+            end = data.find(b'>', self.pos)
+
+            if end < 0:
+                self.error("unterminated hex string")
+
+            start = self.pos
+            self.pos = end + 1
+            return Token(data[start:self.pos])
+
+        if c == b'(':
+            return self.string()
+
+        if c == b'[':
+            self.pos += 1
+            items = []
+
+            while True:
+                self.skip_space()
+
+                if data.startswith(b']', self.pos):
+                    self.pos += 1
+                    return items
+
+                items.append(self.value())
+
+        m = _REF_RE.match(data, self.pos)
+
+        if m:
+            self.pos = m.end()
+            return Ref(int(m.group(1)), int(m.group(2)))
+
+        word = self.regular()
+
+        if not word:
+            self.error("unexpected {!r}".format(c))
+
+        return Token(word)
+
+    def string(self):
+
+        data = self.data
+        start = self.pos
+        depth = 0
+
+        while self.pos < len(data):
+            c = data[self.pos:self.pos + 1]
+
+            if c == b'\\':
+                self.pos += 1
+            elif c == b'(':
+                depth += 1
+            elif c == b')':
+                depth -= 1
+
+                if not depth:
+                    self.pos += 1
+                    return Token(data[start:self.pos])
+
+            self.pos += 1
+
+        self.error("unterminated string")
+
+    def dictionary(self):
+
+        self.pos += 2
+        d = collections.OrderedDict()
+
+        while True:
+            self.skip_space()
+
+            if self.data.startswith(b'>>', self.pos):
+                self.pos += 2
+                return d
+
+            key = self.value()
+
+            if not isinstance(key, Name):
+                self.error("dictionary key isn't a name")
+
+            d[key] = self.value()
+
+
+def _serialize(value):
+
+    if isinstance(value, Name):
+        return b'/' + value
+
+    if isinstance(value, Token):
+        return bytes(value)
+
+    if isinstance(value, Ref):
+        return '{} {} R'.format(value.num, value.gen).encode('ascii')
+
+    if isinstance(value, list):
+        return b'[' + b' '.join(_serialize(v) for v in value) + b']'
+
+    if isinstance(value, dict):
+        return b'<<' + b''.join(b'/' + k + b' ' + _serialize(v)
+                                for k, v in value.items()) + b'>>'
+
+    if isinstance(value, Stream):
+        return (_serialize(value.info) + b'\nstream\n' + value.data +
+                b'\nendstream')
+
+    raise MergeError("Can't write {!r}".format(value))
+
+
+def _refs(value):
+    """
+    :return: the references in a value, in order
+    """
+
+    if isinstance(value, Ref):
+        return [value]
+
+    if isinstance(value, Stream):
+        value = value.info
+
+    if isinstance(value, list):
+        return [r for v in value for r in _refs(v)]
+
+    if isinstance(value, dict):
+        return [r for v in value.values() for r in _refs(v)]
+
+    return []
+
+
+def _renumber(value, numbers):
+    """
+    Copy a value with its references replaced
+
+    :param numbers: {Ref in the source file: Ref in the merged file}
+    """
+
+    if isinstance(value, Ref):
+        return numbers[value]
+
+    if isinstance(value, Stream):
+        return Stream(_renumber(value.info, numbers), value.data)
+
+    if isinstance(value, list):
+        return [_renumber(v, numbers) for v in value]
+
+    if isinstance(value, dict):
+        return collections.OrderedDict((k, _renumber(v, numbers))
+                                       for k, v in value.items())
+
+    return value
+
+
+class _SourcePdf(object):
+    """
+    The objects of a PDF file, read as they are needed
+    """
+
+    def __init__(self, data, name):
+
+        self.data = data
+        self.name = name
+
+        # {Ref: byte offset}
+        self.offsets = {}
+        self.trailer = collections.OrderedDict()
+
+        self.read_xref()
+
+    def error(self, msg):
+
+        raise MergeError("{}: {}".format(self.name, msg))
+
+    def read_xref(self):
+
+        m = None
+
+        for m in _STARTXREF_RE.finditer(self.data,
+                                        max(0, len(self.data) - 1024)):
+            pass
+
+        if not m:
+            self.error("no startxref")
+
+        pos = int(m.group(1))
+
+        # each xref section, following /Prev back from the last
+        while pos is not None:
+
+            if not self.data.startswith(b'xref', pos):
+                self.error("cross-reference streams are not supported")
+
+            pos += 4
+
+            while True:
+                m = _XREF_SECTION_RE.match(self.data, pos)
+
+                if not m:
+                    break
+
+                first = int(m.group(1))
+                pos = m.end()
+
+                for i in range(int(m.group(2))):
+                    e = _XREF_ENTRY_RE.match(self.data, pos)
+
+                    if not e:
+                        self.error("bad cross-reference entry")
+
+                    pos = e.end() + 2
+                    ref = Ref(first + i, int(e.group(2)))
+
+                    # later sections (read first) override earlier ones
+                    if e.group(3) == b'n' and ref not in self.offsets:
+                        self.offsets[ref] = int(e.group(1))
+
+            parser = _Parser(self.data, self.name)
+            parser.pos = self.data.find(b'trailer', pos) + len(b'trailer')
+            trailer = parser.value()
+
+            for k, v in trailer.items():
+                self.trailer.setdefault(k, v)
+
+            prev = trailer.get(b'Prev')
+            pos = int(prev) if prev is not None else None
+
+    def get(self, ref):
+        """
+        :return: the value of an object, None if there is none
+        """
+
+        offset = self.offsets.get(ref)
+
+        if offset is None:
+            return None
+
+        m = _OBJ_RE.match(self.data, offset)
+
+        if not m or Ref(int(m.group(1)), int(m.group(2))) != ref:
+            self.error("object {} {} is not where the cross-reference "
+                       "says".format(*ref))
+
+        parser = _Parser(self.data, self.name)
+        parser.pos = m.end()
+        value = parser.value()
+        parser.skip_space()
+
+        if not (isinstance(value, dict) and
+                self.data.startswith(b'stream', parser.pos)):
+            return value
+
+        pos = parser.pos + len(b'stream')
+
+        # the keyword is followed by CRLF or LF
+        if self.data.startswith(b'\r\n', pos):
+            pos += 2
+        else:
+            pos += 1
+
+        length = self.resolve(value.get(b'Length'))
+
+        if not isinstance(length, Token) or not length.isdigit():
+            self.error("object {} {} has no stream length".format(*ref))
+
+        return Stream(value, self.data[pos:pos + int(length)])
+
+    def resolve(self, value):
+
+        if isinstance(value, Ref):
+            return self.get(value)
+
+        return value
+
+    def pages(self):
+        """
+        :return: [(Ref, dict)] of the pages, in order, with the keys they
+            inherit from their page tree
+        """
+
+        root = self.resolve(self.trailer.get(b'Root'))
+
+        if not isinstance(root, dict):
+            self.error("no document catalog")
+
+        pages = []
+        self.walk_pages(root.get(b'Pages'), {}, pages, set())
+
+        return pages
+
+    def walk_pages(self, ref, inherited, pages, seen):
+
+        if not isinstance(ref, Ref) or ref in seen:
+            self.error("bad page tree")
+
+        seen.add(ref)
+        node = self.get(ref)
+
+        if not isinstance(node, dict):
+            self.error("bad page tree")
+
+        inherited = dict(inherited)
+
+        if node.get(b'Type') == b'Pages':
+            for k in _INHERITED_KEYS:
+                if k in node:
+                    inherited[k] = node[k]
+
+            for kid in self.resolve(node.get(b'Kids')) or []:
+                self.walk_pages(kid, inherited, pages, seen)
+        else:
+            for k, v in inherited.items():
+                node.setdefault(k, v)
+
+            pages.append((ref, node))
+
+
+class _PdfWriter(object):
+    """
+    Writes the objects of a merged PDF as they are copied, keeping only
+    their offsets and digests
+    """
+
+    def __init__(self, f):
+
+        self.f = f
+        self.pos = 0
+
+        # {object number: byte offset}
+        self.offsets = {}
+        self.next_num = 1
+
+        # {digest of an object: its Ref}, to share the same objects
+        self.written = {}
+        self.shared = 0
+
+        self.write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+
+    def write(self, data):
+
+        self.f.write(data)
+        self.pos += len(data)
+
+    def allocate(self):
+
+        ref = Ref(self.next_num, 0)
+        self.next_num += 1
+
+        return ref
+
+    def write_object(self, ref, value):
+
+        self.offsets[ref.num] = self.pos
+        self.write('{} 0 obj\n'.format(ref.num).encode('ascii') +
+                   _serialize(value) + b'\nendobj\n')
+
+    def add(self, value, ref=None):
+        """
+        Write an object, unless the same one was already written
+
+        :param ref: the Ref to write it as (None: a new one, or the one
+            written before); it is always written if given
+        :return: its Ref
+        """
+
+        if ref is not None:
+            self.write_object(ref, value)
+            return ref
+
+        digest = hashlib.sha1(_serialize(value)).digest()
+        ref = self.written.get(digest)
+
+        if ref is not None:
+            self.shared += 1
+            return ref
+
+        ref = self.written[digest] = self.allocate()
+        self.write_object(ref, value)
+
+        return ref
+
+    def finish(self, root, info):
+
+        xref = self.pos
+
+        self.write('xref\n0 {}\n'.format(self.next_num).encode('ascii'))
+        self.write(b'0000000000 65535 f \n')
+
+        for num in range(1, self.next_num):
+            self.write('{:010d} 00000 n \n'.format(
+                self.offsets[num]).encode('ascii'))
+
+        trailer = collections.OrderedDict([
+            (Name(b'Size'), Token(str(self.next_num).encode('ascii'))),
+            (Name(b'Root'), root),
+        ])
+
+        if info is not None:
+            trailer[Name(b'Info')] = info
+
+        self.write(b'trailer\n' + _serialize(trailer) +
+                   '\nstartxref\n{}\n%%EOF\n'.format(xref).encode('ascii'))
+
+
+def _copy_objects(source, writer, value, numbers, in_progress):
+    """
+    Copy the objects a value refers to (and theirs), depth first, so each
+    object is written after those it refers to and can be compared with
+    those already written
+
+    :param numbers: {source Ref: merged Ref} of the objects copied
+    :param in_progress: {source Ref: merged Ref or None} of the objects
+        being copied; an object referred to by one of its own references
+        is given its number before it is written, and isn't shared
+    """
+
+    for ref in _refs(value):
+
+        if ref in numbers:
+            continue
+
+        if ref in in_progress:
+            if in_progress[ref] is None:
+                in_progress[ref] = numbers[ref] = writer.allocate()
+            continue
+
+        obj = source.get(ref)
+
+        if obj is None:
+            # a reference to a missing object is null
+            numbers[ref] = writer.add(Token(b'null'))
+            continue
+
+        in_progress[ref] = None
+        _copy_objects(source, writer, obj, numbers, in_progress)
+
+        numbers[ref] = writer.add(_renumber(obj, numbers),
+                                  in_progress.pop(ref))
+
+
+def merge_pdfs(filenames, out_file):
+    """
+    Merge PDF files into one, their pages in order
+
+    :return: the number of objects shared between the files
+    :raises MergeError: if a file can't be read
+    """
+
+    with open(out_file, 'wb') as f:
+
+        writer = _PdfWriter(f)
+
+        pages_ref = writer.allocate()
+        kids = []
+        info = None
+
+        for filename in filenames:
+            try:
+                with pcb_reader.mapped_file(filename) as buf:
+                    source = _SourcePdf(buf[:], filename)
+            except (IOError, OSError, ValueError) as e:
+                raise MergeError("Can't read PDF file {}: {}"
+                                 .format(filename, e))
+
+            numbers = {}
+
+            for ref, page in source.pages():
+
+                # the page tree isn't copied, the page is put in ours
+                page.pop(b'Parent', None)
+                # the page is its own object, even if another is the same
+                numbers[ref] = page_ref = writer.allocate()
+
+                _copy_objects(source, writer, page, numbers, {})
+
+                page = _renumber(page, numbers)
+                page[Name(b'Parent')] = pages_ref
+                writer.add(page, page_ref)
+                kids.append(page_ref)
+
+            # the document info of the first file
+            if info is None and isinstance(source.trailer.get(b'Info'),
+                                           Ref):
+                info = source.trailer[b'Info']
+                _copy_objects(source, writer, [info], numbers, {})
+                info = numbers[info]
+
+        writer.add(collections.OrderedDict([
+            (Name(b'Type'), Name(b'Pages')),
+            (Name(b'Kids'), kids),
+            (Name(b'Count'), Token(str(len(kids)).encode('ascii'))),
+        ]), pages_ref)
+
+        root = writer.add(collections.OrderedDict([
+            (Name(b'Type'), Name(b'Catalog')),
+            (Name(b'Pages'), pages_ref),
+        ]))
+
+        writer.finish(root, info)
+
+    return writer.shared
+
+
+def merge_svgs(filenames, out_file, labels):
+    """
+    Merge SVG files into one, each as a group (an Inkscape layer) of the
+    first file's document, the first at the bottom
+
+    :param labels: the label of each file's group
+    :raises MergeError: if a file can't be read
+    """
+
+    with io.open(out_file, 'w', encoding='utf-8') as f:
+
+        for n, (filename, label) in enumerate(zip(filenames, labels)):
+
+            try:
+                with io.open(filename, encoding='utf-8') as svg:
+                    text = svg.read()
+            except (IOError, OSError, UnicodeDecodeError) as e:
+                raise MergeError("Can't read SVG file {}: {}"
+                                 .format(filename, e))
+
+            m = _SVG_START_RE.search(text)
+            end = text.rfind(_SVG_END)
+
+            if not m or end < m.end():
+                raise MergeError("{}: not an SVG document".format(filename))
+
+            if not n:
+                start_tag = m.group(0)
+
+                if u'xmlns:inkscape' not in start_tag:
+                    start_tag = u'{} xmlns:inkscape="{}">'.format(
+                        start_tag[:-1].rstrip(u'/ '), _INKSCAPE_NS)
+
+                f.write(text[:m.start()] + start_tag + u'\n')
+
+            f.write(u'<g id="layer{}" inkscape:groupmode="layer" '
+                    u'inkscape:label={}>'.format(n + 1,
+                                                 saxutils.quoteattr(label)))
+            f.write(text[m.end():end])
+            f.write(u'</g>\n')
+
+        f.write(_SVG_END + u'\n')
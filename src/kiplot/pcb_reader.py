@@ -0,0 +1,218 @@
+"""
+A streaming reader of .kicad_pcb files, without pcbnew. The file is memory
+mapped and tokenized as it is read, and only the top-level items asked for
+are built, so reading what is at the start of a board (its layers, setup
+and design rules) doesn't read the rest of it.
+"""
+
+import contextlib
+import mmap
+import re
+
+from . import error
+
+# tokens of a board file: strings, parens and atoms
+_TOKEN_RE = re.compile(br'"(?:[^"\\]|\\.)*"|[()]|[^\s()"]+')
+
+# the top-level items before the footprints, graphics and tracks of a board
+_HEADER_ITEMS = ['version', 'host', 'general', 'page', 'paper',
+                 'title_block', 'layers', 'setup', 'net', 'net_class',
+                 'property']
+
+# types of the copper layers in the layer list
+COPPER_TYPES = ['signal', 'power', 'mixed', 'jumper']
+
+
+class PcbReadError(error.KiPlotError):
+    pass
+
+
+@contextlib.contextmanager
+def mapped_file(filename):
+    """
+    Memory map a file (an empty file maps to an empty string)
+    """
+
+    with open(filename, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # can't map an empty file
+            yield b''
+            return
+
+        try:
+            yield buf
+        finally:
+            buf.close()
+
+
+def _atom(tok):
+
+    if tok.startswith(b'"'):
+        tok = tok[1:-1]
+
+    return tok.decode('utf-8', 'replace')
+
+
+def iter_items(brd_file, keep=()):
+    """
+    Read the top-level items of a board file, one at a time. Stop iterating
+    to stop reading the file.
+
+    :param keep: the heads of the items to build
+    :return: an iterator over (head, item as nested lists of strings, or
+        None if not kept) of each item
+    """
+
+    with mapped_file(brd_file) as buf:
+
+        # the lists being built, of a kept item
+        stack = []
+        depth = 0
+        at_head = False
+
+        for m in _TOKEN_RE.finditer(buf):
+
+            tok = m.group(0)
+
+            if tok == b'(':
+                depth += 1
+
+                if stack:
+                    new = []
+                    stack[-1].append(new)
+                    stack.append(new)
+                elif depth == 2:
+                    at_head = True
+            elif tok == b')':
+                depth -= 1
+
+                if stack:
+                    item = stack.pop()
+
+                    if not stack:
+                        yield item[0], item
+            elif at_head:
+                at_head = False
+                head = _atom(tok)
+
+                if head in keep:
+                    stack.append([head])
+                else:
+                    # as soon as it starts, to stop without reading it
+                    yield head, None
+            elif stack:
+                stack[-1].append(_atom(tok))
+
+        if depth:
+            raise PcbReadError("{}: unbalanced parentheses".format(brd_file))
+
+
+def sub_items(item, head):
+    """
+    Get the sub-lists of an item with a given head
+    """
+
+    return [s for s in item if isinstance(s, list) and s and s[0] == head]
+
+
+def _to_number(s):
+
+    try:
+        return float(s)
+    except ValueError:
+        return s
+
+
+def _simple_values(item):
+    """
+    Get the {key: value} of the (key value) sub-lists of an item. Keys with
+    many values get a list.
+    """
+
+    values = {}
+
+    for s in item[1:]:
+
+        if not isinstance(s, list) or len(s) < 2:
+            continue
+
+        vals = [_to_number(v) for v in s[1:] if not isinstance(v, list)]
+        values[s[0]] = vals[0] if len(vals) == 1 else vals
+
+    return values
+
+
+class BoardInfo(object):
+    """
+    What is read from the start of a board file
+    """
+
+    def __init__(self):
+
+        # the board file format version
+        self.version = None
+        # (number, name, type) of each enabled layer
+        self.layers = []
+        # {key: value} of the setup, without the plot params
+        self.setup = {}
+        # {key: value} of the plot params (pcbplotparams) in the setup
+        self.plot_params = {}
+        # (x, y) of the auxiliary axis origin, in mm
+        self.aux_origin = (0.0, 0.0)
+        # {net class name: {key: value}}
+        self.net_classes = {}
+
+    @property
+    def copper_layers(self):
+
+        return len([l for l in self.layers if l[2] in COPPER_TYPES])
+
+    def layer_names(self):
+
+        return [l[1] for l in self.layers]
+
+
+def read_board_info(brd_file):
+    """
+    Read the layers, setup and design rules of a board, stopping at its
+    first footprint, graphic or track
+
+    :return: BoardInfo
+    :raises PcbReadError: if the board can't be read
+    """
+
+    info = BoardInfo()
+
+    try:
+        for head, item in iter_items(brd_file, _HEADER_ITEMS):
+
+            if head not in _HEADER_ITEMS:
+                break
+
+            if head == 'version':
+                info.version = int(item[1])
+            elif head == 'layers':
+                info.layers = [(int(l[0]), l[1], l[2]) for l in item[1:]
+                               if isinstance(l, list) and len(l) > 2]
+            elif head == 'setup':
+                info.setup = _simple_values(item)
+
+                for pp in sub_items(item, 'pcbplotparams'):
+                    info.plot_params = _simple_values(pp)
+
+                info.setup.pop('pcbplotparams', None)
+
+                origin = info.setup.get('aux_axis_origin')
+
+                if isinstance(origin, list) and len(origin) == 2:
+                    info.aux_origin = tuple(origin)
+            elif head == 'net_class':
+                rules = _simple_values(item)
+                rules.pop('add_net', None)
+                info.net_classes[item[1]] = rules
+    except (IOError, OSError, ValueError, IndexError) as e:
+        raise PcbReadError("Can't read board {}: {}".format(brd_file, e))
+
+    return info
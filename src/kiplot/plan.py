@@ -0,0 +1,285 @@
+"""
+Plans of what a plot would do, without plotting: the files each output
+would write, named as pcbnew names them, and the expected cost of each
+output from the timings of the last run. Neither pcbnew nor a loaded board
+is needed.
+"""
+
+import fnmatch
+import os
+import re
+
+from . import error
+from . import kicad_defs
+from . import manifest
+from . import pcb_reader
+from . import plot_config as PCfg
+
+
+class PlanError(error.KiPlotError):
+    pass
+
+
+# characters pcbnew replaces with '_' in plot file suffixes
+# (BuildPlotFileName)
+_BAD_SUFFIX_CHARS_RE = re.compile(r'[\\/:"<>|*?%.]')
+
+_LAYER_FORMATS = {
+    PCfg.OutputOptions.GERBER: kicad_defs.PLOT_FORMAT_GERBER,
+    PCfg.OutputOptions.POSTSCRIPT: kicad_defs.PLOT_FORMAT_POST,
+    PCfg.OutputOptions.HPGL: kicad_defs.PLOT_FORMAT_HPGL,
+    PCfg.OutputOptions.PDF: kicad_defs.PLOT_FORMAT_PDF,
+    PCfg.OutputOptions.DXF: kicad_defs.PLOT_FORMAT_DXF,
+    PCfg.OutputOptions.SVG: kicad_defs.PLOT_FORMAT_SVG,
+    # plotted as gerbers, drawn to PNGs
+    PCfg.OutputOptions.PREVIEW: kicad_defs.PLOT_FORMAT_GERBER,
+}
+
+
+class OutputPlan(object):
+    """
+    What plotting an output would do
+    """
+
+    def __init__(self, name, otype):
+
+        self.name = name
+        self.type = otype
+
+        # the files written, relative to the config's output dir
+        self.files = []
+        # those not in the output dir now
+        self.missing = []
+
+        # the expected time to plot, in seconds (None: not known)
+        self.seconds = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'type': self.type,
+            'files': self.files,
+            'missing': self.missing,
+            'seconds': self.seconds,
+        }
+
+
+def plot_file_name(board_name, suffix, ext):
+    """
+    Get the name of a file plotted with PLOT_CONTROLLER.OpenPlotfile
+    """
+
+    suffix = _BAD_SUFFIX_CHARS_RE.sub('_', suffix.strip())
+
+    if suffix:
+        board_name += '-' + suffix
+
+    return board_name + '.' + ext
+
+
+def merged_file_name(board_name, op):
+    """
+    Get the name of the file the layers of a single_file output are merged
+    into, named after the output as its layers are after their suffixes
+    """
+
+    fmt = _LAYER_FORMATS[op.options.type]
+
+    return plot_file_name(board_name, op.name, kicad_defs.PLOT_EXTENSIONS[fmt])
+
+
+def _layer_files(board_name, op):
+    """
+    Get the files of a layer output. The tiles of a preview are not known
+    until it is drawn, so they are given as a glob pattern.
+    """
+
+    if getattr(op.options.type_options, 'single_file', False):
+        return [merged_file_name(board_name, op)]
+
+    fmt = _LAYER_FORMATS[op.options.type]
+
+    protel = (op.options.type == PCfg.OutputOptions.GERBER and
+              op.options.type_options.use_protel_extensions)
+
+    files = []
+
+    for l in op.layers:
+
+        if protel:
+            ext = kicad_defs.GetGerberProtelExtension(l.layer.layer)
+        elif op.options.type == PCfg.OutputOptions.PREVIEW:
+            ext = 'png'
+        else:
+            ext = kicad_defs.PLOT_EXTENSIONS[fmt]
+
+        fn = plot_file_name(board_name, l.suffix, ext)
+
+        if (op.options.type == PCfg.OutputOptions.PREVIEW and
+                op.options.type_options.tile_size):
+            fn = fn[:-len('.png')] + '-r*c*.png'
+
+        files.append(fn)
+
+    return files
+
+
+def _drill_files(board_name, op):
+    """
+    Get the files of a drill output, as the drill writers name them. Blind
+    and buried via layer pairs are not known without loading the board, so
+    only through holes are listed.
+    """
+
+    to = op.options.type_options
+
+    if op.options.type == PCfg.OutputOptions.EXCELLON:
+        mark = ''
+        ext = 'drl'
+        merged = to.pth_and_npth_single_file
+    else:
+        # gerber drill files are marked with -drl, and never merged
+        mark = '-drl'
+        ext = 'gbr'
+        merged = False
+
+    if merged:
+        names = [board_name]
+    else:
+        # the NPTH file is written even if there are no NPTH holes
+        names = [board_name + '-PTH', board_name + '-NPTH']
+
+    files = ["{}{}.{}".format(n, mark, ext) for n in names]
+
+    if to.generate_map:
+        map_ext = kicad_defs.PLOT_EXTENSIONS[to.map_options.type]
+        files += ["{}{}-drl_map.{}".format(n, mark, map_ext)
+                  for n in names]
+
+    if to.generate_report:
+        files.append(to.report_options.filename)
+
+    return files
+
+
+def _output_files(board_name, op):
+    """
+    :return: the files of an output, relative to its output dir
+    """
+
+    if op.options.type in _LAYER_FORMATS:
+        return _layer_files(board_name, op)
+
+    if op.options.type in [PCfg.OutputOptions.EXCELLON,
+                           PCfg.OutputOptions.GERB_DRILL]:
+        return _drill_files(board_name, op)
+
+    if op.options.type == PCfg.OutputOptions.ARCHIVE:
+        return [op.options.type_options.filename]
+
+    raise PlanError("Don't know the files of type {}"
+                    .format(op.options.type))
+
+
+def _file_exists(outdir, fn):
+    """
+    :param fn: a file name, or a glob pattern of (the last part of) one
+    """
+
+    path = os.path.join(outdir, fn)
+
+    if '*' not in fn:
+        return os.path.exists(path)
+
+    dirname, pattern = os.path.split(path)
+
+    try:
+        return bool(fnmatch.filter(os.listdir(dirname), pattern))
+    except OSError:
+        return False
+
+
+def _estimate_seconds(mf, op_plan):
+    """
+    Estimate the time to plot an output from the last run, scaled by the
+    number of files (layers) it has now
+    """
+
+    seconds, n_files = mf.get_timing(op_plan.name)
+
+    if seconds is None or not n_files:
+        return None
+
+    return seconds * len(op_plan.files) / float(n_files)
+
+
+def plan_board(cfg, brd_file):
+    """
+    Plan the plot of a board into the config's output dir
+
+    :return: [OutputPlan]
+    :raises PlanError: if the config doesn't fit the board
+    """
+
+    try:
+        info = pcb_reader.read_board_info(brd_file)
+    except pcb_reader.PcbReadError as e:
+        raise PlanError(str(e))
+
+    errs = cfg.check_inner_layers(info.copper_layers)
+
+    if errs:
+        raise PlanError("{}:\n{}".format(brd_file, "\n".join(errs)))
+
+    mf = manifest.Manifest(cfg.outdir)
+    mf.load()
+
+    # plot files are named after the board file
+    board_name = os.path.splitext(os.path.basename(brd_file))[0]
+
+    plans = []
+
+    for op in cfg.outputs:
+
+        op_plan = OutputPlan(op.name, op.options.type)
+
+        op_plan.files = [os.path.normpath(os.path.join(op.outdir, fn))
+                         for fn in _output_files(board_name, op)]
+        op_plan.missing = [
+            fn for fn in op_plan.files
+            if not _file_exists(cfg.outdir, fn)]
+        op_plan.seconds = _estimate_seconds(mf, op_plan)
+
+        plans.append(op_plan)
+
+    return plans
+
+
+def format_plan(brd_file, outdir, plans):
+    """
+    Describe the plan of a board, for people
+    """
+
+    lines = ["{} -> {}".format(brd_file, outdir)]
+
+    for p in plans:
+
+        if p.seconds is None:
+            cost = "no past timing"
+        else:
+            cost = "~{:.2f}s".format(p.seconds)
+
+        lines.append("  {} ({}, {} files, {})".format(
+            p.name, p.type, len(p.files), cost))
+
+        for fn in p.files:
+            lines.append("    {}{}".format(
+                fn, " (missing)" if fn in p.missing else ""))
+
+    known = [p.seconds for p in plans if p.seconds is not None]
+
+    lines.append("  expected: ~{:.2f}s{}".format(
+        sum(known), " (some outputs not timed yet)"
+        if len(known) < len(plans) else ""))
+
+    return "\n".join(lines)
@@ -1,15 +1,32 @@
 
+import hashlib
+import json
 import os
 
-import pcbnew
-
 from . import error
+from . import kicad_defs
 
 
 class KiPlotConfigurationError(error.KiPlotError):
     pass
 
 
+def _describe(obj):
+    """
+    Get a plain (JSON-serialisable) description of a config object
+    """
+
+    if isinstance(obj, (list, tuple)):
+        return [_describe(o) for o in obj]
+
+    if hasattr(obj, '__dict__'):
+        desc = dict((k, _describe(v)) for k, v in vars(obj).items())
+        desc['__class__'] = type(obj).__name__
+        return desc
+
+    return obj
+
+
 class TypeOptions(object):
 
     def validate(self):
@@ -54,7 +71,7 @@ class LayerOptions(TypeOptions):
         self._negative_plot = False
 
         self._supports_drill_marks = False
-        self._drill_marks = pcbnew.PCB_PLOT_PARAMS.NO_DRILL_SHAPE
+        self._drill_marks = kicad_defs.NO_DRILL_SHAPE
 
         self._support_sketch_mode = False
         self._sketch_mode = False
@@ -69,7 +86,7 @@ class LayerOptions(TypeOptions):
         Set the line width, in mm
         """
         if self._supports_line_width:
-            self._line_width = pcbnew.FromMM(value)
+            self._line_width = kicad_defs.FromMM(value)
         else:
             raise KiPlotConfigurationError(
                 "This output doesn't support setting line width")
@@ -137,9 +154,9 @@ class LayerOptions(TypeOptions):
 
             try:
                 drill_mark = {
-                    'none': pcbnew.PCB_PLOT_PARAMS.NO_DRILL_SHAPE,
-                    'small': pcbnew.PCB_PLOT_PARAMS.SMALL_DRILL_SHAPE,
-                    'full': pcbnew.PCB_PLOT_PARAMS.FULL_DRILL_SHAPE,
+                    'none': kicad_defs.NO_DRILL_SHAPE,
+                    'small': kicad_defs.SMALL_DRILL_SHAPE,
+                    'full': kicad_defs.FULL_DRILL_SHAPE,
                 }[val]
             except KeyError:
                 raise KiPlotConfigurationError(
@@ -243,7 +260,7 @@ class HpglOptions(LayerOptions):
 
     @pen_width.setter
     def pen_width(self, pw_mm):
-        self._pen_width = pcbnew.FromMM(pw_mm)
+        self._pen_width = kicad_defs.FromMM(pw_mm)
 
 
 class PsOptions(LayerOptions):
@@ -272,7 +289,7 @@ class PsOptions(LayerOptions):
 
     @width_adjust.setter
     def width_adjust(self, width_adjust_mm):
-        self._width_adjust = pcbnew.FromMM(width_adjust_mm)
+        self._width_adjust = kicad_defs.FromMM(width_adjust_mm)
 
 
 class SvgOptions(LayerOptions):
@@ -286,6 +303,9 @@ class SvgOptions(LayerOptions):
         self._supports_negative = True
         self._supports_drill_marks = True
 
+        # merge the layers into one file
+        self.single_file = False
+
 
 class PdfOptions(LayerOptions):
 
@@ -298,6 +318,9 @@ class PdfOptions(LayerOptions):
         self._supports_negative = True
         self._supports_drill_marks = True
 
+        # merge the layers into one file
+        self.single_file = False
+
 
 class DxfOptions(LayerOptions):
 
@@ -311,6 +334,44 @@ class DxfOptions(LayerOptions):
         self.polygon_mode = False
 
 
+class PreviewOptions(LayerOptions):
+    """
+    Options of PNG previews, drawn from Gerber plots of the layers
+    """
+
+    def __init__(self):
+
+        super(PreviewOptions, self).__init__()
+
+        self._supports_line_width = True
+
+        # the options of the Gerber plots the previews are drawn from,
+        # which previews needn't give
+        self.plot_footprint_refs = True
+        self.plot_footprint_values = True
+        self.force_plot_invisible_refs_vals = False
+        self.tent_vias = True
+        self.check_zone_fills = False
+        self.line_width = 0.1
+
+        self.dpi = 300
+        # the width and height of the tiles in pixels (0: one image)
+        self.tile_size = 0
+
+    def validate(self):
+
+        errs = super(PreviewOptions, self).validate()
+
+        if not 0 < self.dpi <= 2400:
+            errs.append("Preview dpi must be 1-2400: {}".format(self.dpi))
+
+        if self.tile_size < 0:
+            errs.append("Preview tile size can't be negative: {}"
+                        .format(self.tile_size))
+
+        return errs
+
+
 class DrillOptions(TypeOptions):
 
     def __init__(self):
@@ -341,6 +402,12 @@ class ExcellonOptions(DrillOptions):
         self.minimal_header = False
         self.mirror_y_axis = False
 
+        self.verify_options = None
+
+    @property
+    def verify(self):
+        return self.verify_options is not None
+
 
 class GerberDrillOptions(DrillOptions):
 
@@ -361,6 +428,54 @@ class DrillMapOptions(object):
         self.type = None
 
 
+class DrillVerifyOptions(object):
+    """
+    Checks of the drill files once they are written
+    """
+
+    def __init__(self):
+        # the least gap between holes, in mm (0: not checked)
+        self.min_hole_spacing = 0.0
+
+
+class ArchiveOptions(TypeOptions):
+    """
+    Options of an archive of the files of other outputs
+    """
+
+    ZIP = 'zip'
+    TAR_GZ = 'tar.gz'
+
+    FORMATS = [ZIP, TAR_GZ]
+
+    def __init__(self):
+
+        super(ArchiveOptions, self).__init__()
+
+        self.format = self.ZIP
+        self.filename = None
+        self.compression_level = 6
+
+        # names of the outputs to archive
+        self.outputs = []
+
+    def validate(self):
+
+        errs = []
+
+        if self.format not in self.FORMATS:
+            errs.append("Unknown archive format: {}".format(self.format))
+
+        if self.compression_level not in range(10):
+            errs.append("Archive compression level must be 0-9: {}"
+                        .format(self.compression_level))
+
+        if not self.outputs:
+            errs.append("Archive needs some outputs")
+
+        return errs
+
+
 class OutputOptions(object):
 
     GERBER = 'gerber'
@@ -369,10 +484,13 @@ class OutputOptions(object):
     SVG = 'svg'
     PDF = 'pdf'
     DXF = 'dxf'
+    PREVIEW = 'preview'
 
     EXCELLON = 'excellon'
     GERB_DRILL = 'gerb_drill'
 
+    ARCHIVE = 'archive'
+
     def __init__(self, otype):
         self.type = otype
 
@@ -388,10 +506,14 @@ class OutputOptions(object):
             self.type_options = DxfOptions()
         elif otype == self.PDF:
             self.type_options = PdfOptions()
+        elif otype == self.PREVIEW:
+            self.type_options = PreviewOptions()
         elif otype == self.EXCELLON:
             self.type_options = ExcellonOptions()
         elif otype == self.GERB_DRILL:
             self.type_options = GerberDrillOptions()
+        elif otype == self.ARCHIVE:
+            self.type_options = ArchiveOptions()
         else:
             self.type_options = None
 
@@ -434,6 +556,25 @@ class PlotOutput(object):
     def validate(self):
         return self.options.validate()
 
+    def fingerprint(self):
+        """
+        Get a digest of everything in this output that affects the files
+        it plots (but not where they are put)
+        """
+
+        desc = {
+            'type': self.options.type,
+            'options': _describe(self.options.type_options),
+            'layers': _describe(self.layers),
+        }
+
+        # the layers are merged into a file named after the output
+        if getattr(self.options.type_options, 'single_file', False):
+            desc['name'] = self.name
+
+        data = json.dumps(desc, sort_keys=True)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
 
 class PlotConfig(object):
 
@@ -444,6 +585,10 @@ class PlotConfig(object):
 
         self.check_zone_fills = False
         self.run_drc = False
+        # the DRC report, relative to the output dir
+        self.drc_report = 'drc.rpt'
+        # plot even if the DRC fails
+        self.ignore_drc_errors = False
 
     def add_output(self, new_op):
         self._outputs.append(new_op)
@@ -476,8 +621,49 @@ class PlotConfig(object):
         for o in self._outputs:
             errs += o.validate()
 
+            if o.options.type == OutputOptions.ARCHIVE:
+                errs += self.validate_archive(o)
+
+        return errs
+
+    def validate_archive(self, archive):
+        """
+        Check the outputs an archive refers to
+        """
+
+        errs = []
+
+        for name in archive.options.type_options.outputs:
+
+            o = self.get_output_by_name(name)
+
+            if o is None:
+                errs.append("Archive {} has unknown output: {}"
+                            .format(archive.name, name))
+            elif o.options.type == OutputOptions.ARCHIVE:
+                errs.append("Archive {} can't include another archive: {}"
+                            .format(archive.name, name))
+
         return errs
 
+    def check_inner_layers(self, copper_layers, outputs=None):
+        """
+        Check the inner layers of outputs exist on a board
+
+        :param copper_layers: the number of copper layers of the board
+        :param outputs: the outputs to check (default: all of them)
+        :return: list of errors
+        """
+
+        if outputs is None:
+            outputs = self._outputs
+
+        return ["Output {}: Inner.{} is not valid for a board with {} "
+                "copper layers".format(o.name, l.layer.layer, copper_layers)
+                for o in outputs for l in o.layers
+                if l.layer.is_inner and
+                not 1 <= l.layer.layer < copper_layers - 1]
+
     @property
     def outputs(self):
         return self._outputs
@@ -0,0 +1,461 @@
+"""
+Raster previews of plotted layers: Gerber files are drawn to greyscale PNG
+images (optionally split into tiles) by a scanline rasterizer, without
+KiCad or an external renderer.
+
+Each image is cached by a digest of what its Gerber file draws (not its
+headers, so a replot of an unchanged layer is not drawn again) and of the
+render settings.
+
+Dark objects are drawn before clear ones, rather than in file order, and
+macro apertures are not drawn.
+"""
+
+import hashlib
+import logging
+import math
+import re
+import struct
+import zlib
+
+from . import cache
+from . import error
+from . import gerber
+
+# bumped when rendering changes, so cached images are drawn again
+RENDER_VERSION = 1
+
+# pixel values
+BACKGROUND = 255
+DARK = 0
+
+# mm around the frame of the board
+FRAME_MARGIN = 1.0
+
+# segments of a full circle, for arcs
+_ARC_STEPS = 64
+
+# the parts of a Gerber file that don't change what it draws: comments and
+# attributes (which hold timestamps)
+_NOT_DRAWN_RE = re.compile(br'(?m)^\s*(?:G04[^*]*\*|%T[FAOD][^%]*%)\s*$')
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class PreviewError(error.KiPlotError):
+    pass
+
+
+class Raster(object):
+    """
+    An 8-bit greyscale image, one byte per pixel, row by row
+    """
+
+    def __init__(self, width, height):
+
+        self.width = width
+        self.height = height
+        self.pixels = bytearray([BACKGROUND]) * (width * height)
+
+        # a row of each value, to fill spans from
+        self._rows = {}
+
+    def fill_span(self, y, x0, x1, value):
+        """
+        Fill the pixels of a row whose centres are between x0 and x1
+        """
+
+        i0 = max(0, int(math.ceil(x0 - 0.5)))
+        i1 = min(self.width, int(math.floor(x1 - 0.5)) + 1)
+
+        if i1 <= i0:
+            return
+
+        row = self._rows.get(value)
+
+        if row is None:
+            row = self._rows[value] = bytearray([value]) * self.width
+
+        o = y * self.width
+        self.pixels[o + i0:o + i1] = row[:i1 - i0]
+
+    def _rows_between(self, y0, y1):
+
+        return range(max(0, int(math.ceil(y0 - 0.5))),
+                     min(self.height, int(math.floor(y1 - 0.5)) + 1))
+
+    def fill_circle(self, cx, cy, r, value):
+
+        for y in self._rows_between(cy - r, cy + r):
+
+            dy = y + 0.5 - cy
+            half = math.sqrt(max(0.0, r * r - dy * dy))
+            self.fill_span(y, cx - half, cx + half, value)
+
+    def fill_polygon(self, points, value):
+        """
+        Fill a polygon (even-odd), through a list of the edges crossing
+        each row
+        """
+
+        edges = []
+
+        for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+
+            if y0 == y1:
+                continue
+
+            if y0 > y1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+
+            edges.append((y0, y1, x0, (x1 - x0) / (y1 - y0)))
+
+        if not edges:
+            return
+
+        edges.sort()
+
+        active = []
+        n = 0
+
+        for y in self._rows_between(edges[0][0], max(e[1] for e in edges)):
+
+            yc = y + 0.5
+
+            while n < len(edges) and edges[n][0] <= yc:
+                active.append(edges[n])
+                n += 1
+
+            active = [e for e in active if e[1] > yc]
+
+            xs = sorted(x0 + (yc - y0) * slope
+                        for y0, y1, x0, slope in active)
+
+            for i in range(0, len(xs) - 1, 2):
+                self.fill_span(y, xs[i], xs[i + 1], value)
+
+    def fill_stroke(self, p0, p1, r, value):
+        """
+        Fill a line with round ends
+        """
+
+        dx = p1[0] - p0[0]
+        dy = p1[1] - p0[1]
+        length = math.hypot(dx, dy)
+
+        if length:
+            nx = -dy / length * r
+            ny = dx / length * r
+            self.fill_polygon([(p0[0] + nx, p0[1] + ny),
+                               (p1[0] + nx, p1[1] + ny),
+                               (p1[0] - nx, p1[1] - ny),
+                               (p0[0] - nx, p0[1] - ny)], value)
+
+        self.fill_circle(p0[0], p0[1], r, value)
+        self.fill_circle(p1[0], p1[1], r, value)
+
+    def encode_png(self, x0=0, y0=0, width=None, height=None):
+        """
+        Encode (part of) the image as a PNG
+
+        :return: the PNG's bytes
+        """
+
+        if width is None:
+            width = self.width - x0
+        if height is None:
+            height = self.height - y0
+
+        z = zlib.compressobj(6)
+        chunks = []
+
+        for y in range(y0, y0 + height):
+            o = y * self.width + x0
+            # filter type 0 (none)
+            chunks.append(z.compress(b'\x00' +
+                                     bytes(self.pixels[o:o + width])))
+
+        chunks.append(z.flush())
+
+        # 8-bit greyscale
+        header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+
+        return (_PNG_SIGNATURE + _png_chunk(b'IHDR', header) +
+                _png_chunk(b'IDAT', b''.join(chunks)) +
+                _png_chunk(b'IEND', b''))
+
+
+def _png_chunk(kind, data):
+
+    return (struct.pack('>I', len(data)) + kind + data +
+            struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+
+def _convex_hull(points):
+
+    points = sorted(set(points))
+
+    if len(points) < 3:
+        return points
+
+    def half(pts):
+        hull = []
+
+        for p in pts:
+            while len(hull) > 1 and (
+                    (hull[-1][0] - hull[-2][0]) * (p[1] - hull[-2][1]) -
+                    (hull[-1][1] - hull[-2][1]) * (p[0] - hull[-2][0])) <= 0:
+                hull.pop()
+
+            hull.append(p)
+
+        return hull[:-1]
+
+    return half(points) + half(points[::-1])
+
+
+class _Renderer(object):
+    """
+    Draws the objects of a Gerber file onto a raster
+
+    :param frame: (x0, y0, x1, y1) of the area drawn, in Gerber mm
+    """
+
+    def __init__(self, gbr, frame, dpi):
+
+        self.gbr = gbr
+        self.frame = frame
+        self.scale = dpi / gerber.MM_PER_INCH
+
+        self.raster = Raster(
+            max(1, int(math.ceil((frame[2] - frame[0]) * self.scale))),
+            max(1, int(math.ceil((frame[3] - frame[1]) * self.scale))))
+
+        # macro apertures skipped
+        self.skipped = 0
+
+    def px(self, x, y):
+
+        # images go down, Gerber files go up
+        return ((x - self.frame[0]) * self.scale,
+                (self.frame[3] - y) * self.scale)
+
+    def radius(self, mm):
+
+        # at least a pixel wide, so thin lines don't disappear
+        return max(0.5, mm * self.scale / 2.0)
+
+    def aperture_outline(self, ap, x, y):
+        """
+        Get the polygon of a rect or polygon aperture at a point (in
+        pixels), None for the other shapes
+        """
+
+        cx, cy = self.px(x, y)
+
+        if ap.template == 'R':
+            w = max(1.0, ap.params[0] * self.scale) / 2.0
+            h = max(1.0, ap.params[1] * self.scale) / 2.0
+            return [(cx - w, cy - h), (cx + w, cy - h), (cx + w, cy + h),
+                    (cx - w, cy + h)]
+
+        if ap.template == 'P':
+            r = self.radius(ap.params[0])
+            n = int(ap.params[1])
+            rot = math.radians(ap.params[2]) if len(ap.params) > 2 else 0.0
+            # counter-clockwise in Gerber is clockwise in the image
+            return [(cx + r * math.cos(rot + 2 * math.pi * i / n),
+                     cy - r * math.sin(rot + 2 * math.pi * i / n))
+                    for i in range(n)]
+
+        return None
+
+    def flash(self, ap, x, y, value):
+
+        r = self.raster
+
+        if ap.template == 'C':
+            cx, cy = self.px(x, y)
+            r.fill_circle(cx, cy, self.radius(ap.params[0]), value)
+        elif ap.template == 'O':
+            w, h = ap.params[:2]
+            # a stroke along the long side
+            if w > h:
+                d = (w - h) / 2.0
+                p0, p1 = self.px(x - d, y), self.px(x + d, y)
+            else:
+                d = (h - w) / 2.0
+                p0, p1 = self.px(x, y - d), self.px(x, y + d)
+            r.fill_stroke(p0, p1, self.radius(min(w, h)), value)
+        elif ap.template in ['R', 'P']:
+            r.fill_polygon(self.aperture_outline(ap, x, y), value)
+        else:
+            self.skipped += 1
+
+    def stroke(self, ap, p0, p1, value):
+        """
+        Draw a line from p0 to p1 (in mm) with an aperture
+        """
+
+        if ap.template == 'R':
+            # the hull of the rect at each end
+            self.raster.fill_polygon(_convex_hull(
+                self.aperture_outline(ap, *p0) +
+                self.aperture_outline(ap, *p1)), value)
+        elif ap.template in gerber.TEMPLATES:
+            self.raster.fill_stroke(self.px(*p0), self.px(*p1),
+                                    self.radius(ap.params[0]), value)
+        else:
+            self.skipped += 1
+
+    def arc_points(self, x0, y0, x1, y1, cx, cy, clockwise):
+
+        a0 = math.atan2(y0 - cy, x0 - cx)
+        a1 = math.atan2(y1 - cy, x1 - cx)
+        sweep = a1 - a0
+
+        if clockwise:
+            sweep = sweep - 2 * math.pi if sweep >= 0 else sweep
+        else:
+            sweep = sweep + 2 * math.pi if sweep <= 0 else sweep
+
+        r = math.hypot(x0 - cx, y0 - cy)
+        n = max(1, int(abs(sweep) / (2 * math.pi) * _ARC_STEPS))
+
+        return [(cx + r * math.cos(a0 + sweep * i / n),
+                 cy + r * math.sin(a0 + sweep * i / n))
+                for i in range(n + 1)]
+
+    def render(self):
+
+        gbr = self.gbr
+        aps = gbr.apertures
+
+        for dark in [1, 0]:
+
+            value = DARK if dark else BACKGROUND
+
+            f = gbr.flashes
+
+            for i in range(len(f)):
+                if f.dark[i] == dark:
+                    self.flash(aps[f.aperture[i]], f.x[i], f.y[i], value)
+
+            d = gbr.draws
+
+            for i in range(len(d)):
+                if d.dark[i] == dark:
+                    self.stroke(aps[d.aperture[i]], (d.x0[i], d.y0[i]),
+                                (d.x1[i], d.y1[i]), value)
+
+            a = gbr.arcs
+
+            for i in range(len(a)):
+                if a.dark[i] != dark:
+                    continue
+
+                points = self.arc_points(a.x0[i], a.y0[i], a.x1[i], a.y1[i],
+                                         a.cx[i], a.cy[i], a.clockwise[i])
+
+                for p0, p1 in zip(points, points[1:]):
+                    self.stroke(aps[a.aperture[i]], p0, p1, value)
+
+            rg = gbr.regions
+            pts = gbr.region_points
+
+            for i in range(len(rg)):
+                if rg.dark[i] != dark:
+                    continue
+
+                end = rg.start[i + 1] if i + 1 < len(rg) else len(pts)
+                self.raster.fill_polygon(
+                    [self.px(pts.x[j], pts.y[j])
+                     for j in range(rg.start[i], end)], value)
+
+        if self.skipped:
+            logging.debug("Skipped {} objects with macro apertures"
+                          .format(self.skipped))
+
+        return self.raster
+
+
+def render_gerber(gbr, frame, dpi):
+    """
+    Draw a Gerber file
+
+    :param gbr: gerber.Gerber
+    :param frame: (x0, y0, x1, y1) of the area to draw, in Gerber mm
+    :return: Raster
+    """
+
+    return _Renderer(gbr, frame, dpi).render()
+
+
+def tile_images(raster, tile_size=0):
+    """
+    Encode a raster as PNGs, in tiles of (up to) tile_size pixels square
+
+    :param tile_size: 0 for a single image
+    :return: [(name suffix, PNG bytes)], the suffix being '' if untiled,
+        otherwise -r<row>c<column>
+    """
+
+    if not tile_size:
+        return [('', raster.encode_png())]
+
+    images = []
+
+    for row, y in enumerate(range(0, raster.height, tile_size)):
+        for col, x in enumerate(range(0, raster.width, tile_size)):
+            images.append(('-r{}c{}'.format(row, col), raster.encode_png(
+                x, y, min(tile_size, raster.width - x),
+                min(tile_size, raster.height - y))))
+
+    return images
+
+
+def drawn_digest(data):
+    """
+    Get a digest of what Gerber data draws: the data without its comments
+    and attributes
+    """
+
+    return hashlib.sha1(_NOT_DRAWN_RE.sub(b'', data)).hexdigest()
+
+
+def render_file(gbr_file, frame, dpi, tile_size=0, preview_cache=None):
+    """
+    Draw a Gerber file to PNG images, or get them from the cache
+
+    :param preview_cache: cache.PreviewCache (None: don't cache)
+    :return: [(name suffix, PNG bytes)], as tile_images
+    :raises PreviewError: if the file can't be read
+    """
+
+    try:
+        with open(gbr_file, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError) as e:
+        raise PreviewError("Can't read {}: {}".format(gbr_file, e))
+
+    key = cache.make_key(str(RENDER_VERSION), drawn_digest(data),
+                         repr(tuple(frame)), repr(dpi), str(tile_size))
+
+    if preview_cache:
+        images = preview_cache.load(key)
+
+        if images is not None:
+            logging.debug("Preview of {} is cached".format(gbr_file))
+            return images
+
+    try:
+        gbr = gerber.parse_gerber(data, gbr_file)
+    except gerber.GerberError as e:
+        raise PreviewError(str(e))
+
+    images = tile_images(render_gerber(gbr, frame, dpi), tile_size)
+
+    if preview_cache:
+        preview_cache.store(key, images)
+
+    return images
@@ -0,0 +1,162 @@
+"""
+A plot server, which keeps pcbnew and recently used boards loaded, and takes
+plot jobs over a Unix domain socket.
+
+The protocol is one JSON object per line: the client sends a request and
+the server replies with {"ok": true} or {"ok": false, "error": "..."}.
+A plot request has:
+
+* board: path of the board file
+* config: path of the plot config file, or
+* config_text: the plot config itself
+* outdir: the output dir
+
+{"command": "shutdown"} stops the server.
+"""
+
+import io
+import json
+import logging
+import os
+import socket
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from . import boards
+from . import config_reader
+from . import error
+
+
+class ServerError(error.KiPlotError):
+    pass
+
+
+def read_config(request):
+    """
+    Get the (validated) plot config of a request
+    """
+
+    try:
+        if 'config_text' in request:
+            cfg = config_reader.CfgYamlReader().read(
+                io.StringIO(request['config_text']))
+        elif 'config' in request:
+            cfg = config_reader.read_file(request['config'])
+        else:
+            raise ServerError("Request needs a config or config_text")
+    except config_reader.YamlError as e:
+        raise ServerError("Invalid config:\n" + "\n".join(e.errors))
+
+    return cfg
+
+
+class PlotRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        line = self.rfile.readline()
+
+        try:
+            request = json.loads(line.decode('utf-8'))
+            self.server.handle_request_data(request)
+            response = {'ok': True}
+        except Exception as e:
+            logging.debug(traceback.format_exc())
+            logging.error("Request failed: {}".format(e))
+            response = {'ok': False, 'error': str(e)}
+
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class PlotServer(socketserver.UnixStreamServer):
+    """
+    Serves plot jobs one at a time (pcbnew is not thread-safe)
+    """
+
+    def __init__(self, socket_path, max_boards):
+        """
+        :param socket_path: the path of the Unix domain socket to listen on
+        :param max_boards: the number of boards to keep loaded
+        """
+
+        self.board_cache = boards.BoardCache(max_boards)
+
+        # settings of the Plotter for each job
+        self.plotter_options = {}
+
+        self._shutdown = False
+
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               PlotRequestHandler)
+
+    def handle_request_data(self, request):
+
+        command = request.get('command', 'plot')
+
+        if command == 'plot':
+            self.plot(request)
+        elif command == 'shutdown':
+            logging.info("Shutting down")
+            self._shutdown = True
+        else:
+            raise ServerError("Unknown command: {}".format(command))
+
+    def plot(self, request):
+
+        try:
+            brd_file = request['board']
+            outdir = request['outdir']
+        except KeyError as e:
+            raise ServerError("Request needs a {}".format(e))
+
+        logging.info("Plotting {} to {}".format(brd_file, outdir))
+
+        cfg = read_config(request)
+        cfg.outdir = outdir
+
+        # imports pcbnew, which is loaded once, by the first plot
+        from . import kiplot
+
+        plotter = kiplot.Plotter(cfg)
+        plotter.board_cache = self.board_cache
+
+        for k, v in self.plotter_options.items():
+            setattr(plotter, k, v)
+
+        plotter.plot(brd_file)
+
+    def serve(self):
+
+        while not self._shutdown:
+            self.handle_request()
+
+        self.server_close()
+        os.unlink(self.server_address)
+
+
+def remove_stale_socket(socket_path):
+    """
+    Remove a socket left by a server that is no longer running
+
+    :raises ServerError: if a server is running on the socket
+    """
+
+    if not os.path.exists(socket_path):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        os.unlink(socket_path)
+        return
+    finally:
+        sock.close()
+
+    raise ServerError("A server is already running on {}"
+                      .format(socket_path))
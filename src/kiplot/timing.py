@@ -0,0 +1,172 @@
+"""
+Timing of the phases of a plot run, for profiling
+"""
+
+import contextlib
+import json
+import os
+import time
+
+# for durations: a monotonic clock, if we have one
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class Span(object):
+    """
+    A timed phase of a run
+    """
+
+    def __init__(self, name, start, duration, pid, args):
+
+        self.name = name
+        # wall-clock time, in seconds since the epoch
+        self.start = start
+        # in seconds
+        self.duration = duration
+        # process the span ran in
+        self.pid = pid
+        # details, e.g. the output or layer
+        self.args = args
+
+    @property
+    def label(self):
+
+        if not self.args:
+            return self.name
+
+        return "{} ({})".format(self.name, ", ".join(
+            "{}".format(self.args[k]) for k in sorted(self.args)))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'pid': self.pid,
+            'args': self.args,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['name'], d['start'], d['duration'], d['pid'], d['args'])
+
+
+class Profiler(object):
+    """
+    Collects timing spans, when enabled
+    """
+
+    def __init__(self):
+
+        self.enabled = False
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """
+        Time the enclosed block
+
+        :param name: the name of the phase
+        :param args: details of what is being done
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+        t0 = _clock()
+
+        try:
+            yield
+        finally:
+            self.spans.append(Span(name, start, _clock() - t0, os.getpid(),
+                                   args))
+
+    def reset(self, enabled):
+        """
+        Start collecting afresh (e.g. in a forked worker process)
+        """
+
+        self.enabled = enabled
+        self.spans = []
+
+    def take_spans(self):
+        """
+        Remove and return the spans collected so far, as plain dicts (e.g. to
+        pass them from a worker process)
+        """
+
+        spans = [s.to_dict() for s in self.spans]
+        self.spans = []
+        return spans
+
+    def add_spans(self, spans):
+        """
+        Add spans from take_spans (e.g. from a worker process)
+        """
+
+        self.spans += [Span.from_dict(d) for d in spans]
+
+    def format_summary(self):
+        """
+        Get a table of the total time spent in each phase, slowest first
+        """
+
+        totals = {}
+
+        for s in self.spans:
+            count, total, longest = totals.get(s.label, (0, 0.0, 0.0))
+            totals[s.label] = (count + 1, total + s.duration,
+                               max(longest, s.duration))
+
+        rows = sorted(totals.items(), key=lambda r: r[1][1], reverse=True)
+
+        width = max([len(label) for label, _ in rows] + [len('Phase')])
+
+        lines = ["{:<{w}}  {:>5}  {:>10}  {:>10}".format(
+            'Phase', 'Count', 'Total (s)', 'Max (s)', w=width)]
+
+        for label, (count, total, longest) in rows:
+            lines.append("{:<{w}}  {:>5}  {:>10.4f}  {:>10.4f}".format(
+                label, count, total, longest, w=width))
+
+        return "\n".join(lines)
+
+    def write_json(self, fstream):
+
+        json.dump([s.to_dict() for s in self.spans], fstream, indent=1)
+
+    def write_chrome_trace(self, fstream):
+        """
+        Write the spans in the Chrome trace event format (for
+        chrome://tracing or Perfetto)
+        """
+
+        events = []
+
+        for s in self.spans:
+            events.append({
+                'name': s.name,
+                'cat': 'kiplot',
+                'ph': 'X',
+                'ts': s.start * 1e6,
+                'dur': s.duration * 1e6,
+                'pid': s.pid,
+                'tid': s.pid,
+                'args': s.args,
+            })
+
+        json.dump({'traceEvents': events}, fstream)
+
+
+# the profiler used by KiPlot
+profiler = Profiler()
+
+
+def span(name, **args):
+    """
+    Time a phase with the KiPlot profiler
+    """
+
+    return profiler.span(name, **args)
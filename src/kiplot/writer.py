@@ -0,0 +1,211 @@
+"""
+Moving of plotted files from staging dirs in a (local) scratch dir to the
+output dir, in the background, so plotting doesn't wait on the output dir's
+storage
+"""
+
+import errno
+import logging
+import os
+import shutil
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import error
+
+# files are copied under this suffix, and renamed when complete, so the
+# output dir never has partly written files
+TMP_SUFFIX = '.kiplot-tmp'
+
+
+class WriterError(error.KiPlotError):
+    pass
+
+
+def _fsync_dir(path):
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # dirs can't be opened (to sync) on some platforms
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _fsync_file(path):
+
+    # opened for writing, as some platforms only sync files opened so
+    with open(path, 'rb+') as f:
+        os.fsync(f.fileno())
+
+
+class OutputWriter(object):
+    """
+    Moves the files of staging dirs into the output dir from a background
+    thread. Files on the same filesystem are renamed into place, others are
+    copied under a temporary name and then renamed. The files of a staging
+    dir are all written, then synced together, and only then renamed, so
+    a name never points at a partly written file; the dirs written to are
+    synced when the writer catches up, not after every file.
+    """
+
+    def __init__(self):
+
+        # (key, staging dir, dest dir, files), None to finish
+        self._queue = queue.Queue()
+
+        # keys of the staging dirs written
+        self._done = queue.Queue()
+
+        self._thread = None
+        self._error = None
+        self._aborted = False
+
+        # dirs written to since they were last synced
+        self._dirty_dirs = set()
+
+    def start(self):
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def commit(self, key, stage_dir, dest_dir, files):
+        """
+        Queue the files of a staging dir to be moved to their dest dir. The
+        staging dir is removed when done.
+
+        :param key: given back by take_done when the files are written
+        :param files: the files, relative to the staging dir
+        """
+
+        self._queue.put((key, stage_dir, dest_dir, files))
+
+    def take_done(self):
+        """
+        :return: the keys of the staging dirs written since the last call
+        """
+
+        keys = []
+
+        while True:
+            try:
+                keys.append(self._done.get_nowait())
+            except queue.Empty:
+                return keys
+
+    def finish(self):
+        """
+        Wait for all the files to be written
+
+        :return: the keys of the staging dirs written since take_done was
+            last called
+        :raises WriterError: if writing failed
+        """
+
+        self._stop()
+
+        if self._error:
+            raise WriterError("Failed to write plotted files: {}"
+                              .format(self._error))
+
+        return self.take_done()
+
+    def abort(self):
+        """
+        Stop, without writing the files still queued
+        """
+
+        self._aborted = True
+        self._stop()
+
+    def _stop(self):
+
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+
+        for key, stage_dir, dest_dir, files in iter(self._queue.get, None):
+
+            try:
+                if not (self._error or self._aborted):
+                    self._write(stage_dir, dest_dir, files)
+                    self._done.put(key)
+            except Exception as e:
+                logging.debug("Writing to {} failed: {}".format(dest_dir, e))
+                self._error = e
+            finally:
+                shutil.rmtree(stage_dir, ignore_errors=True)
+
+            if self._queue.empty():
+                self._sync_dirs()
+
+        self._sync_dirs()
+
+    def _write(self, stage_dir, dest_dir, files):
+
+        # (file to rename, its dest) of each file
+        moves = []
+        # dirs files were copied into
+        copied_dirs = set()
+
+        for fn in files:
+
+            src = os.path.join(stage_dir, fn)
+            dest = os.path.join(dest_dir, fn)
+            dirname = os.path.dirname(dest)
+
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            if os.stat(src).st_dev != os.stat(dirname).st_dev:
+                shutil.copyfile(src, dest + TMP_SUFFIX)
+                src = dest + TMP_SUFFIX
+                copied_dirs.add(dirname)
+
+            moves.append((src, dest))
+
+        # all the files are written before any is synced, so their data is
+        # written back together, not a file at a time
+        for src, dest in moves:
+            _fsync_file(src)
+
+        for dirname in sorted(copied_dirs):
+            _fsync_dir(dirname)
+
+        for src, dest in moves:
+
+            try:
+                os.rename(src, dest)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+
+                # a mount of the same filesystem
+                shutil.copyfile(src, dest + TMP_SUFFIX)
+                _fsync_file(dest + TMP_SUFFIX)
+                os.rename(dest + TMP_SUFFIX, dest)
+
+            self._dirty_dirs.add(os.path.dirname(dest))
+
+    def _sync_dirs(self):
+
+        for dirname in sorted(self._dirty_dirs):
+            _fsync_dir(dirname)
+
+        self._dirty_dirs.clear()
@@ -0,0 +1,294 @@
+"""
+Zone filling, as a preflight step, with a cache of the filled areas of
+zones whose inputs have not changed
+
+pcbnew is only imported when zones are filled, so the cache keys can be
+worked out (and tested) without it.
+"""
+
+import hashlib
+import logging
+import re
+import time
+
+from . import cache
+from . import timing
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# (polygon fill mode) ZONE_FILL_MODE::ZFM_POLYGONS
+_FILL_MODE_POLYGONS = 0
+
+# zone settings which affect the fill, as ZONE_CONTAINER getters (those
+# missing in this version of pcbnew are skipped)
+_ZONE_SETTINGS = [
+    'GetNetname',
+    'GetLayer',
+    'GetPriority',
+    'GetZoneClearance',
+    'GetMinThickness',
+    'GetThermalReliefGap',
+    'GetThermalReliefCopperBridge',
+    'GetPadConnection',
+    'GetArcSegmentCount',
+    'GetFillMode',
+    'GetCornerSmoothingType',
+    'GetCornerRadius',
+]
+
+# tokens of a board file to find the (top-level) zones in
+_SEXPR_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\((zone\b)?|\)')
+
+# the number of slowest zones to report, when zones are timed
+_SLOWEST_REPORTED = 5
+
+
+def board_digest_without_zones(brd_file):
+    """
+    Get a digest of everything in a board file but its zones. The fill of a
+    zone depends on the other copper (and nets) of the board, so this is
+    part of the key of each zone.
+    """
+
+    with open(brd_file, 'rb') as f:
+        text = f.read().decode('utf-8', 'replace')
+
+    h = hashlib.sha1()
+
+    depth = 0
+    # where the text to hash starts, and the depth of the zone skipped
+    start = 0
+    zone_depth = None
+
+    for m in _SEXPR_TOKEN_RE.finditer(text):
+
+        tok = m.group(0)
+
+        if tok.startswith('"'):
+            continue
+
+        if tok.startswith('('):
+            depth += 1
+
+            if m.group(1) and depth == 2 and zone_depth is None:
+                h.update(text[start:m.start()].encode('utf-8'))
+                zone_depth = depth
+        else:
+            if depth == zone_depth:
+                start = m.end()
+                zone_depth = None
+
+            depth -= 1
+
+    h.update(text[start:].encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def _chain_points(chain):
+    """
+    Get the points of a SHAPE_LINE_CHAIN
+    """
+
+    points = []
+
+    for i in range(chain.PointCount()):
+        p = chain.CPoint(i)
+        points.append((p.x, p.y))
+
+    return points
+
+
+def _poly_set_to_list(poly_set):
+    """
+    Get the polygons of a SHAPE_POLY_SET, as plain data
+
+    :return: [(outline points, [hole points])]
+    """
+
+    polys = []
+
+    for i in range(poly_set.OutlineCount()):
+
+        holes = [_chain_points(poly_set.CHole(i, h))
+                 for h in range(poly_set.HoleCount(i))]
+
+        polys.append((_chain_points(poly_set.COutline(i)), holes))
+
+    return polys
+
+
+def _list_to_poly_set(polys):
+
+    import pcbnew
+
+    poly_set = pcbnew.SHAPE_POLY_SET()
+
+    for outline, holes in polys:
+
+        o = poly_set.NewOutline()
+
+        for x, y in outline:
+            poly_set.Append(x, y, o)
+
+        for hole in holes:
+
+            h = poly_set.NewHole(o)
+
+            for x, y in hole:
+                poly_set.Append(x, y, o, h)
+
+    return poly_set
+
+
+def _zone_settings(zone):
+
+    return [str(getattr(zone, getter)())
+            for getter in _ZONE_SETTINGS if hasattr(zone, getter)]
+
+
+def _zone_digest(zone):
+    """
+    Get a digest of the outline and settings of a zone
+    """
+
+    return cache.make_key(repr(_poly_set_to_list(zone.Outline())),
+                          *_zone_settings(zone))
+
+
+def _zone_desc(board, zone):
+
+    return "{} on {} (priority {})".format(
+        zone.GetNetname() or "no net", board.GetLayerName(zone.GetLayer()),
+        zone.GetPriority())
+
+
+def _get_zones(board):
+
+    return [board.GetArea(i) for i in range(board.GetAreaCount())]
+
+
+def _zone_keys(board, zones, brd_digest):
+    """
+    Get the cache key of each zone. A zone's fill depends on the rest of the
+    board and on the other zones on its layer, but not on zones on other
+    layers.
+    """
+
+    import pcbnew
+
+    digests = [_zone_digest(z) for z in zones]
+
+    layer_digests = {}
+
+    for zone, digest in zip(zones, digests):
+        layer_digests.setdefault(zone.GetLayer(), []).append(digest)
+
+    return [cache.make_key(pcbnew.GetBuildVersion(), brd_digest,
+                           *([digest] + sorted(
+                               layer_digests[zone.GetLayer()])))
+            for zone, digest in zip(zones, digests)]
+
+
+def _fill(board, zones):
+    """
+    Fill a number of zones, in one go (the filler works out what the zones
+    have in common once, not for each zone)
+    """
+
+    import pcbnew
+
+    to_fill = pcbnew.ZONE_CONTAINERS()
+
+    for zone in zones:
+        to_fill.append(zone)
+
+    pcbnew.ZONE_FILLER(board).Fill(to_fill)
+
+
+def fill_zones(board, zone_cache=None, per_zone=False):
+    """
+    Fill the zones of a board, taking the filled areas of zones whose inputs
+    have not changed from a cache. The other zones are filled together, in
+    one pass of the filler, which doesn't tell how long each zone took.
+
+    :param zone_cache: a cache.ZoneFillCache, or None to fill all zones
+    :param per_zone: fill the zones one at a time instead (which is slower),
+        to time each, and report the slowest
+    """
+
+    zones = [z for z in _get_zones(board) if not z.GetIsKeepout()]
+
+    if not zones:
+        return
+
+    keys = None
+
+    if zone_cache:
+        brd_digest = board_digest_without_zones(board.GetFileName())
+        keys = _zone_keys(board, zones, brd_digest)
+
+    # (zone, key to store its fill under, or None) of the zones to fill
+    to_fill = []
+
+    for i, zone in enumerate(zones):
+
+        # only the polygons of a fill are cached, not segment fills
+        key = keys[i] if (keys and zone.GetFillMode() ==
+                          _FILL_MODE_POLYGONS) else None
+
+        polys = zone_cache.load(key) if key else None
+
+        if polys is None:
+            to_fill.append((zone, key))
+            continue
+
+        logging.debug("Zone {} filled from cache".format(
+            _zone_desc(board, zone)))
+        zone.SetFilledPolysList(_list_to_poly_set(polys))
+        zone.SetIsFilled(True)
+
+    # (seconds, zone description) of each zone timed
+    fill_times = []
+    t_all = 0.0
+
+    if to_fill and per_zone:
+
+        for zone, key in to_fill:
+
+            desc = _zone_desc(board, zone)
+            t0 = _clock()
+
+            with timing.span('fill zone', zone=desc):
+                _fill(board, [zone])
+
+            t = _clock() - t0
+            t_all += t
+
+            logging.debug("Filled zone {} in {:.3f}s".format(desc, t))
+            fill_times.append((t, desc))
+    elif to_fill:
+
+        t0 = _clock()
+
+        with timing.span('fill zones', zones=len(to_fill)):
+            _fill(board, [zone for zone, key in to_fill])
+
+        t_all = _clock() - t0
+
+        for zone, key in to_fill:
+            logging.debug("Filled zone {} (in a pass of {} zones)".format(
+                _zone_desc(board, zone), len(to_fill)))
+
+    for zone, key in to_fill:
+        if key:
+            zone_cache.store(key, _poly_set_to_list(zone.GetFilledPolysList()))
+
+    if zone_cache and to_fill:
+        zone_cache.prune()
+
+    logging.info("Filled {} zones ({} from cache) in {:.3f}s".format(
+        len(zones), len(zones) - len(to_fill), t_all))
+
+    for t, desc in sorted(fill_times, reverse=True)[:_SLOWEST_REPORTED]:
+        logging.info("  {:.3f}s: {}".format(t, desc))
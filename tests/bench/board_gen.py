@@ -0,0 +1,351 @@
+"""
+Generates synthetic KiCad boards of a given size, for benchmarking
+"""
+
+import random
+
+
+# the non-copper layers of every board
+USER_LAYERS = [
+    (32, 'B.Adhes'), (33, 'F.Adhes'), (34, 'B.Paste'), (35, 'F.Paste'),
+    (36, 'B.SilkS'), (37, 'F.SilkS'), (38, 'B.Mask'), (39, 'F.Mask'),
+    (40, 'Dwgs.User'), (41, 'Cmts.User'), (42, 'Eco1.User'),
+    (43, 'Eco2.User'), (44, 'Edge.Cuts'), (45, 'Margin'), (46, 'B.CrtYd'),
+    (47, 'F.CrtYd'), (48, 'B.Fab'), (49, 'F.Fab'),
+]
+
+HEADER = """(kicad_pcb (version 20171130) (host pcbnew "(5.0.0)")
+
+  (general
+    (thickness 1.6)
+    (drawings 4)
+    (tracks {tracks})
+    (zones {zones})
+    (modules {footprints})
+    (nets {nets})
+  )
+
+  (page A4)
+  (title_block
+    (title "KiPlot benchmark board")
+  )
+
+"""
+
+SETUP = """  (setup
+    (last_trace_width 0.25)
+    (trace_clearance 0.2)
+    (zone_clearance 0.508)
+    (zone_45_only no)
+    (trace_min 0.2)
+    (segment_width 0.2)
+    (edge_width 0.15)
+    (via_size 0.8)
+    (via_drill 0.4)
+    (via_min_size 0.4)
+    (via_min_drill 0.3)
+    (uvia_size 0.3)
+    (uvia_drill 0.1)
+    (uvias_allowed no)
+    (uvia_min_size 0.2)
+    (uvia_min_drill 0.1)
+    (pcb_text_width 0.3)
+    (pcb_text_size 1.5 1.5)
+    (mod_edge_width 0.15)
+    (mod_text_size 1 1)
+    (mod_text_width 0.15)
+    (pad_size 1.524 1.524)
+    (pad_drill 0.762)
+    (pad_to_mask_clearance 0.2)
+    (aux_axis_origin 0 0)
+    (visible_elements FFFFFF7F)
+  )
+
+"""
+
+FOOTPRINT = """  (module R_0603 (layer F.Cu) (tedit 0) (tstamp {tstamp:08X})
+    (at {x:.3f} {y:.3f})
+    (fp_text reference R{n} (at 0 -1.5) (layer F.SilkS)
+      (effects (font (size 1 1) (thickness 0.15)))
+    )
+    (fp_text value 10k (at 0 1.5) (layer F.Fab)
+      (effects (font (size 1 1) (thickness 0.15)))
+    )
+    (fp_line (start -1.5 -0.75) (end 1.5 -0.75) (layer F.CrtYd) (width 0.05))
+    (fp_line (start -1.5 0.75) (end 1.5 0.75) (layer F.CrtYd) (width 0.05))
+    (pad 1 smd rect (at -0.8 0) (size 0.8 0.9) (layers F.Cu F.Paste F.Mask)
+      (net {net1} N{net1}))
+    (pad 2 smd rect (at 0.8 0) (size 0.8 0.9) (layers F.Cu F.Paste F.Mask)
+      (net {net2} N{net2}))
+    (pad 3 thru_hole circle (at 0 1) (size 1.2 1.2) (drill 0.6)
+      (layers *.Cu *.Mask) (net {net1} N{net1}))
+  )
+"""
+
+ZONE = """  (zone (net {net}) (net_name N{net}) (layer {layer}) (tstamp 0)
+    (hatch edge 0.508)
+    (connect_pads (clearance 0.508))
+    (min_thickness 0.254)
+    (fill yes (arc_segments 32) (thermal_gap 0.508)
+      (thermal_bridge_width 0.508))
+    (polygon
+      (pts
+        (xy {x0:.3f} {y0:.3f}) (xy {x1:.3f} {y0:.3f})
+        (xy {x1:.3f} {y1:.3f}) (xy {x0:.3f} {y1:.3f})
+      )
+    )
+  )
+"""
+
+
+class BoardSize(object):
+    """
+    The size of a synthetic board
+    """
+
+    def __init__(self, copper_layers, footprints, tracks, zones):
+
+        self.copper_layers = copper_layers
+        self.footprints = footprints
+        self.tracks = tracks
+        self.zones = zones
+
+    @property
+    def name(self):
+        return "{}L_{}fp_{}tr_{}z".format(self.copper_layers,
+                                          self.footprints, self.tracks,
+                                          self.zones)
+
+    def to_dict(self):
+        return {
+            'copper_layers': self.copper_layers,
+            'footprints': self.footprints,
+            'tracks': self.tracks,
+            'zones': self.zones,
+        }
+
+
+def copper_layer_names(n_layers):
+    """
+    Get the (id, name) of each copper layer of a board
+    """
+
+    layers = [(0, 'F.Cu')]
+    layers += [(i, 'In{}.Cu'.format(i)) for i in range(1, n_layers - 1)]
+    layers.append((31, 'B.Cu'))
+
+    return layers
+
+
+def write_board(fstream, size, seed=0):
+    """
+    Write a synthetic board, with footprints, tracks and zones placed at
+    random (but repeatably) over a board which grows with the item count
+    """
+
+    rnd = random.Random(seed)
+
+    n_nets = max(2, size.footprints)
+
+    # keep the density roughly constant
+    side = max(20.0, (size.footprints + size.tracks / 10.0) ** 0.5 * 4)
+
+    cu_layers = copper_layer_names(size.copper_layers)
+
+    fstream.write(HEADER.format(tracks=size.tracks, zones=size.zones,
+                                footprints=size.footprints, nets=n_nets))
+
+    fstream.write("  (layers\n")
+    for num, name in cu_layers:
+        fstream.write("    ({} {} signal)\n".format(num, name))
+    for num, name in USER_LAYERS:
+        fstream.write("    ({} {} user)\n".format(num, name))
+    fstream.write("  )\n\n")
+
+    fstream.write(SETUP)
+
+    fstream.write('  (net 0 "")\n')
+    for n in range(1, n_nets):
+        fstream.write("  (net {} N{})\n".format(n, n))
+
+    fstream.write('\n  (net_class Default "This is the default net class."\n'
+                  '    (clearance 0.2)\n'
+                  '    (trace_width 0.25)\n'
+                  '    (via_dia 0.8)\n'
+                  '    (via_drill 0.4)\n'
+                  '    (uvia_dia 0.3)\n'
+                  '    (uvia_drill 0.1)\n')
+    for n in range(1, n_nets):
+        fstream.write("    (add_net N{})\n".format(n))
+    fstream.write("  )\n\n")
+
+    for n in range(size.footprints):
+        fstream.write(FOOTPRINT.format(
+            tstamp=n, n=n + 1,
+            x=rnd.uniform(2, side - 2), y=rnd.uniform(2, side - 2),
+            net1=rnd.randrange(1, n_nets), net2=rnd.randrange(1, n_nets)))
+
+    for (x0, y0, x1, y1) in [(0, 0, side, 0), (side, 0, side, side),
+                             (side, side, 0, side), (0, side, 0, 0)]:
+        fstream.write("  (gr_line (start {} {}) (end {} {}) "
+                      "(layer Edge.Cuts) (width 0.15))\n"
+                      .format(x0, y0, x1, y1))
+
+    for n in range(size.tracks):
+
+        x = rnd.uniform(1, side - 1)
+        y = rnd.uniform(1, side - 1)
+        net = rnd.randrange(1, n_nets)
+
+        # every tenth track ends in a via
+        if n % 10 == 9:
+            fstream.write("  (via (at {:.3f} {:.3f}) (size 0.8) (drill 0.4) "
+                          "(layers F.Cu B.Cu) (net {}))\n"
+                          .format(x, y, net))
+        else:
+            fstream.write("  (segment (start {:.3f} {:.3f}) "
+                          "(end {:.3f} {:.3f}) (width 0.25) (layer {}) "
+                          "(net {}))\n".format(
+                              x, y, x + rnd.uniform(-3, 3),
+                              y + rnd.uniform(-3, 3),
+                              rnd.choice(cu_layers)[1], net))
+
+    for n in range(size.zones):
+
+        x0 = rnd.uniform(0, side / 2)
+        y0 = rnd.uniform(0, side / 2)
+
+        fstream.write(ZONE.format(
+            net=rnd.randrange(1, n_nets),
+            layer=cu_layers[n % len(cu_layers)][1],
+            x0=x0, y0=y0, x1=x0 + side / 2, y1=y0 + side / 2))
+
+    fstream.write(")\n")
+
+
+def write_config(fstream, size):
+    """
+    Write a plot config with an output of every type, plotting all the
+    copper layers of a board of the given size
+    """
+
+    cu_layers = copper_layer_names(size.copper_layers)
+
+    def layer_list():
+
+        lines = ["    layers:"]
+
+        for num, name in cu_layers:
+            if name.startswith('In'):
+                layer = 'Inner.{}'.format(num)
+            else:
+                layer = name
+
+            lines.append("      - layer: {}".format(layer))
+            lines.append("        suffix: {}".format(name.replace('.', '_')))
+
+        for name in ['F.SilkS', 'B.SilkS', 'F.Mask', 'B.Mask', 'Edge.Cuts']:
+            lines.append("      - layer: {}".format(name))
+            lines.append("        suffix: {}".format(name.replace('.', '_')))
+
+        return "\n".join(lines) + "\n"
+
+    common = """      exclude_edge_layer: false
+      exclude_pads_from_silkscreen: false
+      plot_sheet_reference: false
+      plot_footprint_refs: true
+      plot_footprint_values: true
+      force_plot_invisible_refs_vals: false
+      tent_vias: true
+      check_zone_fills: false
+"""
+
+    fstream.write("""kiplot:
+  version: 1
+
+outputs:
+
+  - name: gerbers
+    type: gerber
+    dir: gerber
+    options:
+""" + common + """      use_aux_axis_as_origin: false
+      line_width: 0.15
+      subtract_mask_from_silk: true
+      use_protel_extensions: false
+      gerber_precision: 4.6
+      create_gerber_job_file: true
+      use_gerber_x2_attributes: true
+      use_gerber_net_attributes: true
+""" + layer_list() + """
+  - name: excellon
+    type: excellon
+    dir: gerber
+    options:
+      metric_units: true
+      pth_and_npth_single_file: false
+      use_aux_axis_as_origin: false
+      minimal_header: false
+      mirror_y_axis: false
+      report:
+        filename: drill_report.rpt
+      map:
+        type: pdf
+
+  - name: gerb_drill
+    type: gerb_drill
+    dir: gerb_drill
+    options:
+      use_aux_axis_as_origin: false
+
+  - name: pdf
+    type: pdf
+    dir: pdf
+    options:
+""" + common + """      line_width: 0.15
+      mirror_plot: false
+      negative_plot: false
+      drill_marks: full
+""" + layer_list() + """
+  - name: svg
+    type: svg
+    dir: svg
+    options:
+""" + common + """      line_width: 0.15
+      mirror_plot: false
+      negative_plot: false
+      drill_marks: small
+""" + layer_list() + """
+  - name: ps
+    type: ps
+    dir: ps
+    options:
+""" + common + """      line_width: 0.15
+      mirror_plot: false
+      negative_plot: false
+      sketch_plot: false
+      scaling: 1
+      drill_marks: full
+      scale_adjust_x: 1.0
+      scale_adjust_y: 1.0
+      width_adjust: 0
+      a4_output: true
+""" + layer_list() + """
+  - name: dxf
+    type: dxf
+    dir: dxf
+    options:
+""" + common + """      use_aux_axis_as_origin: false
+      drill_marks: none
+      polygon_mode: true
+""" + layer_list() + """
+  - name: hpgl
+    type: hpgl
+    dir: hpgl
+    options:
+""" + common + """      mirror_plot: false
+      sketch_plot: false
+      scaling: 1
+      drill_marks: none
+      pen_width: 0.5
+""" + layer_list())
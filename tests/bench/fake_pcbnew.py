@@ -0,0 +1,339 @@
+"""
+A stand-in for the pcbnew module, for benchmarking KiPlot's own overhead on
+machines without KiCad.
+
+It has just enough of the pcbnew API for KiPlot to drive. Boards are only
+scanned for their layer count and plots are tiny placeholder files, so the
+timings are of KiPlot, not of KiCad. Boards have no zones unless they are
+added with AddArea, and zones are "filled" with their outline.
+"""
+
+import os
+import re
+
+F_Cu = 0
+B_Cu = 31
+B_Adhes = 32
+F_Adhes = 33
+B_Paste = 34
+F_Paste = 35
+B_SilkS = 36
+F_SilkS = 37
+B_Mask = 38
+F_Mask = 39
+Dwgs_User = 40
+Cmts_User = 41
+Eco1_User = 42
+Eco2_User = 43
+Edge_Cuts = 44
+Margin = 45
+B_CrtYd = 46
+F_CrtYd = 47
+B_Fab = 48
+F_Fab = 49
+
+PLOT_FORMAT_HPGL = 0
+PLOT_FORMAT_GERBER = 1
+PLOT_FORMAT_POST = 2
+PLOT_FORMAT_DXF = 3
+PLOT_FORMAT_PDF = 4
+PLOT_FORMAT_SVG = 5
+
+_EXTENSIONS = {
+    PLOT_FORMAT_HPGL: 'plt',
+    PLOT_FORMAT_GERBER: 'gbr',
+    PLOT_FORMAT_POST: 'ps',
+    PLOT_FORMAT_DXF: 'dxf',
+    PLOT_FORMAT_PDF: 'pdf',
+    PLOT_FORMAT_SVG: 'svg',
+}
+
+IU_PER_MM = 1e6
+
+
+def FromMM(mm):
+    return int(float(mm) * IU_PER_MM)
+
+
+def IsCopperLayer(layer):
+    return F_Cu <= layer <= B_Cu
+
+
+def GetBuildVersion():
+    return "fake"
+
+
+class wxPoint(object):
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class SHAPE_LINE_CHAIN(object):
+
+    def __init__(self):
+        self.points = []
+
+    def PointCount(self):
+        return len(self.points)
+
+    def CPoint(self, i):
+        return wxPoint(*self.points[i])
+
+
+class SHAPE_POLY_SET(object):
+
+    def __init__(self):
+
+        # [(outline, [holes])]
+        self._polys = []
+
+    def NewOutline(self):
+
+        self._polys.append((SHAPE_LINE_CHAIN(), []))
+        return len(self._polys) - 1
+
+    def NewHole(self, outline):
+
+        self._polys[outline][1].append(SHAPE_LINE_CHAIN())
+        return len(self._polys[outline][1]) - 1
+
+    def Append(self, x, y, outline=-1, hole=-1):
+
+        poly = self._polys[outline]
+        chain = poly[0] if hole < 0 else poly[1][hole]
+        chain.points.append((x, y))
+
+    def OutlineCount(self):
+        return len(self._polys)
+
+    def HoleCount(self, outline):
+        return len(self._polys[outline][1])
+
+    def COutline(self, outline):
+        return self._polys[outline][0]
+
+    def CHole(self, outline, hole):
+        return self._polys[outline][1][hole]
+
+
+class ZONE_CONTAINER(object):
+
+    def __init__(self, netname, layer, outline, priority=0):
+        """
+        :param outline: the points of the zone's outline
+        """
+
+        self._netname = netname
+        self._layer = layer
+        self._priority = priority
+        self._outline = SHAPE_POLY_SET()
+        self._outline.NewOutline()
+        self._filled = None
+
+        for x, y in outline:
+            self._outline.Append(x, y)
+
+    def Outline(self):
+        return self._outline
+
+    def GetNetname(self):
+        return self._netname
+
+    def GetLayer(self):
+        return self._layer
+
+    def GetPriority(self):
+        return self._priority
+
+    def GetFillMode(self):
+        return 0
+
+    def GetIsKeepout(self):
+        return False
+
+    def GetFilledPolysList(self):
+        return self._filled
+
+    def SetFilledPolysList(self, poly_set):
+        self._filled = poly_set
+
+    def SetIsFilled(self, filled):
+        pass
+
+
+class ZONE_CONTAINERS(list):
+    pass
+
+
+class ZONE_FILLER(object):
+
+    # the number of zones filled by each call of Fill
+    fills = []
+
+    def __init__(self, board):
+        self._board = board
+
+    def Fill(self, zones):
+
+        ZONE_FILLER.fills.append(len(zones))
+
+        for zone in zones:
+            zone.SetFilledPolysList(zone.Outline())
+
+        return True
+
+
+class PCB_PLOT_PARAMS(object):
+
+    NO_DRILL_SHAPE = 0
+    SMALL_DRILL_SHAPE = 1
+    FULL_DRILL_SHAPE = 2
+
+    def __init__(self):
+        self._params = {}
+
+    def __getattr__(self, name):
+
+        # any setter
+        if name.startswith('Set'):
+            return lambda *args: self._params.__setitem__(name[3:], args)
+
+        raise AttributeError(name)
+
+    def GetOutputDirectory(self):
+        return self._params['OutputDirectory'][0]
+
+
+class BOARD(object):
+
+    def __init__(self, filename):
+
+        self._filename = filename
+
+        with open(filename) as f:
+            data = f.read()
+
+        self._copper_layers = len(re.findall(r'^\s*\(\d+ \S+ signal\)',
+                                             data, re.MULTILINE))
+        self._zones = []
+
+    def GetFileName(self):
+        return self._filename
+
+    def GetCopperLayerCount(self):
+        return self._copper_layers
+
+    def GetAuxOrigin(self):
+        return wxPoint(0, 0)
+
+    def GetLayerName(self, layer):
+        return str(layer)
+
+    def AddArea(self, zone):
+        self._zones.append(zone)
+
+    def GetAreaCount(self):
+        return len(self._zones)
+
+    def GetArea(self, i):
+        return self._zones[i]
+
+
+def LoadBoard(filename):
+    return BOARD(filename)
+
+
+def _board_name(board):
+    return os.path.splitext(os.path.basename(board.GetFileName()))[0]
+
+
+class PLOT_CONTROLLER(object):
+
+    def __init__(self, board):
+
+        self._board = board
+        self._opts = PCB_PLOT_PARAMS()
+        self._layer = None
+        self._filename = None
+
+    def GetPlotOptions(self):
+        return self._opts
+
+    def SetLayer(self, layer):
+        self._layer = layer
+
+    def OpenPlotfile(self, suffix, fmt, sheet_desc):
+
+        self._filename = os.path.join(
+            self._opts.GetOutputDirectory(),
+            "{}-{}.{}".format(_board_name(self._board), suffix,
+                              _EXTENSIONS[fmt]))
+        return True
+
+    def GetPlotFileName(self):
+        return self._filename
+
+    def PlotLayer(self):
+
+        with open(self._filename, 'w') as f:
+            f.write("layer {}\n".format(self._layer))
+
+        return True
+
+    def ClosePlot(self):
+        pass
+
+
+class _DRILL_WRITER(object):
+
+    def __init__(self, board):
+
+        self._board = board
+        self._map_format = None
+
+    def SetMapFileFormat(self, fmt):
+        self._map_format = fmt
+
+    def CreateDrillandMapFilesSet(self, outdir, gen_drill, gen_map):
+
+        name = _board_name(self._board)
+
+        if gen_drill:
+            with open(os.path.join(outdir, name + self._drill_ext), 'w') as f:
+                f.write("drill\n")
+
+        if gen_map:
+            with open(os.path.join(outdir, "{}-drl_map.{}".format(
+                    name, _EXTENSIONS[self._map_format])), 'w') as f:
+                f.write("map\n")
+
+    def GenDrillReportFile(self, filename):
+
+        with open(filename, 'w') as f:
+            f.write("report\n")
+
+
+class EXCELLON_WRITER(_DRILL_WRITER):
+
+    DECIMAL_FORMAT = 0
+
+    _drill_ext = '.drl'
+
+    def SetOptions(self, mirror_y, minimal_header, offset, merge_npth):
+        pass
+
+    def SetFormat(self, metric, zeros_format):
+        pass
+
+
+class GERBER_WRITER(_DRILL_WRITER):
+
+    _drill_ext = '-PTH-drl.gbr'
+
+    def SetOptions(self, offset):
+        pass
+
+    def SetFormat(self, precision):
+        pass
@@ -0,0 +1,288 @@
+"""
+Benchmarks of KiPlot plotting throughput over synthetic boards of
+increasing size.
+
+Each board is plotted a number of times with a config that has an output of
+every type, timing the config read, the board load, each output and the
+drill file generation. The median and variance of each are reported and can
+be saved as JSON, to compare against a later run:
+
+    python tests/bench/run_bench.py -o before.json
+    ... make changes ...
+    python tests/bench/run_bench.py -o after.json --compare before.json
+
+With --fake-pcbnew, a stand-in pcbnew module is used, which does (almost)
+no work, so only KiPlot's own overhead is measured. This runs without KiCad.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import board_gen  # noqa: E402
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+SIZES = [
+    board_gen.BoardSize(copper_layers=2, footprints=10, tracks=100, zones=1),
+    board_gen.BoardSize(copper_layers=4, footprints=100, tracks=1000,
+                        zones=4),
+    board_gen.BoardSize(copper_layers=8, footprints=500, tracks=5000,
+                        zones=8),
+    board_gen.BoardSize(copper_layers=12, footprints=2000, tracks=20000,
+                        zones=16),
+]
+
+# runs slower than this (relative to the old run) are regressions
+DEFAULT_THRESHOLD = 0.2
+
+
+def use_fake_pcbnew():
+    """
+    Make 'import pcbnew' get the fake module (before KiPlot is imported)
+    """
+
+    import fake_pcbnew
+
+    if 'kiplot.kiplot' in sys.modules:
+        raise RuntimeError("KiPlot was already imported with pcbnew")
+
+    sys.modules['pcbnew'] = fake_pcbnew
+
+
+def median(samples):
+
+    s = sorted(samples)
+    mid = len(s) // 2
+
+    if len(s) % 2:
+        return s[mid]
+
+    return (s[mid - 1] + s[mid]) / 2.0
+
+
+def variance(samples):
+
+    if len(samples) < 2:
+        return 0.0
+
+    mean = sum(samples) / float(len(samples))
+    return sum((x - mean) ** 2 for x in samples) / (len(samples) - 1)
+
+
+def _phase_of_span(span, output_types):
+    """
+    Get the benchmark phase a timing span counts towards, if any
+    """
+
+    if span['name'] == 'load board':
+        return 'load board'
+
+    if span['name'] == 'output':
+        return 'output: ' + output_types[span['args']['output']]
+
+    if span['name'] in ['CreateDrillandMapFilesSet', 'GenDrillReportFile']:
+        return 'drill: ' + output_types[span['args']['output']]
+
+    return None
+
+
+def bench_board(size, work_dir, repeats):
+    """
+    Benchmark plotting a board of a given size
+
+    :return: {phase: [time of each repeat]}
+    """
+
+    from kiplot import config_reader
+    from kiplot import kiplot
+    from kiplot import timing
+
+    brd_file = os.path.join(work_dir, size.name + '.kicad_pcb')
+    cfg_file = os.path.join(work_dir, size.name + '.kiplot.yaml')
+
+    with open(brd_file, 'w') as f:
+        board_gen.write_board(f, size)
+
+    with open(cfg_file, 'w') as f:
+        board_gen.write_config(f, size)
+
+    samples = {}
+
+    for r in range(repeats):
+
+        times = {}
+
+        t0 = _clock()
+
+        with open(cfg_file) as f:
+            cfg = config_reader.CfgYamlReader().read(f)
+
+        times['read config'] = _clock() - t0
+
+        output_types = dict((o.name, o.options.type) for o in cfg.outputs)
+
+        cfg.outdir = os.path.join(work_dir, 'out')
+
+        timing.profiler.reset(True)
+
+        try:
+            kiplot.Plotter(cfg).plot(brd_file)
+        finally:
+            spans = timing.profiler.take_spans()
+            timing.profiler.reset(False)
+            shutil.rmtree(cfg.outdir, ignore_errors=True)
+
+        for span in spans:
+
+            phase = _phase_of_span(span, output_types)
+
+            if phase:
+                times[phase] = times.get(phase, 0.0) + span['duration']
+
+        for phase, t in times.items():
+            samples.setdefault(phase, []).append(t)
+
+    return samples
+
+
+def run(sizes, repeats, fake_pcbnew):
+
+    work_dir = tempfile.mkdtemp(prefix='kiplot_bench_')
+
+    results = []
+
+    try:
+        for size in sizes:
+
+            logging.info("Benchmarking {}".format(size.name))
+
+            samples = bench_board(size, work_dir, repeats)
+
+            for phase in sorted(samples):
+                results.append({
+                    'board': size.name,
+                    'size': size.to_dict(),
+                    'phase': phase,
+                    'median': median(samples[phase]),
+                    'variance': variance(samples[phase]),
+                    'samples': samples[phase],
+                })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fake_pcbnew': fake_pcbnew,
+            'repeats': repeats,
+            'time': time.time(),
+        },
+        'results': results,
+    }
+
+
+def format_results(data):
+
+    lines = ["{:<24} {:<28} {:>10} {:>12}".format(
+        'Board', 'Phase', 'Median (s)', 'Std dev (s)')]
+
+    for r in data['results']:
+        lines.append("{:<24} {:<28} {:>10.4f} {:>12.4f}".format(
+            r['board'], r['phase'], r['median'], r['variance'] ** 0.5))
+
+    return "\n".join(lines)
+
+
+def compare(old, new, threshold):
+    """
+    Compare two benchmark runs
+
+    :return: descriptions of the phases that got slower by more than the
+    threshold (a fraction)
+    """
+
+    old_medians = dict(((r['board'], r['phase']), r['median'])
+                       for r in old['results'])
+
+    regressions = []
+
+    for r in new['results']:
+
+        old_median = old_medians.get((r['board'], r['phase']))
+
+        if not old_median:
+            continue
+
+        change = (r['median'] - old_median) / old_median
+
+        if change > threshold:
+            regressions.append("{} {}: {:.4f}s -> {:.4f}s ({:+.0%})".format(
+                r['board'], r['phase'], old_median, r['median'], change))
+
+    return regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark KiPlot plotting throughput')
+    parser.add_argument('--fake-pcbnew', action='store_true',
+                        help='Use a stand-in pcbnew, to measure only '
+                        'KiPlot\'s own overhead')
+    parser.add_argument('-n', '--repeats', type=int, default=5,
+                        help='Runs of each board (default: %(default)s)')
+    parser.add_argument('--quick', action='store_true',
+                        help='Only benchmark the smaller boards')
+    parser.add_argument('-o', '--output',
+                        help='Save the results to this JSON file')
+    parser.add_argument('--compare',
+                        help='Compare to the results in this JSON file, '
+                        'and fail if any phase got slower')
+    parser.add_argument('--threshold', type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help='Slow-down to count as a regression (default: '
+                        '%(default)s)')
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.fake_pcbnew:
+        use_fake_pcbnew()
+
+    sizes = SIZES[:2] if args.quick else SIZES
+
+    data = run(sizes, args.repeats, args.fake_pcbnew)
+
+    print(format_results(data))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1)
+
+    if args.compare:
+
+        with open(args.compare) as f:
+            old = json.load(f)
+
+        regressions = compare(old, data, args.threshold)
+
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Runs the plotting benchmarks (only when asked for with --bench)
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+RUN_BENCH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'run_bench.py')
+
+
+def test_bench(request, tmpdir):
+
+    mode = request.config.getoption('bench')
+
+    if not mode:
+        pytest.skip("benchmarks only run with --bench")
+
+    results = str(tmpdir.join('bench.json'))
+
+    # in a fresh interpreter, so a fake pcbnew doesn't leak into other tests
+    cmd = [sys.executable, RUN_BENCH, '--quick', '-n', '3', '-o', results]
+
+    if mode == 'fake':
+        cmd.append('--fake-pcbnew')
+
+    subprocess.check_call(cmd)
+
+    with open(results) as f:
+        data = json.load(f)
+
+    phases = set(r['phase'] for r in data['results'])
+
+    assert 'read config' in phases
+    assert 'load board' in phases
+    assert 'output: gerber' in phases
+    assert 'drill: excellon' in phases
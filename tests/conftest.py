@@ -7,3 +7,7 @@ def pytest_addoption(parser):
     parser.addoption("--plot_dir", action="store", default=None,
                      help="the plot dir to use (omit to use a temp dir). "
                      "If given, plots will _not_ be cleared after testing.")
+    parser.addoption("--bench", action="store", default=None,
+                     choices=["real", "fake"],
+                     help="run the plotting benchmarks, with the real "
+                     "pcbnew or a fake one (to time only KiPlot itself)")
@@ -0,0 +1,63 @@
+"""
+Tests for reading the boards of a batch (which doesn't need pcbnew)
+"""
+
+import io
+
+import pytest
+
+from kiplot import batch
+from kiplot import plot_config as PC
+
+
+def _boards(tmpdir, names):
+
+    for name in names:
+        tmpdir.join(name).write('(kicad_pcb)', ensure=True)
+
+
+def test_expand_board_args(tmpdir):
+
+    _boards(tmpdir, ['b.kicad_pcb', 'a.kicad_pcb', 'other.txt'])
+
+    boards = batch.expand_board_args([
+        str(tmpdir.join('missing.kicad_pcb')),
+        str(tmpdir.join('*.kicad_pcb'))])
+
+    # plain names are kept, even if missing, and globs are sorted
+    assert boards == [str(tmpdir.join(fn)) for fn in [
+        'missing.kicad_pcb', 'a.kicad_pcb', 'b.kicad_pcb']]
+
+    with pytest.raises(batch.BatchError):
+        batch.expand_board_args([str(tmpdir.join('*.brd'))])
+
+
+def test_read_board_list(tmpdir):
+
+    _boards(tmpdir, ['sub/a.kicad_pcb', 'sub/b.kicad_pcb', 'c.kicad_pcb'])
+
+    tmpdir.join('boards.txt').write(
+        '# the boards\n'
+        '\n'
+        'c.kicad_pcb\n'
+        '  sub/*.kicad_pcb  \n'
+        '  # not this one\n')
+
+    with io.open(str(tmpdir.join('boards.txt'))) as f:
+        boards = batch.read_board_list(f)
+
+    # relative to the list file
+    assert boards == [str(tmpdir.join(fn)) for fn in [
+        'c.kicad_pcb', 'sub/a.kicad_pcb', 'sub/b.kicad_pcb']]
+
+
+def test_duplicate_board_names():
+
+    cfg = PC.PlotConfig()
+    cfg.outdir = 'out'
+
+    with pytest.raises(batch.BatchError) as e:
+        batch.BatchPlotter(cfg).plot(['a/board.kicad_pcb', 'b/board.kicad_pcb',
+                                      'c.kicad_pcb'])
+
+    assert 'board' in str(e.value)
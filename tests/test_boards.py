@@ -0,0 +1,73 @@
+"""
+Tests for the cache of loaded boards (with a stand-in for pcbnew)
+"""
+
+import sys
+import types
+
+from kiplot import boards
+
+
+class _Board(object):
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.filled = False
+
+    def GetFileName(self):
+        return self.filename
+
+
+def _fake_pcbnew(monkeypatch):
+
+    pcbnew = types.ModuleType('pcbnew')
+    pcbnew.loaded = []
+
+    def load_board(filename):
+        pcbnew.loaded.append(filename)
+        return _Board(filename)
+
+    pcbnew.LoadBoard = load_board
+    monkeypatch.setitem(sys.modules, 'pcbnew', pcbnew)
+
+    return pcbnew
+
+
+def test_filled_board_not_reused(monkeypatch, tmpdir):
+
+    pcbnew = _fake_pcbnew(monkeypatch)
+    brd_file = str(tmpdir.join('board.kicad_pcb'))
+    tmpdir.join('board.kicad_pcb').write('(kicad_pcb)')
+
+    board_cache = boards.BoardCache(2)
+
+    # a plot which fills the zones
+    board = board_cache.load(brd_file, filled_ok=True)
+    board_cache.mark_filled(board.GetFileName())
+    board.filled = True
+
+    # then one which doesn't: it gets the board as it is in its file
+    board = board_cache.load(brd_file)
+
+    assert not board.filled
+    assert len(pcbnew.loaded) == 2
+
+    # which is reused, as it wasn't changed
+    assert board_cache.load(brd_file) is board
+    assert len(pcbnew.loaded) == 2
+
+
+def test_filled_board_reused_for_fill(monkeypatch, tmpdir):
+
+    pcbnew = _fake_pcbnew(monkeypatch)
+    brd_file = str(tmpdir.join('board.kicad_pcb'))
+    tmpdir.join('board.kicad_pcb').write('(kicad_pcb)')
+
+    board_cache = boards.BoardCache(2)
+
+    board = board_cache.load(brd_file, filled_ok=True)
+    board_cache.mark_filled(brd_file)
+
+    assert board_cache.load(brd_file, filled_ok=True) is board
+    assert len(pcbnew.loaded) == 1
@@ -0,0 +1,66 @@
+"""
+Tests for the cache of plotted outputs
+"""
+
+import os
+import time
+
+from kiplot import cache
+
+
+def _store(output_cache, tmpdir, key, size):
+
+    src = tmpdir.mkdir('src-' + key)
+    src.join('a.gbr').write('x' * size)
+    output_cache.store(key, str(src), ['a.gbr'])
+
+
+def _age(output_cache, key, seconds_ago):
+
+    t = time.time() - seconds_ago
+    os.utime(output_cache._entry_dir(key), (t, t))
+
+
+def test_evicted_least_recently_used(tmpdir):
+
+    output_cache = cache.OutputCache(str(tmpdir.join('cache')), 2500)
+
+    for i, key in enumerate(['aa1', 'bb2', 'cc3']):
+        _store(output_cache, tmpdir, key, 1000)
+        _age(output_cache, key, 100 - i)
+
+    # restoring marks an entry as used
+    assert output_cache.restore('aa1', str(tmpdir.mkdir('out'))) == ['a.gbr']
+
+    output_cache.evict()
+
+    assert os.path.isdir(output_cache._entry_dir('aa1'))
+    assert not os.path.isdir(output_cache._entry_dir('bb2'))
+    assert os.path.isdir(output_cache._entry_dir('cc3'))
+
+
+def test_restore_missing(tmpdir):
+
+    output_cache = cache.OutputCache(str(tmpdir.join('cache')), 1000)
+
+    assert output_cache.restore('aa1', str(tmpdir.mkdir('out'))) is None
+
+
+def test_restore_corrupt(tmpdir):
+
+    output_cache = cache.OutputCache(str(tmpdir.join('cache')), 10000)
+
+    _store(output_cache, tmpdir, 'aa1', 10)
+    _store(output_cache, tmpdir, 'bb2', 10)
+
+    # a file missing from one entry, and a broken index in the other
+    os.remove(os.path.join(output_cache._entry_dir('aa1'), 'a.gbr'))
+
+    with open(os.path.join(output_cache._entry_dir('bb2'),
+                           cache.ENTRY_INDEX), 'w') as f:
+        f.write('{"files": ')
+
+    out = str(tmpdir.mkdir('out'))
+
+    assert output_cache.restore('aa1', out) is None
+    assert output_cache.restore('bb2', out) is None
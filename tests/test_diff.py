@@ -0,0 +1,87 @@
+"""
+Tests for the geometric diff of plot runs
+"""
+
+from kiplot import diff
+
+GERBER = """G04 #@! TF.CreationDate,{date}*
+%FSLAX46Y46*%
+%MOMM*%
+%ADD{d1}C,0.200000*%
+%ADD{d2}R,2.000000X2.000000*%
+D{d1}*
+X0Y0D02*
+X10000000Y0D01*
+D{d2}*
+{flashes}
+M02*
+"""
+
+DRILL = """M48
+; DRILL file {{KiCad 5.1.0}} date {date}
+; FORMAT={{-:-/ absolute / metric / decimal}}
+METRIC
+T1C0.400
+T2C1.000
+%
+G90
+G05
+T1
+{hits}
+T2
+X5.0Y5.0G85X7.0Y5.0
+T0
+M30
+"""
+
+
+def _write(d, name, text):
+
+    d.join(name).write(text, ensure=True)
+
+
+def _run(d, date, d1, flashes, hits):
+
+    _write(d, 'gerbers/board-F_Cu.gbr', GERBER.format(
+        date=date, d1=d1, d2=d1 + 1,
+        flashes="\n".join("X{}Y{}D03*".format(int(x * 1e6), int(y * 1e6))
+                          for x, y in flashes)))
+    _write(d, 'board.drl', DRILL.format(
+        date=date, hits="\n".join("X{}Y{}".format(x, y) for x, y in hits)))
+    # not a fab output
+    _write(d, 'board-F_Cu.pdf', date)
+
+
+def test_diff_dirs(tmpdir):
+
+    old = tmpdir.mkdir('old')
+    new = tmpdir.mkdir('new')
+
+    _run(old, '2019-01-01', 10, [(1, 1), (2, 2), (3, 3)],
+         [(1.0, 1.0), (2.0, 2.0)])
+    # other timestamps and aperture numbers, a flash moved, one removed and
+    # one added, a hole moved by less than the tolerance
+    _run(new, '2019-02-02', 20, [(3, 3), (1, 1.5), (50, 50)],
+         [(1.0, 1.0), (2.0004, 2.0)])
+    _write(new, 'board-B_Cu.gbl', GERBER.format(date='', d1=10, d2=11,
+                                                flashes=''))
+
+    diffs = dict((fd.name, fd) for fd in diff.diff_dirs(str(old),
+                                                        str(new)))
+
+    assert sorted(diffs) == ['board-B_Cu.gbl', 'board.drl',
+                             'gerbers/board-F_Cu.gbr']
+
+    assert diffs['board-B_Cu.gbl'].status == 'added'
+    assert diffs['board.drl'].status == 'same'
+
+    gbr = diffs['gerbers/board-F_Cu.gbr']
+
+    assert gbr.status == 'changed'
+    assert gbr.moved == [diff.Change('flash', 'R(2x2)', (1.0, 1.0),
+                                     (1.0, 1.5))]
+    assert [c.old for c in gbr.removed] == [(2.0, 2.0)]
+    assert [c.new for c in gbr.added] == [(50.0, 50.0)]
+
+    assert 'flash 1 added, 1 removed, 1 moved' in diff.format_diff(
+        diffs.values())
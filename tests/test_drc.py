@@ -0,0 +1,78 @@
+"""
+Tests for the DRC's clearance checks (which don't need pcbnew)
+"""
+
+import random
+
+from kiplot import drc
+
+
+def _track(i, net, x0, y0, x1, y1, width=200, clearance=200):
+
+    grow = width / 2.0 + clearance / 2.0
+
+    return drc._Item(i, net, (0,),
+                     (min(x0, x1) - grow, min(y0, y1) - grow,
+                      max(x0, x1) + grow, max(y0, y1) + grow),
+                     [(x0, y0), (x1, y1)], width / 2.0, clearance)
+
+
+def test_item_distance():
+
+    a = _track(0, 1, 0, 0, 1000, 0)
+    b = _track(1, 2, 0, 500, 1000, 500)
+    crossing = _track(2, 2, 500, -500, 500, 500)
+
+    assert drc.item_distance(a, b) == 300
+    assert drc.item_distance(a, crossing) < 0
+
+    pad = drc._Item(3, 3, (0,), None, drc._rect(400, 400), 0, 200)
+    inside = _track(4, 4, 0, 0, 0, 0, width=0)
+
+    assert drc.item_distance(pad, inside) == 0
+
+
+def test_regions_find_the_same_violations():
+
+    rnd = random.Random(1)
+    items = []
+
+    for i in range(300):
+        x = rnd.uniform(0, 20000)
+        y = rnd.uniform(0, 20000)
+        items.append(_track(i, rnd.randrange(5), x, y,
+                            x + rnd.uniform(-2000, 2000),
+                            y + rnd.uniform(-2000, 2000)))
+
+    def violations(n_regions):
+        grid = drc._make_grid(items, n_regions)
+        return sorted(v for cell, region_items in
+                      drc._split_items(grid, items).items()
+                      for v in drc.check_region(grid, cell, region_items))
+
+    one = violations(1)
+
+    assert one
+    assert violations(16) == one
+
+
+def test_sweep():
+
+    items = [
+        # the same net, overlapping
+        _track(0, 1, 0, 0, 1000, 0),
+        _track(1, 1, 500, 0, 1500, 0),
+        # another net, too close to net 1
+        _track(2, 2, 0, 350, 1000, 350),
+        # no net, overlapping each other (but clear of the rest)
+        _track(3, 0, 0, 5000, 1000, 5000),
+        _track(4, 0, 500, 5000, 1500, 5000),
+        # another net, far away
+        _track(5, 3, 0, 9000, 1000, 9000),
+    ]
+
+    violations = [v for region in drc.check_clearances(items)
+                  for v in region]
+
+    assert sorted((v.item_a, v.item_b) for v in violations) == [
+        (0, 2), (1, 2), (3, 4)]
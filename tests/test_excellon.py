@@ -0,0 +1,90 @@
+"""
+Tests for the Excellon reader and drill checks
+"""
+
+import math
+import random
+
+from kiplot import excellon
+
+SAMPLE = b"""M48
+; DRILL file {KiCad 5.1.0} date 2019-01-01
+; FORMAT={-:-/ absolute / metric / decimal}
+FMAT,2
+METRIC
+T1C0.400
+T2C1.000
+T3C3.200
+%
+G90
+G05
+T1
+X10.0Y-10.0
+X10.5Y-10.0
+X20.0Y-10.0
+T2
+X30.0Y-10.0G85X32.0Y-10.0
+T0
+M30
+"""
+
+REPORT = """Drill report for /x/board.kicad_pcb
+
+Drill file 'board.drl' contains
+    plated through holes:
+    =============================================================
+    T1  0,40mm  0,016"  (3 holes)
+    T2  1,00mm  0,039"  (2 holes)  (with 1 slot)
+
+    Total plated holes count 5
+"""
+
+
+def test_read_sample():
+
+    drill = excellon.parse_excellon(SAMPLE)
+
+    assert drill.tool_stats() == [excellon.ToolStats(1, 0.4, 3, 0),
+                                  excellon.ToolStats(2, 1.0, 0, 1),
+                                  excellon.ToolStats(3, 3.2, 0, 0)]
+    assert drill.slots.row(0) == (30.0, -10.0, 32.0, -10.0, 2)
+
+
+def test_inch_zeros():
+
+    # leading zeros kept, 2.4 digits
+    drill = excellon.parse_excellon(b"M48\nINCH,LZ\nT1C0.0100\n%\nT1\n"
+                                    b"X01Y-02\nM30\n")
+
+    assert drill.hits.row(0) == (25.4, -50.8, 1)
+
+
+def test_check_spacing():
+
+    rnd = random.Random(1)
+    points = [(rnd.uniform(0, 50), rnd.uniform(0, 50)) for i in range(2000)]
+
+    found = excellon.check_spacing([(p, p, 0.2) for p in points], 0.1)
+
+    # those closer than 0.4 + 0.1 between centres
+    close = [(a, b) for i, a in enumerate(points) for b in points[i + 1:]
+             if math.hypot(a[0] - b[0], a[1] - b[1]) < 0.5]
+
+    assert found
+    assert [(v.a, v.b) for v in found] == sorted(close)
+
+
+def test_compare_with_report(tmpdir):
+
+    report_file = tmpdir.join('drill.rpt')
+    report_file.write(REPORT)
+
+    report = excellon.read_drill_report(str(report_file))
+
+    assert report['board.drl'][1] == excellon.ToolStats(2, 1.0, 2, 1)
+
+    drill = excellon.parse_excellon(SAMPLE)
+
+    assert excellon.compare_with_report('board.drl', drill,
+                                        report['board.drl']) == [
+        "board.drl: T2 has 1 holes (1 slots), the report has 2 (1)"]
@@ -0,0 +1,89 @@
+"""
+Tests for the Gerber reader
+"""
+
+import pytest
+
+from kiplot import gerber
+
+# as pcbnew writes them, cut down
+SAMPLE = b"""G04 #@! TF.GenerationSoftware,KiCad,Pcbnew,5.1.0*
+G04 #@! TF.FileFunction,Copper,L1,Top*
+%TF.FileFunction,Copper,L1,Top*%
+%FSLAX46Y46*%
+G04 Gerber Fmt 4.6, Leading zero omitted, Abs format (unit mm)*
+%MOMM*%
+%LPD*%
+G01*
+G04 APERTURE LIST*
+%ADD10C,0.200000*%
+%ADD11R,2.000000X2.000000*%
+%ADD12C,1.000000*%
+%AMRoundRect*
+21,1,$1,$2,0,0,0*%
+%ADD13RoundRect,0.250000X1.000000*%
+G04 APERTURE END LIST*
+D10*
+X130000000Y-90000000D02*
+X150000000Y-90000000D01*
+G75*
+G02X150000000Y-110000000I0J-10000000D01*
+D11*
+X140000000Y-100000000D03*
+D12*
+X135000000Y-95000000D03*
+X145000000D03*
+G36*
+X130000000Y-110000000D02*
+G01X131000000Y-110000000D01*
+X131000000Y-111000000D01*
+X130000000Y-110000000D01*
+G37*
+M02*
+"""
+
+
+def test_read_sample():
+
+    gbr = gerber.parse_gerber(SAMPLE)
+
+    assert gbr.file_attributes['.FileFunction'] == ['Copper', 'L1', 'Top']
+
+    assert gbr.find_aperture('R', (2.0, 2.0)) == 11
+    assert gbr.find_aperture('C', (1.0,)) == 12
+    assert gbr.find_aperture('C', (0.5,)) is None
+    assert gbr.apertures[13] == gerber.Aperture('RoundRect',
+                                                ('0.250000', '1.000000'))
+
+    assert gbr.flashes_at(140, -100, aperture=11) == [0]
+    assert gbr.flashes_at(140, -100, aperture=12) == []
+    # the modal y coordinate is kept
+    assert gbr.flashes_at(145, -95) == [2]
+
+    assert gbr.draws.row(0) == (130.0, -90.0, 150.0, -90.0, 10, 1)
+    assert gbr.arcs.row(0)[:7] == (150.0, -90.0, 150.0, -110.0,
+                                   150.0, -100.0, 1)
+
+    assert len(gbr.regions) == 1
+    assert len(gbr.region_points) == 4
+
+    assert gbr.counts() == {10: 2, 11: 1, 12: 2}
+    assert gbr.bbox() == (130.0, -111.0, 150.0, -90.0)
+
+
+def test_inches_are_read_as_mm():
+
+    gbr = gerber.parse_gerber(b"%FSLAX24Y24*%%MOIN*%%ADD10C,0.0100*%"
+                              b"D10*X10000Y-20000D03*M02*")
+
+    assert gbr.find_aperture('C', (0.254,))
+    assert gbr.flashes_at(25.4, -50.8)
+
+
+def test_bad_data():
+
+    with pytest.raises(gerber.GerberError):
+        gerber.parse_gerber(b"X100Y100D03*")
+
+    with pytest.raises(gerber.GerberError):
+        gerber.parse_gerber(b"%FSLAX46Y46*%D10*")
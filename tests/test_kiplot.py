@@ -0,0 +1,111 @@
+"""
+Tests for the Plotter, plotting with the fake pcbnew of the benchmarks
+"""
+
+import importlib
+import io
+import os
+import sys
+
+import pytest
+
+from bench import fake_pcbnew
+
+import kiplot as kiplot_pkg
+from kiplot import config_reader
+
+BOARD = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     'board_samples', 'simple_2layer.kicad_pcb')
+
+CONFIG = u"""kiplot:
+  version: 1
+outputs:
+  - name: gerbers
+    type: gerber
+    dir: {dir}
+    options:
+      exclude_edge_layer: false
+      exclude_pads_from_silkscreen: false
+      use_aux_axis_as_origin: false
+      plot_sheet_reference: false
+      plot_footprint_refs: true
+      plot_footprint_values: true
+      force_plot_invisible_refs_vals: false
+      tent_vias: true
+      check_zone_fills: false
+      line_width: 0.15
+      subtract_mask_from_silk: true
+      use_protel_extensions: false
+      gerber_precision: 4.5
+      create_gerber_job_file: false
+      use_gerber_x2_attributes: true
+      use_gerber_net_attributes: false
+    layers:
+      - layer: F.Cu
+        suffix: F_Cu
+"""
+
+
+@pytest.fixture
+def kiplot(monkeypatch):
+    """
+    The kiplot module, imported afresh with the fake pcbnew
+    """
+
+    monkeypatch.setitem(sys.modules, 'pcbnew', fake_pcbnew)
+    monkeypatch.delitem(sys.modules, 'kiplot.kiplot', raising=False)
+    monkeypatch.delattr(kiplot_pkg, 'kiplot', raising=False)
+
+    module = importlib.import_module('kiplot.kiplot')
+
+    # don't leave the module importing the fake around
+    monkeypatch.delitem(sys.modules, 'kiplot.kiplot')
+
+    return module
+
+
+def _plot(kiplot, outdir, out_subdir='gerber', preflight=u""):
+
+    cfg = config_reader.CfgYamlReader().read(io.StringIO(
+        CONFIG.format(dir=out_subdir) + preflight))
+    cfg.outdir = outdir
+
+    plotter = kiplot.Plotter(cfg)
+    plotter.incremental = True
+    plotter.plot(BOARD)
+
+
+def test_output_dir_change_plots_again(kiplot, tmpdir):
+
+    outdir = str(tmpdir)
+
+    _plot(kiplot, outdir, 'gerber')
+    assert tmpdir.join('gerber', 'simple_2layer-F_Cu.gbr').check()
+
+    _plot(kiplot, outdir, 'fab')
+    assert tmpdir.join('fab', 'simple_2layer-F_Cu.gbr').check()
+
+
+def test_drc_runs_when_up_to_date(kiplot, monkeypatch, tmpdir):
+
+    runs = []
+
+    def run_drc(board, report, jobs):
+        runs.append(report)
+        return violations
+
+    monkeypatch.setattr(kiplot.drc, 'run_drc', run_drc)
+
+    preflight = u"preflight:\n  run_drc: true\n"
+    violations = 0
+
+    _plot(kiplot, str(tmpdir), preflight=preflight)
+    # nothing to plot
+    _plot(kiplot, str(tmpdir), preflight=preflight)
+
+    assert runs == [str(tmpdir.join('drc.rpt'))] * 2
+
+    violations = 1
+
+    with pytest.raises(kiplot.PlotError):
+        _plot(kiplot, str(tmpdir), preflight=preflight)
@@ -0,0 +1,52 @@
+"""
+Tests for the manifest of plotted outputs
+"""
+
+import os
+
+from kiplot import manifest
+
+
+def _plotted(tmpdir):
+
+    tmpdir.join('gerber', 'a.gbr').write('a', ensure=True)
+    tmpdir.join('gerber', 'b.gbr').write('b')
+
+    m = manifest.Manifest(str(tmpdir))
+    m.record('gerbers', 'board', 'fp', [os.path.join('gerber', 'a.gbr'),
+                                        os.path.join('gerber', 'b.gbr')])
+    m.save()
+
+    m = manifest.Manifest(str(tmpdir))
+    m.load()
+
+    return m
+
+
+def test_up_to_date(tmpdir):
+
+    m = _plotted(tmpdir)
+
+    assert m.is_up_to_date('gerbers', 'board', 'fp')
+    assert not m.is_up_to_date('drill', 'board', 'fp')
+
+
+def test_stale_when_inputs_change(tmpdir):
+
+    m = _plotted(tmpdir)
+
+    assert not m.is_up_to_date('gerbers', 'other board', 'fp')
+    assert not m.is_up_to_date('gerbers', 'board', 'other fp')
+
+
+def test_stale_when_files_change(tmpdir):
+
+    m = _plotted(tmpdir)
+    tmpdir.join('gerber', 'a.gbr').write('changed')
+
+    assert not m.is_up_to_date('gerbers', 'board', 'fp')
+
+    m = _plotted(tmpdir)
+    tmpdir.join('gerber', 'b.gbr').remove()
+
+    assert not m.is_up_to_date('gerbers', 'board', 'fp')
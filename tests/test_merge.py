@@ -0,0 +1,136 @@
+"""
+Tests for merging layer files into one document
+"""
+
+import io
+import os
+import zlib
+
+from xml.etree import ElementTree
+
+from kiplot import merge
+
+FONT = b"<< /BaseFont /Helvetica /Type /Font /Subtype /Type1 >>"
+
+
+def _write_pdf(filename, text):
+    """
+    Write a one page PDF, laid out as pcbnew writes them (a shared font
+    dictionary, and a stream whose length is its own object)
+    """
+
+    stream = zlib.compress(b"BT /F1 12 Tf (" + text + b") Tj ET")
+
+    objects = [
+        FONT,
+        b"<< /F1 1 0 R >>",
+        b"<< /Length 4 0 R /Filter /FlateDecode >>\nstream\n" + stream +
+        b"\nendstream",
+        str(len(stream)).encode('ascii'),
+        b"<< /Type /Page /Parent 6 0 R /Resources << /Font 2 0 R >> "
+        b"/MediaBox [0 0 595 842] /Contents 3 0 R >>",
+        b"<< /Type /Pages /Kids [5 0 R] /Count 1 >>",
+        b"<< /Producer (pcbnew \\(5.1\\)) >>",
+        b"<< /Type /Catalog /Pages 6 0 R >>",
+    ]
+
+    data = b"%PDF-1.5\n"
+    offsets = []
+
+    for num, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += "{} 0 obj\n".format(num).encode('ascii') + obj + b"\nendobj\n"
+
+    xref = len(data)
+    data += "xref\n0 {}\n".format(len(objects) + 1).encode('ascii')
+    data += b"0000000000 65535 f \n"
+    data += b"".join("{:010d} 00000 n \n".format(o).encode('ascii')
+                     for o in offsets)
+    data += ("trailer\n<< /Size {} /Root 8 0 R /Info 7 0 R >>\n"
+             "startxref\n{}\n%%EOF\n".format(len(objects) + 1, xref)
+             .encode('ascii'))
+
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+def test_merge_pdfs(tmpdir):
+
+    files = []
+
+    for layer in ['F_Cu', 'B_Cu', 'F_SilkS']:
+        files.append(str(tmpdir.join(layer + '.pdf')))
+        _write_pdf(files[-1], layer.encode('ascii'))
+
+    out_file = str(tmpdir.join('board.pdf'))
+    shared = merge.merge_pdfs(files, out_file)
+
+    with open(out_file, 'rb') as f:
+        merged = merge._SourcePdf(f.read(), out_file)
+
+    pages = merged.pages()
+
+    assert len(pages) == 3
+
+    texts = []
+
+    for ref, page in pages:
+        contents = merged.get(page[b'Contents'])
+        texts.append(zlib.decompress(contents.data).split(b'(')[1][:-7])
+
+    assert texts == [b'F_Cu', b'B_Cu', b'F_SilkS']
+
+    # the font and its resource dictionary are written once
+    assert len(set(page[b'Resources'][b'Font'] for ref, page in pages)) == 1
+    assert shared >= 4
+    assert merged.get(merged.trailer[b'Info'])[b'Producer'] == (
+        b'(pcbnew \\(5.1\\))')
+
+    # smaller than the files it was merged from
+    assert os.path.getsize(out_file) < sum(os.path.getsize(fn)
+                                           for fn in files)
+
+
+def test_merge_svgs(tmpdir):
+
+    files = []
+
+    for layer in ['F_Cu', 'B_Cu']:
+        files.append(str(tmpdir.join(layer + '.svg')))
+        tmpdir.join(layer + '.svg').write(
+            '<?xml version="1.0" standalone="no"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" width="10cm" '
+            'height="5cm" viewBox="0 0 100 50">\n'
+            '<path d="M0 0L{} 10"/>\n</svg>\n'.format(len(files)))
+
+    out_file = str(tmpdir.join('board.svg'))
+    merge.merge_svgs(files, out_file, ['F.Cu', 'B.Cu'])
+
+    text = tmpdir.join('board.svg').read()
+
+    assert text.count('<svg') == 1
+    assert text.count('</svg>') == 1
+    assert 'inkscape:label="F.Cu"><path d="M0 0L1 10"/>' in text.replace(
+        '\n', '')
+    assert 'inkscape:label="B.Cu"><path d="M0 0L2 10"/>' in text.replace(
+        '\n', '')
+
+
+def test_merge_svgs_labels_escaped(tmpdir):
+
+    svg_file = tmpdir.join('F_Cu.svg')
+    svg_file.write_binary(
+        u'<svg xmlns="http://www.w3.org/2000/svg" width="10cm" '
+        u'height="5cm">\n<text>\u00b5</text>\n</svg>\n'.encode('utf-8'))
+
+    out_file = str(tmpdir.join('board.svg'))
+    merge.merge_svgs([str(svg_file)], out_file, [u'<F&B> "\u00b5"'])
+
+    with io.open(out_file, encoding='utf-8') as f:
+        root = ElementTree.fromstring(f.read().encode('utf-8'))
+
+    group = root.find('{http://www.w3.org/2000/svg}g')
+    label = group.get('{http://www.inkscape.org/namespaces/inkscape}label')
+
+    assert label == u'<F&B> "\u00b5"'
+    assert group.find('{http://www.w3.org/2000/svg}text').text == u'\u00b5'
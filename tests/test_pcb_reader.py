@@ -0,0 +1,36 @@
+"""
+Tests for the streaming board reader (which doesn't need pcbnew)
+"""
+
+import os
+
+from kiplot import pcb_reader
+
+
+BOARD = os.path.join(os.path.dirname(__file__), 'board_samples',
+                     'simple_2layer.kicad_pcb')
+
+
+def test_board_info():
+
+    info = pcb_reader.read_board_info(BOARD)
+
+    assert info.version == 20171130
+    assert info.copper_layers == 2
+    assert info.layer_names()[:2] == ['F.Cu', 'B.Cu']
+    assert info.aux_origin == (0.0, 0.0)
+    assert info.net_classes['Default']['clearance'] == 0.2
+
+
+def test_board_info_stops_at_the_first_footprint(tmpdir):
+
+    with open(BOARD) as f:
+        text = f.read()
+
+    # cut the board off inside its first footprint
+    brd_file = tmpdir.join('cut.kicad_pcb')
+    brd_file.write(text[:text.index('\n  (module') + 20])
+
+    info = pcb_reader.read_board_info(str(brd_file))
+
+    assert info.copper_layers == 2
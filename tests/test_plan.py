@@ -0,0 +1,96 @@
+"""
+Tests for plot plans (which don't need pcbnew)
+"""
+
+import io
+import os
+
+from kiplot import config_reader
+from kiplot import plan
+
+
+BOARD = os.path.join(os.path.dirname(__file__), 'board_samples',
+                     'simple_2layer.kicad_pcb')
+
+CONFIG = u"""
+kiplot:
+  version: 1
+
+outputs:
+  - name: gerbers
+    type: gerber
+    dir: gerber
+    options:
+      exclude_edge_layer: false
+      exclude_pads_from_silkscreen: false
+      use_aux_axis_as_origin: false
+      plot_sheet_reference: false
+      plot_footprint_refs: true
+      plot_footprint_values: true
+      force_plot_invisible_refs_vals: false
+      tent_vias: true
+      check_zone_fills: false
+      line_width: 0.15
+      subtract_mask_from_silk: true
+      use_protel_extensions: true
+      gerber_precision: 4.6
+      create_gerber_job_file: false
+      use_gerber_x2_attributes: true
+      use_gerber_net_attributes: false
+    layers:
+      - layer: F.Cu
+        suffix: F_Cu
+      - layer: Edge.Cuts
+        suffix: "Edge.Cuts "
+
+  - name: drill
+    type: gerb_drill
+    dir: gerber
+    options:
+      use_aux_axis_as_origin: false
+      map:
+        type: svg
+
+  - name: fab docs
+    type: pdf
+    dir: docs
+    options:
+      exclude_edge_layer: false
+      exclude_pads_from_silkscreen: false
+      plot_sheet_reference: false
+      plot_footprint_refs: true
+      plot_footprint_values: true
+      force_plot_invisible_refs_vals: false
+      tent_vias: true
+      check_zone_fills: false
+      line_width: 0.15
+      drill_marks: small
+      mirror_plot: false
+      negative_plot: false
+      single_file: true
+    layers:
+      - layer: F.Cu
+        suffix: F_Cu
+      - layer: F.SilkS
+        suffix: F_SilkS
+"""
+
+
+def test_plan_file_names(tmpdir):
+
+    cfg = config_reader.CfgYamlReader().read(io.StringIO(CONFIG))
+    cfg.outdir = str(tmpdir)
+
+    gerbers, drill, docs = plan.plan_board(cfg, BOARD)
+
+    assert gerbers.files == ['gerber/simple_2layer-F_Cu.gtl',
+                             'gerber/simple_2layer-Edge_Cuts.gm1']
+    assert drill.files == ['gerber/simple_2layer-PTH-drl.gbr',
+                           'gerber/simple_2layer-NPTH-drl.gbr',
+                           'gerber/simple_2layer-PTH-drl-drl_map.svg',
+                           'gerber/simple_2layer-NPTH-drl-drl_map.svg']
+    # the layers merged into one file, named after the output
+    assert docs.files == ['docs/simple_2layer-fab docs.pdf']
+
+    assert gerbers.missing == gerbers.files
+    assert gerbers.seconds is None
@@ -5,6 +5,8 @@ import tempfile
 import logging
 import pytest
 
+# these tests plot with the real pcbnew
+pytest.importorskip('pcbnew')
 
 from kiplot import kiplot
 from kiplot import config_reader
@@ -5,10 +5,10 @@ Tests of simple 2-layer PCBs
 from . import plotting_test_utils
 
 import os
-import mmap
-import re
 import logging
 
+from kiplot import gerber
+
 
 def expect_file_at(filename):
 
@@ -19,29 +19,18 @@ def get_gerber_filename(board_name, layer_slug, ext='.gbr'):
     return board_name + '-' + layer_slug + ext
 
 
-def find_gerber_aperture(s, ap_desc):
-
-    m = re.search(r'%AD(.*)' + ap_desc + r'\*%', s)
-
-    if not m:
-        return None
-
-    return m.group(1)
-
-
-def expect_gerber_has_apertures(gbr_data, ap_list):
+def expect_gerber_has_apertures(gbr, ap_list):
 
     aps = []
 
-    for ap in ap_list:
+    for template, params in ap_list:
 
-        # find the circular aperture for the outline
-        ap_no = find_gerber_aperture(gbr_data, ap)
+        ap_no = gbr.find_aperture(template, params)
 
         assert ap_no is not None
 
         # apertures from D10 to D999
-        assert len(ap_no) in [2, 3]
+        assert 10 <= ap_no <= 999
 
         aps.append(ap_no)
 
@@ -49,28 +38,14 @@ def expect_gerber_has_apertures(gbr_data, ap_list):
     return aps
 
 
-def expect_gerber_flash_at(gbr_data, pos):
+def expect_gerber_flash_at(gbr, pos, ap_no=None):
     """
-    Check for a gerber flash at a given point
-    (it's hard to check that aperture is right without a real gerber parser
+    Check for a gerber flash (with a given aperture) at a given point
     """
 
-    repat = r'^X{x}Y{y}D03\*$'.format(
-        x=int(pos[0] * 100000),
-        y=int(pos[1] * 100000)
-    )
-
-    m = re.search(repat, gbr_data, re.MULTILINE)
-
-    assert(m)
-
-    logging.debug("Gerber flash found: " + repat)
-
-
-def get_mmapped_data(filename):
+    assert gbr.flashes_at(pos[0], pos[1], aperture=ap_no)
 
-    with open(filename) as fo:
-        return mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+    logging.debug("Gerber flash found at {}".format(pos))
 
 
 # content of test_sample.py
@@ -90,14 +65,14 @@ def test_2layer():
 
     expect_file_at(f_cu_gbr)
 
-    f_cu_data = get_mmapped_data(f_cu_gbr)
+    f_cu = gerber.read_gerber(f_cu_gbr)
 
-    ap_ids = expect_gerber_has_apertures(f_cu_data, [
-        "C,0.200000",
-        "R,2.000000X2.000000",
-        "C,1.000000"])
+    ap_ids = expect_gerber_has_apertures(f_cu, [
+        ('C', (0.2,)),
+        ('R', (2.0, 2.0)),
+        ('C', (1.0,))])
 
     # expect a flash for the square pad
-    expect_gerber_flash_at(f_cu_data, (140, -100))
+    expect_gerber_flash_at(f_cu, (140, -100), ap_ids[1])
 
     ctx.clean_up()
@@ -0,0 +1,86 @@
+"""
+Tests for the rendering of previews
+"""
+
+import struct
+import zlib
+
+from kiplot import gerber
+from kiplot import preview
+
+# a 2x1mm rect flashed at (1, 1), and a clear 0.5mm circle at its centre
+SAMPLE = b"""G04 #@! TF.CreationDate,2019-01-01T00:00:00*
+%TF.GenerationSoftware,KiCad,Pcbnew,5.1.0*%
+%FSLAX46Y46*%
+%MOMM*%
+%ADD10R,2.000000X1.000000*%
+%ADD11C,0.500000*%
+D10*
+X1000000Y1000000D03*
+%LPC*%
+D11*
+X1000000Y1000000D03*
+M02*
+"""
+
+# 4x2mm, at 254 dpi (10 pixels per mm)
+FRAME = (0.0, 0.0, 4.0, 2.0)
+DPI = 254
+
+
+def test_render():
+
+    raster = preview.render_gerber(gerber.parse_gerber(SAMPLE), FRAME, DPI)
+
+    assert (raster.width, raster.height) == (40, 20)
+
+    def pixel(x, y):
+        return raster.pixels[y * raster.width + x]
+
+    # the rect covers x 0-2mm, y 0.5-1.5mm (rows go down)
+    assert pixel(2, 10) == preview.DARK
+    assert pixel(18, 6) == preview.DARK
+    assert pixel(25, 10) == preview.BACKGROUND
+    assert pixel(2, 2) == preview.BACKGROUND
+    # the clear circle is drawn over it
+    assert pixel(10, 10) == preview.BACKGROUND
+
+
+def test_png():
+
+    raster = preview.Raster(3, 2)
+    raster.fill_span(1, 0, 3, preview.DARK)
+
+    png = raster.encode_png()
+
+    assert png.startswith(b'\x89PNG\r\n\x1a\n')
+    assert struct.unpack('>II', png[16:24]) == (3, 2)
+
+    # one IDAT chunk, after the header
+    size = struct.unpack('>I', png[33:37])[0]
+    assert png[37:41] == b'IDAT'
+    assert zlib.decompress(png[41:41 + size]) == (b'\x00\xff\xff\xff'
+                                                   b'\x00\x00\x00\x00')
+
+
+def test_tiles():
+
+    raster = preview.Raster(5, 3)
+
+    tiles = preview.tile_images(raster, 2)
+
+    assert [name for name, png in tiles] == [
+        '-r0c0', '-r0c1', '-r0c2', '-r1c0', '-r1c1', '-r1c2']
+    # the last column and row are cut short
+    assert struct.unpack('>II', tiles[-1][1][16:24]) == (1, 1)
+
+    assert [name for name, png in preview.tile_images(raster)] == ['']
+
+
+def test_drawn_digest():
+
+    replotted = SAMPLE.replace(b'2019-01-01', b'2020-02-02')
+    changed = SAMPLE.replace(b'X1000000Y1000000D03', b'X1500000Y1000000D03')
+
+    assert preview.drawn_digest(replotted) == preview.drawn_digest(SAMPLE)
+    assert preview.drawn_digest(changed) != preview.drawn_digest(SAMPLE)
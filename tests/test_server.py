@@ -0,0 +1,74 @@
+"""
+Tests for the plot server's protocol, with the client (without plotting,
+so without pcbnew)
+"""
+
+import os
+import threading
+
+import pytest
+
+from kiplot import client
+from kiplot import server
+
+
+@pytest.fixture
+def socket_path(tmpdir):
+
+    # Unix socket paths are short: tmpdir might be too long
+    path = str(tmpdir.join('s'))
+
+    if len(path) > 100:
+        pytest.skip("temp dir path too long for a Unix socket")
+
+    plot_server = server.PlotServer(path, 1)
+
+    thread = threading.Thread(target=plot_server.serve)
+    thread.daemon = True
+    thread.start()
+
+    yield path
+
+    try:
+        client.send_request(path, {'command': 'shutdown'})
+    except client.ClientError:
+        # the test shut it down
+        pass
+
+    thread.join(10)
+
+
+def test_requests(socket_path):
+
+    assert client.send_request(socket_path, {'command': 'foo'}) == {
+        'ok': False, 'error': "Unknown command: foo"}
+
+    # errors in a plot request are found before anything is plotted
+    response = client.send_request(socket_path, {'board': 'a.kicad_pcb'})
+    assert not response['ok']
+    assert 'outdir' in response['error']
+
+    response = client.send_request(socket_path, {
+        'board': 'a.kicad_pcb', 'outdir': 'out',
+        'config_text': u"kiplot:\n  version: 1\noutputs:\n  - name: x\n"})
+    assert not response['ok']
+    assert response['error'].startswith("Invalid config:")
+
+    assert client.send_request(socket_path, {'command': 'shutdown'}) == {
+        'ok': True}
+
+
+def test_socket_removed_on_shutdown(socket_path):
+
+    client.send_request(socket_path, {'command': 'shutdown'})
+
+    # the server may still be closing
+    for i in range(100):
+        if not os.path.exists(socket_path):
+            break
+        threading.Event().wait(0.05)
+
+    assert not os.path.exists(socket_path)
+
+    with pytest.raises(client.ClientError):
+        client.send_request(socket_path, {'command': 'shutdown'})
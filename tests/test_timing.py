@@ -0,0 +1,105 @@
+"""
+Tests for the timing of plot phases
+"""
+
+import io
+import json
+
+from kiplot import timing
+
+
+def _profiler():
+
+    profiler = timing.Profiler()
+    profiler.reset(True)
+
+    with profiler.span('plot', output='gerbers'):
+        for layer in ['F.Cu', 'B.Cu']:
+            with profiler.span('plot layer', layer=layer):
+                pass
+
+    with profiler.span('plot layer', layer='F.Cu'):
+        pass
+
+    return profiler
+
+
+def test_nested_spans():
+
+    spans = _profiler().spans
+
+    # in the order they end, so the enclosing span comes after its parts
+    assert [s.label for s in spans] == [
+        'plot layer (F.Cu)', 'plot layer (B.Cu)', 'plot (gerbers)',
+        'plot layer (F.Cu)']
+
+    assert spans[2].start <= spans[0].start
+    assert spans[2].duration >= spans[0].duration + spans[1].duration
+
+
+def test_disabled():
+
+    profiler = timing.Profiler()
+
+    with profiler.span('plot'):
+        pass
+
+    assert profiler.spans == []
+
+
+def test_summary():
+
+    profiler = _profiler()
+
+    lines = profiler.format_summary().split("\n")
+
+    assert lines[0].split() == ['Phase', 'Count', 'Total', '(s)', 'Max',
+                                '(s)']
+    # a row for each label, counting the spans with it
+    rows = [l.rsplit(None, 3) for l in lines[1:]]
+
+    assert sorted((label.strip(), count) for label, count, total, longest
+                  in rows) == [
+        ('plot (gerbers)', '1'),
+        ('plot layer (B.Cu)', '1'),
+        ('plot layer (F.Cu)', '2'),
+    ]
+
+    # slowest first
+    totals = [float(total) for label, count, total, longest in rows]
+    assert totals == sorted(totals, reverse=True)
+
+
+def test_chrome_trace():
+
+    profiler = _profiler()
+
+    f = io.StringIO()
+    profiler.write_chrome_trace(f)
+    trace = json.loads(f.getvalue())
+
+    events = trace['traceEvents']
+
+    assert len(events) == 4
+
+    for event, s in zip(events, profiler.spans):
+        assert event['ph'] == 'X'
+        assert event['name'] == s.name
+        assert event['args'] == s.args
+        assert event['pid'] == event['tid'] == s.pid
+        # in microseconds
+        assert event['ts'] == s.start * 1e6
+        assert event['dur'] == s.duration * 1e6
+
+
+def test_spans_from_workers():
+
+    worker = _profiler()
+    spans = worker.take_spans()
+
+    assert worker.spans == []
+
+    profiler = timing.Profiler()
+    profiler.add_spans(json.loads(json.dumps(spans)))
+
+    assert [s.to_dict() for s in profiler.spans] == spans
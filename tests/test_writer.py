@@ -0,0 +1,113 @@
+"""
+Tests for the background writer of plotted files
+"""
+
+import errno
+import os
+
+import pytest
+
+from kiplot import writer
+
+
+def _stage(tmpdir, name, files):
+
+    stage = tmpdir.mkdir(name)
+
+    for fn in files:
+        stage.join(fn).write(fn, ensure=True)
+
+    return str(stage)
+
+
+def test_files_moved_and_stage_removed(tmpdir):
+
+    out = str(tmpdir.join('out'))
+
+    w = writer.OutputWriter()
+    w.start()
+
+    w.commit(1, _stage(tmpdir, 's1', ['a.gbr', 'sub/b.gbr']), out,
+             ['a.gbr', os.path.join('sub', 'b.gbr')])
+    w.commit(2, _stage(tmpdir, 's2', ['c.drl']), out, ['c.drl'])
+
+    assert sorted(w.take_done() + w.finish()) == [1, 2]
+
+    assert sorted(os.listdir(str(tmpdir))) == ['out']
+    assert open(os.path.join(out, 'sub', 'b.gbr')).read() == 'sub/b.gbr'
+    assert not [fn for fn in os.listdir(out)
+                if fn.endswith(writer.TMP_SUFFIX)]
+
+
+def test_failure_raised_on_finish(tmpdir):
+
+    w = writer.OutputWriter()
+    w.start()
+
+    # the file isn't there to move
+    w.commit(1, str(tmpdir.mkdir('s1')), str(tmpdir.join('out')),
+             ['missing.gbr'])
+
+    with pytest.raises(writer.WriterError):
+        w.finish()
+
+
+def test_files_synced_before_rename(tmpdir, monkeypatch):
+
+    events = []
+    rename = os.rename
+
+    def fake_fsync_file(path):
+        events.append(('sync', os.path.basename(path)))
+
+    def fake_rename(src, dest):
+
+        # as if the stage and output dirs were on different filesystems
+        if not src.endswith(writer.TMP_SUFFIX):
+            raise OSError(errno.EXDEV, "cross-device link")
+
+        events.append(('rename', os.path.basename(src)))
+        rename(src, dest)
+
+    monkeypatch.setattr(writer, '_fsync_file', fake_fsync_file)
+    monkeypatch.setattr(os, 'rename', fake_rename)
+
+    out = str(tmpdir.mkdir('out'))
+
+    w = writer.OutputWriter()
+    w.start()
+    w.commit(1, _stage(tmpdir, 's1', ['a.gbr']), out, ['a.gbr'])
+    w.finish()
+
+    tmp_name = 'a.gbr' + writer.TMP_SUFFIX
+
+    assert events[-2:] == [('sync', tmp_name), ('rename', tmp_name)]
+    assert open(os.path.join(out, 'a.gbr')).read() == 'a.gbr'
+
+
+def test_files_synced_together(tmpdir, monkeypatch):
+
+    events = []
+    rename = os.rename
+
+    def fake_fsync_file(path):
+        events.append(('sync', os.path.basename(path)))
+
+    def fake_rename(src, dest):
+        events.append(('rename', os.path.basename(src)))
+        rename(src, dest)
+
+    monkeypatch.setattr(writer, '_fsync_file', fake_fsync_file)
+    monkeypatch.setattr(os, 'rename', fake_rename)
+
+    out = str(tmpdir.mkdir('out'))
+
+    w = writer.OutputWriter()
+    w.start()
+    w.commit(1, _stage(tmpdir, 's1', ['a.gbr', 'b.gbr']), out,
+             ['a.gbr', 'b.gbr'])
+    w.finish()
+
+    # all synced, then all renamed
+    assert events == [('sync', 'a.gbr'), ('sync', 'b.gbr'),
+                      ('rename', 'a.gbr'), ('rename', 'b.gbr')]
@@ -2,7 +2,323 @@
 Tests for the YAML parser
 """
 
+import io
+import subprocess
+import sys
+
+import pytest
+
+from kiplot import cache
+from kiplot import config_reader
+from kiplot import kicad_defs
+from kiplot import plot_config as PC
+
 
 # content of test_sample.py
 def test_numbers_3_4():
     assert 12 == 12
+
+
+def test_config_reader_does_not_need_pcbnew():
+
+    # in a fresh interpreter, as other tests might have imported pcbnew
+    subprocess.check_call([
+        sys.executable, '-c',
+        'import sys; import kiplot.config_reader; '
+        'assert "pcbnew" not in sys.modules'])
+
+
+def test_named_layers():
+
+    cr = config_reader.CfgYamlReader()
+
+    layer = cr._get_layer_from_str('F.Cu')
+    assert layer.layer == kicad_defs.F_Cu
+    assert not layer.is_inner
+
+    assert cr._get_layer_from_str('Edge.Cuts').layer == kicad_defs.Edge_Cuts
+
+
+def test_inner_layers():
+
+    cr = config_reader.CfgYamlReader()
+
+    layer = cr._get_layer_from_str('Inner.3')
+    assert layer.layer == 3
+    assert layer.is_inner
+
+    with pytest.raises(config_reader.YamlError):
+        cr._get_layer_from_str('Inner.X')
+
+    with pytest.raises(config_reader.YamlError):
+        cr._get_layer_from_str('Top.Cu')
+
+
+def test_drill_map_type():
+
+    cr = config_reader.CfgYamlReader()
+
+    mo = cr._parse_drill_map({'type': 'pdf'})
+    assert mo.type == kicad_defs.PLOT_FORMAT_PDF
+
+    with pytest.raises(config_reader.YamlError):
+        cr._parse_drill_map({'type': 'png'})
+
+
+def test_layer_options_units():
+
+    cr = config_reader.CfgYamlReader()
+
+    po = cr._parse_out_opts('svg', {
+        'exclude_edge_layer': False,
+        'exclude_pads_from_silkscreen': False,
+        'plot_sheet_reference': False,
+        'plot_footprint_refs': True,
+        'plot_footprint_values': True,
+        'force_plot_invisible_refs_vals': False,
+        'tent_vias': True,
+        'check_zone_fills': False,
+        'line_width': 0.15,
+        'mirror_plot': False,
+        'negative_plot': False,
+        'drill_marks': 'small',
+    })
+
+    assert po.type == PC.OutputOptions.SVG
+    assert po.type_options.line_width == 150000
+    assert po.type_options.drill_marks == kicad_defs.SMALL_DRILL_SHAPE
+
+
+def test_archive_outputs():
+
+    cr = config_reader.CfgYamlReader()
+
+    cfg = PC.PlotConfig()
+
+    po = cr._parse_out_opts('archive', {
+        'format': 'tar.gz',
+        'filename': 'fab.tar.gz',
+        'outputs': ['gerbers', 'missing'],
+    })
+    assert po.type_options.compression_level == 6
+
+    cfg.add_output(PC.PlotOutput('gerbers', None, 'gerber',
+                                 PC.OutputOptions('gerber')))
+    cfg.add_output(PC.PlotOutput('fab', None, 'archive', po))
+
+    assert cfg.validate() == ["Archive fab has unknown output: missing"]
+
+
+def test_all_errors_reported_with_positions():
+
+    cfg_text = u"""kiplot:
+  version: 1
+outputs:
+  - name: drill
+    type: excellon
+    dir: gerber
+    options:
+      metric_units: 1
+      pth_and_npth_single_file: false
+      minimal_header: false
+      mirror_y_axis: false
+      map:
+        type: png
+  - name: bad
+    type: foo
+    dir: x
+"""
+
+    with pytest.raises(config_reader.YamlError) as e:
+        config_reader.CfgYamlReader().read(io.StringIO(cfg_text))
+
+    assert e.value.errors == [
+        "<file>:8:7: Value is needed for use_aux_axis_as_origin",
+        "<file>:8:7: Bad value for metric_units: expected true or false, "
+        "got 1",
+        "<file>:13:9: Unknown drill map type: png",
+        "<file>:15:5: Unknown output type: foo",
+    ]
+
+
+def test_config_cache(tmpdir):
+
+    cfg_file = tmpdir.join('test.kiplot.yaml')
+    cfg_file.write(u"""kiplot:
+  version: 1
+outputs:
+  - name: drill
+    type: gerb_drill
+    dir: gerber
+    options:
+      use_aux_axis_as_origin: true
+""")
+
+    config_cache = cache.ConfigCache(str(tmpdir.join('cache')))
+
+    cfg = config_reader.read_file(str(cfg_file), config_cache)
+    cached = config_reader.read_file(str(cfg_file), config_cache)
+
+    assert cached is not cfg
+    assert cached.outputs[0].fingerprint() == cfg.outputs[0].fingerprint()
+    assert len(tmpdir.join('cache', 'configs').listdir()) == 1
+
+
+def test_includes_and_templates(tmpdir):
+
+    tmpdir.join('shared.kiplot.yaml').write(u"""templates:
+  drill:
+    type: excellon
+    dir: ${dir}
+    options:
+      metric_units: true
+      pth_and_npth_single_file: false
+      use_aux_axis_as_origin: false
+      minimal_header: false
+      mirror_y_axis: $mirror
+""")
+
+    cfg_file = tmpdir.join('test.kiplot.yaml')
+    cfg_file.write(u"""kiplot:
+  version: 1
+include: shared.kiplot.yaml
+outputs:
+  - name: plain
+    template: drill
+    params: {dir: gerber, mirror: false}
+  - name: mirrored
+    template: drill
+    params: {dir: mirror, mirror: true}
+    options:
+      metric_units: false
+""")
+
+    cfg = config_reader.read_file(str(cfg_file))
+
+    plain, mirrored = cfg.outputs
+
+    assert plain.outdir == 'gerber'
+    assert plain.options.type_options.mirror_y_axis is False
+    assert plain.options.type_options.metric_units is True
+
+    assert mirrored.outdir == 'mirror'
+    assert mirrored.options.type_options.mirror_y_axis is True
+    assert mirrored.options.type_options.metric_units is False
+
+
+def test_single_file_needs_layers():
+
+    cfg_text = u"""kiplot:
+  version: 1
+outputs:
+  - name: svg
+    type: svg
+    dir: svg
+    options:
+      single_file: true
+    layers: []
+"""
+
+    with pytest.raises(config_reader.YamlError) as e:
+        config_reader.CfgYamlReader().read(io.StringIO(cfg_text))
+
+    assert "<file>:7:5: A single_file output needs layers to merge" in \
+        e.value.errors
+
+
+def test_duplicate_output_names():
+
+    cfg_text = u"""kiplot:
+  version: 1
+outputs:
+  - name: drill
+    type: gerb_drill
+    dir: gerber
+    options:
+      use_aux_axis_as_origin: true
+  - name: drill
+    type: gerb_drill
+    dir: other
+    options:
+      use_aux_axis_as_origin: false
+"""
+
+    with pytest.raises(config_reader.YamlError) as e:
+        config_reader.CfgYamlReader().read(io.StringIO(cfg_text))
+
+    assert e.value.errors == ["<file>:9:5: Duplicate output name: drill"]
+
+
+def test_layer_suffix_and_description_are_strings():
+
+    cfg_text = u"""kiplot:
+  version: 1
+outputs:
+  - name: gerbers
+    type: gerber
+    dir: gerber
+    options: {}
+    layers:
+      - layer: F.Cu
+        suffix: [F, Cu]
+        description: 1
+"""
+
+    with pytest.raises(config_reader.YamlError) as e:
+        config_reader.CfgYamlReader().read(io.StringIO(cfg_text))
+
+    assert "<file>:10:9: Bad value for suffix: expected a string, got " \
+        "['F', 'Cu']" in e.value.errors
+    assert "<file>:11:9: Bad value for description: expected a string, " \
+        "got 1" in e.value.errors
+
+
+def test_preview_options_default():
+
+    cr = config_reader.CfgYamlReader()
+
+    po = cr._parse_out_opts('preview', {'dpi': 150})
+
+    assert not cr._errors
+    assert po.type_options.dpi == 150
+    assert po.type_options.plot_footprint_refs is True
+    assert po.type_options.line_width == 100000
+
+    # the Gerber options can still be given
+    po = cr._parse_out_opts('preview', {'plot_footprint_refs': False})
+
+    assert not cr._errors
+    assert po.type_options.plot_footprint_refs is False
+
+
+def test_unknown_options_and_bad_names():
+
+    cfg_text = u"""kiplot:
+  version: 1
+outputs:
+  - name: drill
+    type: gerb_drill
+    dir: gerber
+    options:
+      use_aux_axis_as_origin: true
+      mirror_y_axis: true
+  - name: 2
+    type: gerb_drill
+    dir: gerber
+    options:
+      use_aux_axis_as_origin: true
+  - name: other
+    type: gerb_drill
+    dir: [gerber]
+    options:
+      use_aux_axis_as_origin: true
+"""
+
+    with pytest.raises(config_reader.YamlError) as e:
+        config_reader.CfgYamlReader().read(io.StringIO(cfg_text))
+
+    assert e.value.errors == [
+        "<file>:9:7: Unknown option for a gerb_drill output: mirror_y_axis",
+        "<file>:10:5: Bad value for name: expected a string, got 2",
+        "<file>:17:5: Bad value for dir: expected a string, got ['gerber']",
+    ]
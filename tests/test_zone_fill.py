@@ -0,0 +1,114 @@
+"""
+Tests for zone filling and its cache (with the fake pcbnew of the
+benchmarks)
+"""
+
+import logging
+import os
+import re
+import sys
+
+from bench import fake_pcbnew
+
+from kiplot import cache
+from kiplot import zone_fill
+
+BOARD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'board_samples', 'simple_2layer.kicad_pcb')
+
+
+def _square(x, size=1000):
+    return [(x, 0), (x + size, 0), (x + size, size), (x, size)]
+
+
+def _board(c_size=1000):
+
+    board = fake_pcbnew.LoadBoard(BOARD_FILE)
+
+    board.AddArea(fake_pcbnew.ZONE_CONTAINER('GND', fake_pcbnew.F_Cu,
+                                             _square(0)))
+    board.AddArea(fake_pcbnew.ZONE_CONTAINER('VCC', fake_pcbnew.F_Cu,
+                                             _square(2000)))
+    board.AddArea(fake_pcbnew.ZONE_CONTAINER('GND', fake_pcbnew.B_Cu,
+                                             _square(0, c_size)))
+
+    return board
+
+
+def test_zone_keys(monkeypatch):
+
+    monkeypatch.setitem(sys.modules, 'pcbnew', fake_pcbnew)
+
+    def keys(board, brd_digest='board'):
+        return zone_fill._zone_keys(board, zone_fill._get_zones(board),
+                                    brd_digest)
+
+    a = keys(_board())
+
+    assert len(set(a)) == 3
+    assert keys(_board()) == a
+
+    # a zone's key depends on the zones on its layer, not on other layers
+    b = keys(_board(c_size=500))
+    assert b[:2] == a[:2]
+    assert b[2] != a[2]
+
+    # and on the rest of the board
+    assert not set(keys(_board(), 'other board')) & set(a)
+
+
+def test_fill_from_cache(monkeypatch, tmpdir):
+
+    monkeypatch.setitem(sys.modules, 'pcbnew', fake_pcbnew)
+    monkeypatch.setattr(fake_pcbnew.ZONE_FILLER, 'fills', [])
+
+    zone_cache = cache.ZoneFillCache(str(tmpdir))
+
+    # nothing cached: the zones are filled together
+    zone_fill.fill_zones(_board(), zone_cache)
+    assert fake_pcbnew.ZONE_FILLER.fills == [3]
+
+    # all cached
+    board = _board()
+    zone_fill.fill_zones(board, zone_cache)
+    assert fake_pcbnew.ZONE_FILLER.fills == [3]
+    assert zone_fill._poly_set_to_list(
+        board.GetArea(0).GetFilledPolysList()) == [(_square(0), [])]
+
+    # one zone changed
+    zone_fill.fill_zones(_board(c_size=500), zone_cache)
+    assert fake_pcbnew.ZONE_FILLER.fills == [3, 1]
+
+    # and without a cache, all are filled
+    zone_fill.fill_zones(_board())
+    assert fake_pcbnew.ZONE_FILLER.fills == [3, 1, 3]
+
+
+def test_fill_times_reported(monkeypatch, caplog):
+
+    monkeypatch.setitem(sys.modules, 'pcbnew', fake_pcbnew)
+    monkeypatch.setattr(fake_pcbnew.ZONE_FILLER, 'fills', [])
+    caplog.set_level(logging.DEBUG)
+
+    # filled together: each zone is reported, but not timed
+    zone_fill.fill_zones(_board())
+    assert fake_pcbnew.ZONE_FILLER.fills == [3]
+    assert "Filled zone VCC on 0 (priority 0) (in a pass of 3 zones)" in \
+        caplog.messages
+
+    caplog.clear()
+
+    # one at a time, timed
+    zone_fill.fill_zones(_board(), per_zone=True)
+    assert fake_pcbnew.ZONE_FILLER.fills == [3, 1, 1, 1]
+
+    timed = [m for m in caplog.messages
+             if re.match(r'Filled zone .* in \d+\.\d{3}s$', m)]
+    assert len(timed) == 3
+    assert any(m.startswith("Filled zone GND on 31 (priority 0) in ")
+               for m in timed)
+
+    # and the slowest listed
+    slowest = [m for m in caplog.messages
+               if re.match(r'  \d+\.\d{3}s: ', m)]
+    assert len(slowest) == 3